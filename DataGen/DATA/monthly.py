@@ -0,0 +1,141 @@
+import argparse, hashlib, json, os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+
+try:
+    from statsmodels.tsa.stattools import adfuller
+except ImportError:
+    adfuller = None
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+# Fitted models are kept here, named by series and workbook content
+CACHE = '.monthlycache'
+
+# workbook and value column of every series
+SERIES = {'solar': ('Solar2013_2023.xlsx', 'electricity'),
+          'wind': ('Wind2013_2023.xlsx', 'electricity'),
+          'electricity': ('Electricity2013_2023.xlsx', 'PTF (USD/MWh)')}
+TEST = '2021-01-01'
+
+
+def digest(filename):
+    sha = hashlib.sha1()
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def acf(x, lags):
+    x = x - x.mean()
+    return np.array([1.0] + [np.dot(x[:-k], x[k:]) / np.dot(x, x) for k in range(1, lags + 1)])
+
+
+def fit(filename, column, test=TEST):
+    """ The notebook's analysis of one series: monthly means, a linear
+    model on one-hot months fitted before test and scored after it, the
+    ADF test and ACF of the monthly series, and the factor of every month
+    of every year relative to the mean """
+
+    df = pd.read_excel(filename)
+    stamps = pd.DatetimeIndex(df.iloc[:, 0])
+    monthly = pd.Series(df[column].to_numpy(dtype=float), index=stamps).resample('MS').mean().dropna()
+
+    month = monthly.index.month.to_numpy() - 1
+    onehot = np.eye(12)[month]
+    train = monthly.index < test
+    coef = np.linalg.lstsq(onehot[train], monthly.to_numpy()[train], rcond=None)[0]
+    prediction = onehot[~train] @ coef
+    actual = monthly.to_numpy()[~train]
+    mse = float(np.mean((actual - prediction)**2))
+    r2 = float(1 - np.sum((actual - prediction)**2) / np.sum((actual - actual.mean())**2))
+
+    # factor of every (year, month) relative to the long-run mean
+    mean = monthly.mean()
+    table = (monthly / mean).to_frame('factor')
+    table['year'], table['month'] = monthly.index.year, month
+    observed = table.pivot_table(index='year', columns='month', values='factor').reindex(columns=range(12))
+
+    stats = {'mean': float(mean), 'mse': mse, 'r2': r2, 'acf': acf(monthly.to_numpy(), 12).tolist()}
+    if adfuller is not None:
+        result = adfuller(monthly.to_numpy())
+        stats['adf'] = {'statistic': float(result[0]), 'pvalue': float(result[1])}
+
+    return {'coef': coef, 'factors': coef / monthly.to_numpy()[train].mean(), 'observed': observed.to_numpy(),
+            'years': observed.index.to_numpy()}, stats
+
+
+def _fit(name, filename, column, cache):
+    """Fits one series unless a fit of the same workbook content is stored"""
+
+    stored = os.path.join(cache, '%s-%s.npz' % (name, digest(filename)[:16]))
+    if not os.path.exists(stored):
+        arrays, stats = fit(filename, column)
+        tmp = stored + '.%d.tmp.npz' % os.getpid()
+        np.savez(tmp, stats=json.dumps(stats), **arrays)
+        os.replace(tmp, stored)
+    with np.load(stored) as f:
+        return dict(f)
+
+
+class Monthly():
+    """ Fitted monthly models of solar, wind and electricity price. The
+    series are fitted concurrently, and only when their workbook content
+    has no stored fit yet """
+
+    def __init__(self, directory=HERE, cache=None, workers=None):
+        cache = cache or os.path.join(directory, CACHE)
+        os.makedirs(cache, exist_ok=True)
+        with ProcessPoolExecutor(workers or len(SERIES)) as pool:
+            futures = {name: pool.submit(_fit, name, os.path.join(directory, filename), column, cache)
+                       for name, (filename, column) in SERIES.items()}
+            fits = {name: future.result() for name, future in futures.items()}
+
+        self.names = list(SERIES)
+        self.stats = {name: json.loads(str(fits[name]['stats'])) for name in self.names}
+        self.factors = np.column_stack([fits[name]['factors'] for name in self.names])
+        # (years, 12, series) of the years all series cover
+        years = sorted(set.intersection(*(set(fits[name]['years'].tolist()) for name in self.names)))
+        self.years = np.array(years)
+        self.observed = np.stack([fits[name]['observed'][np.searchsorted(fits[name]['years'], years)]
+                                  for name in self.names], axis=-1)
+
+    def sample(self, months, n, seed=0):
+        """ n draws of the factors of the given months (1 to 12) as an
+        (n, len(months), series) array. Every month of a draw comes from an
+        observed year, the same for all series so they stay consistent.
+        Gaps in a year fall back to the fitted factor """
+
+        months = np.asarray(months) - 1
+        rng = np.random.default_rng(seed)
+        year = rng.integers(len(self.years), size=(n, len(months)))
+        draws = self.observed[year, months]
+        return np.where(np.isnan(draws), self.factors[months], draws)
+
+
+_default = None
+
+
+def sample(months, n, seed=0):
+    """Monthly factors from the default fit next to this module"""
+
+    global _default
+    if _default is None:
+        _default = Monthly()
+    return _default.sample(months, n, seed)
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Fits the monthly models of solar, wind and electricity price')
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    model = Monthly(workers=args.workers)
+    print("%-12s %8s %8s %8s %10s" % ('series', 'mean', 'r2', 'acf12', 'adf p'))
+    for name in model.names:
+        stats = model.stats[name]
+        print("%-12s %8.3f %8.3f %8.3f %10s" % (name, stats['mean'], stats['r2'], stats['acf'][12],
+                                                '%.3f' % stats['adf']['pvalue'] if 'adf' in stats else '-'))
+    print(pd.DataFrame(model.factors, index=range(1, 13), columns=model.names).round(3))
@@ -0,0 +1,183 @@
+import argparse, hashlib, json, os, time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SIZING = os.path.join(HERE, '..', '..', 'Sizing')
+# Fitted models are kept here, keyed by their sources and settings
+CACHE = '.synthcache'
+
+DAYS = 365
+HOURS = 24 * DAYS
+SERIES = ['wind', 'solar', 'demand']
+# days per block of resampled demand deviations
+BLOCK = 7
+# bumped when the stored fit changes shape
+FORMAT = 2
+
+# month of every hour and day of a non-leap year
+MONTH = np.repeat(np.arange(12), np.diff([0, 31, 59, 90, 120, 151, 181, 212, 243, 273, 304, 334, 365]))
+HOUR_KEY = (np.repeat(MONTH, 24) * 24 + np.tile(np.arange(24), DAYS))
+
+
+def sources(directory=HERE, sizing=SIZING):
+    return {'wind': os.path.join(directory, 'Wind2013_2023.xlsx'),
+            'solar': os.path.join(directory, 'Solar2013_2023.xlsx'),
+            'demand': os.path.join(sizing, 'COSB_daily.csv'),
+            'profile': os.path.join(sizing, 'tuk1.csv')}
+
+
+def autoregress(z, lags):
+    """Least squares AR(lags) coefficients of z and the spread of its innovations"""
+
+    X = np.column_stack([z[lags - k - 1:len(z) - k - 1] for k in range(lags)])
+    phi = np.linalg.lstsq(X, z[lags:], rcond=None)[0]
+    residual = z[lags:] - X @ phi
+    return phi, residual
+
+
+def hourly(stamps, values, lags):
+    """ Mean and spread of a capacity factor per month and hour of day, and
+    an AR model of the standardized deviations from them """
+
+    key = (stamps.month.to_numpy() - 1) * 24 + stamps.hour.to_numpy()
+    count = np.bincount(key, minlength=288)
+    mean = np.bincount(key, values, 288) / count
+    std = np.sqrt(np.bincount(key, (values - mean[key])**2, 288) / count)
+    # no spread at night, nothing to model there
+    z = np.where(std[key] > 1e-6, (values - mean[key]) / np.maximum(std[key], 1e-6), 0.0)
+    phi, residual = autoregress(z, lags)
+    return {'mean': mean, 'std': std, 'phi': phi}, residual
+
+
+def daily(dates, values):
+    """ Daily demand as a monthly level and the observed relative
+    deviations from it, which are resampled in weekly blocks rather than
+    modelled: they are skewed, shutdown days fall far below the level but
+    no day rises far above it, and a week carries the weekday pattern.
+    The level is the median, so shutdowns do not pull it down; months
+    without data take the median of all days """
+
+    month = dates.month.to_numpy() - 1
+    level = pd.Series(values).groupby(month).median().reindex(range(12)).fillna(np.median(values)).to_numpy()
+    return {'level': level, 'ratio': values / level[month], 'weekday': dates.weekday.to_numpy()}
+
+
+def fit(files, lags=2):
+    """Fits all series; flat arrays so the fit saves as one .npz"""
+
+    model = {}
+    residuals = {}
+    for name in ['wind', 'solar']:
+        df = pd.read_excel(files[name])
+        stamps = pd.DatetimeIndex(df.iloc[:, 0])
+        params, residuals[name] = hourly(stamps, df['electricity'].to_numpy(dtype=float), lags)
+        model.update({'%s_%s' % (name, key): value for key, value in params.items()})
+
+    df = pd.read_csv(files['demand'], usecols=['Date', 'Demand']).dropna()
+    params = daily(pd.DatetimeIndex(pd.to_datetime(df['Date'], dayfirst=True)), df['Demand'].to_numpy(dtype=float))
+    model.update({'demand_%s' % key: value for key, value in params.items()})
+
+    profile = pd.read_csv(files['profile'])['Demand'].to_numpy(dtype=float)
+    model['profile'] = profile / profile.sum()
+
+    # wind and solar innovations move together, hour by hour
+    innovations = np.vstack([residuals['wind'], residuals['solar']])
+    model['sigma'] = innovations.std(axis=1)
+    model['chol'] = np.linalg.cholesky(np.corrcoef(innovations))
+    return model
+
+
+def load(files=None, lags=2, cache=os.path.join(HERE, CACHE)):
+    """The fitted model, fitted again only when a source changes"""
+
+    files = files or sources()
+    signature = json.dumps([FORMAT, lags] + [[os.path.basename(f), os.stat(f).st_size, os.stat(f).st_mtime_ns]
+                                     for f in sorted(files.values())])
+    filename = os.path.join(cache, hashlib.sha1(signature.encode()).hexdigest() + '.npz')
+    if os.path.exists(filename):
+        with np.load(filename) as stored:
+            return dict(stored)
+
+    model = fit(files, lags)
+    os.makedirs(cache, exist_ok=True)
+    tmp = filename + '.%d.tmp.npz' % os.getpid()
+    np.savez(tmp, **model)
+    os.replace(tmp, filename)
+    return model
+
+
+def draw(model, seeds, weekday=0, burn=240):
+    """ Stochastic years for the given seeds as (len(seeds), HOURS, 3)
+    wind, solar and demand: AR deviations for wind and solar, weekly
+    blocks of observed deviations for demand. Each year has a generator
+    of its own, so a year only depends on its seed, not on how the work
+    is split """
+
+    n = len(seeds)
+    lags = len(model['wind_phi'])
+    phi = np.vstack([model['wind_phi'], model['solar_phi']])
+    ratio = model['demand_ratio']
+    blocks = -(-DAYS // BLOCK)
+    # every block starts on the weekday the year starts on
+    first = np.flatnonzero(model['demand_weekday'][:len(ratio) - BLOCK + 1] == weekday)
+    e = np.empty((n, burn + HOURS, 2))
+    start = np.empty((n, blocks), dtype=int)
+    for i, seed in enumerate(seeds):
+        rng = np.random.default_rng(seed)
+        e[i] = rng.standard_normal((burn + HOURS, 2)) @ model['chol'].T * model['sigma']
+        start[i] = first[rng.integers(len(first), size=blocks)]
+
+    # AR recursions over time, every year and series at once
+    z = np.zeros((n, burn + HOURS, 2))
+    for t in range(lags, burn + HOURS):
+        z[:, t] = np.einsum('sk,nks->ns', phi, z[:, t - lags:t][:, ::-1]) + e[:, t]
+    z = z[:, burn:]
+
+    years = np.empty((n, HOURS, 3))
+    for s, name in enumerate(['wind', 'solar']):
+        mean, std = model[name + '_mean'][HOUR_KEY], model[name + '_std'][HOUR_KEY]
+        years[:, :, s] = np.clip(mean + std * z[:, :, s], 0, 1)
+
+    # consecutive observed weeks of deviations, in random order
+    deviation = ratio[(start[:, :, None] + np.arange(BLOCK)).reshape(n, -1)[:, :DAYS]]
+    demand = model['demand_level'][MONTH] * deviation
+    years[:, :, 2] = (demand[:, :, None] * model['profile']).reshape(n, HOURS)
+    return years
+
+
+def generate(n, seed=0, model=None, workers=None, chunk=16, weekday=0):
+    """ n independent years as one (n, HOURS, 3) array, drawn in chunks on a
+    process pool. The same seed gives the same years for any workers """
+
+    model = model if model is not None else load()
+    seeds = np.random.SeedSequence(seed).spawn(n)
+    chunks = [seeds[i:i + chunk] for i in range(0, n, chunk)]
+    if workers == 1 or len(chunks) == 1:
+        return np.concatenate([draw(model, part, weekday) for part in chunks])
+
+    with ProcessPoolExecutor(workers) as pool:
+        return np.concatenate(list(pool.map(draw, [model] * len(chunks), chunks, [weekday] * len(chunks))))
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Draws stochastic years of wind, solar and demand')
+    parser.add_argument("--scenarios", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--lags", type=int, default=2, help="AR order of the hourly wind and solar deviations")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--output", default='scenarios.npy', help="(scenarios, 8760, [wind, solar, demand]) array")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    model = load(lags=args.lags)
+    fitted = time.perf_counter()
+    years = generate(args.scenarios, args.seed, model, args.workers)
+    np.save(args.output, years)
+    print("fit %5.2f s, %d years in %5.2f s -> %s" % (fitted - start, args.scenarios, time.perf_counter() - fitted,
+                                                     args.output))
+    for s, name in enumerate(SERIES):
+        print("%-7s mean %12.4f std across years of the mean %10.4f" % (name, years[:, :, s].mean(),
+                                                                      years[:, :, s].mean(axis=1).std()))
@@ -0,0 +1,142 @@
+import argparse, glob, json, os, re, shutil, tempfile
+import numpy as np
+import pandas as pd
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+# The merged prices are kept here, one hourly array plus its metadata
+STORE = '.ptfstore'
+CURRENCIES = ['TL', 'USD', 'EUR']
+HOUR = np.timedelta64(1, 'h')
+
+
+def parse(filename):
+    """ Hourly timestamps and the TL, USD and EUR prices of one EPİAŞ
+    export: ';' separated, decimal commas with '.' thousands and separate
+    Tarih (dd.mm.yyyy) and Saat (hh:mm) columns """
+
+    df = pd.read_csv(filename, sep=';', decimal=',', thousands='.', dtype={'Tarih': str, 'Saat': str},
+                     encoding='utf-8-sig')
+    date = pd.to_datetime(df['Tarih'], format='%d.%m.%Y').to_numpy('datetime64[h]')
+    hour = df['Saat'].str.slice(0, 2).astype(int).to_numpy()
+    stamps = date + hour * HOUR
+    prices = df.iloc[:, 2:5].to_numpy(dtype=float)
+
+    # Until 2016 the spring-forward day repeats 03:00 where 04:00 belongs;
+    # a repeated hour moves to the next one when that one is missing
+    repeated = np.flatnonzero(pd.Series(stamps).duplicated().to_numpy())
+    if len(repeated):
+        known = set(stamps.tolist())
+        for i in repeated:
+            if (stamps[i] + HOUR).tolist() not in known:
+                stamps[i] += HOUR
+                known.add(stamps[i].tolist())
+
+    return stamps, prices
+
+
+def sources(directory=HERE):
+    """The yearly CSV files, ordered by the first day of their range"""
+
+    def start(filename):
+        match = re.search(r'-(\d{2})(\d{2})(\d{4})-', os.path.basename(filename))
+        return (match.group(3), match.group(2), match.group(1)) if match else ('', '', filename)
+
+    return sorted(glob.glob(os.path.join(directory, 'Piyasa_Takas_Fiyati-*.csv')), key=start)
+
+
+def merge(filenames):
+    """ One contiguous hourly series from all files. Where ranges overlap
+    the later file in filenames wins, whatever order their ranges are in;
+    hours no file covers are NaN """
+
+    parts = [parse(filename) for filename in filenames]
+    stamps = np.concatenate([part[0] for part in parts])
+    prices = np.concatenate([part[1] for part in parts])
+
+    keep = ~pd.Series(stamps).duplicated(keep='last').to_numpy()
+    stamps, prices = stamps[keep], prices[keep]
+
+    start = stamps.min()
+    series = np.full((int((stamps.max() - start) / HOUR) + 1, len(CURRENCIES)), np.nan)
+    series[((stamps - start) / HOUR).astype(int)] = prices
+    return start, series
+
+
+def signature(filenames):
+    return {os.path.basename(f): [os.stat(f).st_size, os.stat(f).st_mtime_ns] for f in filenames}
+
+
+def build(directory=HERE, store=None):
+    """Writes the merged series as a .npy array with its start hour"""
+
+    store = store or os.path.join(directory, STORE)
+    filenames = sources(directory)
+    start, series = merge(filenames)
+
+    os.makedirs(os.path.dirname(os.path.abspath(store)), exist_ok=True)
+    tmp = tempfile.mkdtemp(dir=os.path.dirname(os.path.abspath(store)))
+    np.save(os.path.join(tmp, 'prices.npy'), series, allow_pickle=False)
+    meta = {'start': str(start), 'hours': len(series), 'columns': CURRENCIES, 'sources': signature(filenames),
+            'missing': int(np.isnan(series[:, 0]).sum())}
+    with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+        json.dump(meta, f, indent=1)
+
+    # swap the new store in whole, as common.Data does with its cache
+    shutil.rmtree(store, ignore_errors=True)
+    try:
+        os.rename(tmp, store)
+    except OSError:
+        shutil.rmtree(tmp, ignore_errors=True)
+    return meta
+
+
+class Prices():
+    """ Hourly market clearing prices (PTF) from the store, memory mapped.
+    The store is rebuilt when the CSV files change """
+
+    def __init__(self, directory=HERE, store=None):
+        self.store = store or os.path.join(directory, STORE)
+        try:
+            with open(os.path.join(self.store, 'meta.json')) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            meta = None
+        if meta is None or meta['sources'] != signature(sources(directory)):
+            meta = build(directory, self.store)
+
+        self.meta = meta
+        self.start = np.datetime64(meta['start'], 'h')
+        self.values = np.load(os.path.join(self.store, 'prices.npy'), mmap_mode='r')
+        self.end = self.start + len(self.values) * HOUR
+
+    def index(self, when):
+        return int((np.datetime64(when, 'h') - self.start) / HOUR)
+
+    def hourly(self, start=None, end=None, currency='TL'):
+        """ Prices of the hours from start up to but excluding end, a view
+        of the memory map. Dates are anything numpy.datetime64 accepts """
+
+        first = 0 if start is None else self.index(start)
+        last = len(self.values) if end is None else self.index(end)
+        if first < 0 or last > len(self.values):
+            raise KeyError("PTF prices cover %s to %s" % (self.start, self.end))
+        return self.values[first:last, CURRENCIES.index(currency)]
+
+    def frame(self, start=None, end=None):
+        first = 0 if start is None else self.index(start)
+        last = len(self.values) if end is None else self.index(end)
+        index = pd.date_range(str(self.start + first * HOUR), periods=last - first, freq='h')
+        return pd.DataFrame(np.asarray(self.values[first:last]), index=index,
+                            columns=['PTF (%s/MWh)' % c for c in CURRENCIES])
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Merges the EPİAŞ PTF exports into one hourly price store')
+    parser.add_argument("--directory", default=HERE)
+    parser.add_argument("--store", default=None)
+    args = parser.parse_args()
+
+    meta = build(args.directory, args.store)
+    print("%d hours from %s, %d missing, from %d files" % (meta['hours'], meta['start'], meta['missing'],
+                                                          len(meta['sources'])))
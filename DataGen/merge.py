@@ -1,24 +1,13 @@
-import glob
-import pandas as pd
- 
-# specifying the path to csv files
- 
-# csv files in the path
-file_list = glob.glob(r"C:\Users\Yucehan Kutlu\Documents\Data Science\DataGen" + r"/*.xlsx")
- 
-# list of excel files we want to merge.
-# pd.read_excel(file_path) reads the excel
-# data into pandas dataframe.
-excl_list = []
- 
-for file in file_list:
-    excl_list.append(pd.read_excel(file, sheet_name='solar'))
- 
-# concatenate all DataFrames in the list
-# into a single DataFrame, returns new 
-# DataFrame.
-excl_merged = pd.concat(excl_list, ignore_index=True)
- 
-# exports the dataframe into excel file
-# with specified name.
-excl_merged.to_excel('Wind.xlsx', index=False)
\ No newline at end of file
+import glob, os
+import rpgstore
+
+# every sheet of the yearly workbooks, parsed in parallel and only once;
+# a new year only parses its own workbook
+store = rpgstore.Store()
+store.update(sorted(glob.glob(os.path.join(rpgstore.HERE, 'RPGss20*.xlsx'))))
+
+for name, problem in store.check().items():
+    print(name, problem)
+
+# exports the merged solar and wind series
+store.frame().to_excel('RPGmerged.xlsx')
@@ -0,0 +1,231 @@
+import argparse, hashlib, json, os, tempfile, threading, time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import numpy as np
+import pandas as pd
+import requests
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+API_BASE = 'https://www.renewables.ninja/api/'
+# Responses are kept here, one file per distinct request
+CACHE = '.ninjacache'
+
+# The settings of renGen.dataGen, per technology
+SETTINGS = {
+    'pv': {'dataset': 'merra2', 'capacity': 1.0, 'system_loss': 0.1, 'tracking': 0, 'tilt': 35, 'azim': 180},
+    'wind': {'capacity': 1.0, 'height': 100, 'turbine': 'Vestas V80 2000'},
+}
+
+Job = namedtuple('Job', 'lat lon year technology')
+
+
+class RateLimit():
+    """ At most rate requests in any window of per seconds, shared by all
+    threads. The public API allows 6 a minute (50 an hour) per token """
+
+    def __init__(self, rate=6, per=60.0):
+        self.rate = rate
+        self.per = per
+        self.sent = []
+        self.lock = threading.Lock()
+
+    def wait(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.sent = [t for t in self.sent if now - t < self.per]
+                if len(self.sent) < self.rate:
+                    self.sent.append(now)
+                    return
+                delay = self.per - (now - self.sent[0])
+            time.sleep(delay)
+
+
+def params(job):
+    """Query string of one job"""
+
+    query = dict(SETTINGS[job.technology], lat=job.lat, lon=job.lon, format='json',
+                 date_from='%d-01-01' % job.year, date_to='%d-12-31' % job.year)
+    return query
+
+
+def key(url, query):
+    """Cache file name of a request, the hash of its url and parameters"""
+
+    return hashlib.sha1(json.dumps([url, query], sort_keys=True).encode()).hexdigest() + '.json'
+
+
+def parse(text):
+    """ Hourly timestamps and capacity factors of a JSON response, without
+    building a DataFrame in between. data is keyed by epoch milliseconds or
+    by date strings depending on the API version """
+
+    response = json.loads(text)
+    data = response['data']
+    stamps = list(data)
+    if stamps and stamps[0].isdigit():
+        hours = np.array(stamps, dtype=np.int64).astype('datetime64[ms]')
+    else:
+        hours = np.array(stamps, dtype='datetime64[ms]')
+    electricity = np.fromiter((row['electricity'] for row in data.values()), dtype=float, count=len(data))
+
+    return hours, electricity, response.get('metadata', {})
+
+
+class Fetcher():
+    """ Runs many renewables.ninja requests on a thread pool with a shared
+    rate limit, retries with backoff on dropped connections, timeouts,
+    throttling and server errors, and keeps every response on disk so a
+    request is only ever sent once """
+
+    def __init__(self, token=None, base=API_BASE, cache=CACHE, workers=4, rate=6, per=60.0, retries=5,
+                 timeout=120):
+        self.token = token or os.environ.get('NINJA_TOKEN')
+        self.base = base
+        self.cache = cache
+        self.workers = workers
+        self.limit = RateLimit(rate, per)
+        self.retries = retries
+        self.timeout = timeout
+        self.local = threading.local()
+        os.makedirs(cache, exist_ok=True)
+
+    def session(self):
+        # requests.Session is not thread safe, one per worker thread
+        if not hasattr(self.local, 'session'):
+            self.local.session = requests.session()
+            if self.token:
+                self.local.session.headers = {'Authorization': 'Token ' + self.token}
+        return self.local.session
+
+    def get(self, url, query):
+        """Response body of one request, from the cache when it was sent before"""
+
+        filename = os.path.join(self.cache, key(url, query))
+        if os.path.exists(filename):
+            with open(filename) as f:
+                return f.read()
+
+        for attempt in range(self.retries + 1):
+            self.limit.wait()
+            try:
+                r = self.session().get(url, params=query, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == self.retries:
+                    raise
+                time.sleep(2 ** attempt)
+                continue
+            if r.status_code == 429 or r.status_code >= 500:
+                if attempt == self.retries:
+                    r.raise_for_status()
+                retry = r.headers.get('Retry-After')
+                time.sleep(float(retry) if retry and retry.isdigit() else 2 ** attempt)
+                continue
+            r.raise_for_status()
+            break
+
+        # written whole, another run may be reading the cache
+        fd, tmp = tempfile.mkstemp(dir=self.cache)
+        with os.fdopen(fd, 'w') as f:
+            f.write(r.text)
+        os.replace(tmp, filename)
+        return r.text
+
+    def job(self, job):
+        url = self.base + 'data/' + job.technology
+        return parse(self.get(url, params(job)))
+
+    def fetch(self, jobs):
+        """ Hourly series of every job as {job: (time, electricity, metadata)}.
+        Failed jobs are reported and left out """
+
+        results = {}
+        with ThreadPoolExecutor(self.workers) as pool:
+            futures = {pool.submit(self.job, job): job for job in jobs}
+            for future in as_completed(futures):
+                job = futures[future]
+                try:
+                    results[job] = future.result()
+                except Exception as e:
+                    print("%s failed: %s" % (str(job), e))
+        return results
+
+
+def frame(results):
+    """All series in one long table: time, lat, lon, year, technology, electricity"""
+
+    jobs = sorted(results, key=lambda job: tuple(job))
+    size = [len(results[job][0]) for job in jobs]
+    return pd.DataFrame({
+        'time': np.concatenate([results[job][0] for job in jobs]) if jobs else np.array([], 'datetime64[ms]'),
+        'lat': np.repeat([job.lat for job in jobs], size).astype(float),
+        'lon': np.repeat([job.lon for job in jobs], size).astype(float),
+        'year': np.repeat([job.year for job in jobs], size).astype(np.int16),
+        'technology': pd.Categorical(np.repeat([job.technology for job in jobs], size).astype(str),
+                                     categories=sorted(SETTINGS)),
+        'electricity': np.concatenate([results[job][1] for job in jobs]) if jobs else np.array([], float),
+    })
+
+
+def write(results, filename):
+    """ Columnar store of the series, Parquet partitioned by technology
+    and year, one file per job named by its site, with the response
+    metadata of the job kept in its schema. Writing again replaces the
+    files of the jobs given and keeps those of every other site """
+
+    if pyarrow is None:
+        raise ImportError("The columnar store needs pyarrow")
+
+    for job in results:
+        meta = {'%s %s %s %s' % tuple(job): results[job][2]}
+        table = pyarrow.Table.from_pandas(frame({job: results[job]}), preserve_index=False)
+        table = table.replace_schema_metadata(dict(table.schema.metadata or {}, ninja=json.dumps(meta)))
+        # the job is one technology and year, so one file in one partition
+        name = 'site-%r-%r-{i}.parquet' % (float(job.lat), float(job.lon))
+        pyarrow.parquet.write_to_dataset(table, filename, partition_cols=['technology', 'year'],
+                                         basename_template=name, existing_data_behavior='overwrite_or_ignore')
+
+
+def read(filename, technology=None, years=None):
+    """Series of the store as a long table, optionally only some of it"""
+
+    filters = []
+    if technology:
+        filters.append(('technology', '=', technology))
+    if years:
+        filters.append(('year', 'in', list(years)))
+    return pd.read_parquet(filename, filters=filters or None)
+
+
+def jobs(sites, years, technologies=('pv', 'wind')):
+    return [Job(lat, lon, year, technology) for lat, lon in sites for year in years for technology in technologies]
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Fetches hourly PV and wind capacity factors from renewables.ninja')
+    parser.add_argument("--sites", nargs='+', default=['41.31846539501719,27.912727392607966'],
+        metavar="LAT,LON")
+    parser.add_argument("--years", type=int, nargs=2, default=[2013, 2023], metavar=("FIRST", "LAST"))
+    parser.add_argument("--technology", nargs='+', default=['pv', 'wind'], choices=sorted(SETTINGS))
+    parser.add_argument("--output", default='ninja.parquet', help="Parquet dataset directory")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--rate", type=int, default=6, help="Requests per --per seconds")
+    parser.add_argument("--per", type=float, default=60.0)
+    parser.add_argument("--base", default=API_BASE, help="API root, e.g. a local stand-in server")
+    parser.add_argument("--cache", default=CACHE)
+    args = parser.parse_args()
+
+    sites = [tuple(float(x) for x in site.split(',')) for site in args.sites]
+    todo = jobs(sites, range(args.years[0], args.years[1] + 1), args.technology)
+
+    start = time.perf_counter()
+    fetcher = Fetcher(base=args.base, cache=args.cache, workers=args.workers, rate=args.rate, per=args.per)
+    results = fetcher.fetch(todo)
+    write(results, args.output)
+    print("%d of %d series in %5.1f s -> %s" % (len(results), len(todo), time.perf_counter() - start, args.output))
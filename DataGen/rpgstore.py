@@ -0,0 +1,148 @@
+import argparse, glob, json, os, tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import pandas as pd
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+# One Parquet part per workbook plus a manifest, next to the workbooks
+STORE = 'RPGstore'
+SHEETS = ['solar', 'wind']
+HOUR = np.timedelta64(1, 'h')
+
+
+def hours(stamps):
+    """ Gaps and repeated hours of a timestamp array, as lists of strings:
+    gaps as 'first missing/hours', repeats as the repeated hour """
+
+    stamps = np.asarray(stamps, dtype='datetime64[h]')
+    step = np.diff(stamps) / HOUR
+    gaps = ['%s/%d' % (stamps[i] + HOUR, step[i] - 1) for i in np.flatnonzero(step > 1)]
+    repeats = [str(s) for s in stamps[1:][step <= 0]]
+    return gaps, repeats
+
+
+def parse(filename):
+    """ Every sheet of one RPGss workbook aligned on the hour: a frame of
+    float columns indexed by timestamp, and what was wrong with it """
+
+    sheets = pd.read_excel(filename, sheet_name=None, index_col=0)
+    columns, report = {}, {}
+    for name, df in sheets.items():
+        stamps = pd.DatetimeIndex(df.index).floor('h')
+        gaps, repeats = hours(stamps.to_numpy())
+        report[name] = {'rows': len(df), 'gaps': gaps, 'repeats': repeats}
+        series = pd.Series(df['electricity'].to_numpy(dtype=float), index=stamps, name=name)
+        columns[name] = series[~series.index.duplicated(keep='first')]
+
+    # outer join, an hour missing from one sheet becomes NaN
+    frame = pd.concat(columns.values(), axis=1).sort_index()
+    frame.index.name = 'time'
+    report['unaligned'] = int(frame.isna().any(axis=1).sum())
+    return frame, report
+
+
+class Store():
+    """ Append-only columnar store of the hourly capacity factors of many
+    yearly workbooks. A workbook is parsed once; adding a year parses only
+    that workbook, a changed workbook replaces only its own part """
+
+    def __init__(self, directory=os.path.join(HERE, STORE)):
+        self.directory = directory
+        self.manifest = os.path.join(directory, 'manifest.json')
+        os.makedirs(os.path.join(directory, 'parts'), exist_ok=True)
+        try:
+            with open(self.manifest) as f:
+                self.parts = json.load(f)
+        except (OSError, ValueError):
+            self.parts = {}
+
+    @staticmethod
+    def signature(filename):
+        stat = os.stat(filename)
+        return [stat.st_size, stat.st_mtime_ns]
+
+    def stale(self, filenames):
+        return [f for f in filenames if self.parts.get(os.path.basename(f), {}).get('source') != self.signature(f)]
+
+    def _save(self):
+        fd, tmp = tempfile.mkstemp(dir=self.directory)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(self.parts, f, indent=1)
+        os.replace(tmp, self.manifest)
+
+    def add(self, filename, frame, report):
+        """Writes one parsed workbook as its own part and records it"""
+
+        name = os.path.basename(filename)
+        part = os.path.join('parts', os.path.splitext(name)[0] + '.parquet')
+        tmp = os.path.join(self.directory, part + '.tmp')
+        frame.to_parquet(tmp)
+        os.replace(tmp, os.path.join(self.directory, part))
+
+        self.parts[name] = dict(report, source=self.signature(filename), part=part,
+                                first=str(frame.index[0]), last=str(frame.index[-1]))
+        self._save()
+
+    def update(self, filenames, workers=None):
+        """ Parses the new and changed workbooks in a process pool, each
+        written to the store as soon as it is done """
+
+        todo = self.stale(filenames)
+        if not todo:
+            return []
+        with ProcessPoolExecutor(min(workers or os.cpu_count(), len(todo))) as pool:
+            futures = {pool.submit(parse, filename): filename for filename in todo}
+            for future in as_completed(futures):
+                self.add(futures[future], *future.result())
+        return todo
+
+    def frame(self, start=None, end=None):
+        """ All parts as one hourly frame, ordered by time. Hours in more
+        than one part are taken from the later workbook """
+
+        parts = sorted(self.parts.values(), key=lambda part: part['first'])
+        frame = pd.concat([pd.read_parquet(os.path.join(self.directory, part['part'])) for part in parts])
+        frame = frame[~frame.index.duplicated(keep='last')].sort_index()
+        return frame.loc[start:end]
+
+    def check(self):
+        """Gaps and repeats within every workbook and between them"""
+
+        problems = {name: {key: part[key] for key in part if key in SHEETS or key == 'unaligned'}
+                    for name, part in sorted(self.parts.items())}
+        parts = sorted(self.parts.values(), key=lambda part: part['first'])
+        for before, after in zip(parts, parts[1:]):
+            step = (np.datetime64(after['first'], 'h') - np.datetime64(before['last'], 'h')) / HOUR
+            if step != 1:
+                problems.setdefault('between', []).append('%s -> %s: %+d h' % (before['last'], after['first'],
+                                                                              step - 1))
+        return problems
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Merges the yearly RPGss workbooks into one hourly store')
+    parser.add_argument("workbooks", nargs='*', help="Default: RPGss*.xlsx next to this script")
+    parser.add_argument("--store", default=os.path.join(HERE, STORE))
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--csv", default=None, help="Also writes the merged series in the RPG.csv layout")
+    args = parser.parse_args()
+
+    store = Store(args.store)
+    parsed = store.update(args.workbooks or sorted(glob.glob(os.path.join(HERE, 'RPGss*.xlsx'))), args.workers)
+    print("parsed %d workbooks, %d in store" % (len(parsed), len(store.parts)))
+
+    for name, problem in store.check().items():
+        if name == 'between':
+            print('between workbooks: ' + '; '.join(problem))
+            continue
+        found = ['%s: %d gaps %d repeats' % (sheet, len(problem[sheet]['gaps']), len(problem[sheet]['repeats']))
+                 for sheet in SHEETS if sheet in problem and (problem[sheet]['gaps'] or problem[sheet]['repeats'])]
+        if found or problem.get('unaligned'):
+            print("%s %s unaligned hours %d" % (name, ' '.join(found), problem.get('unaligned', 0)))
+
+    if args.csv:
+        frame = store.frame()
+        pd.DataFrame({'solar': frame['solar'].to_numpy(), 'wind': frame['wind'].to_numpy()},
+                     index=pd.MultiIndex.from_arrays([frame.index.strftime('%Y-%m-%d'),
+                                                      frame.index.strftime('%H:%M:%S')], names=[None, None])).to_csv(args.csv)
@@ -0,0 +1,98 @@
+import json, threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import numpy as np
+import pytest
+
+import ninja
+
+# 2013-01-01 00:00 and 01:00 UTC, in epoch milliseconds
+HOURS = ['1356998400000', '1357002000000']
+
+
+class StandIn(BaseHTTPRequestHandler):
+    """renewables.ninja data endpoint that throttles every first request of a path"""
+
+    sent = []
+
+    def do_GET(self):
+        path = self.path.split('?')[0]
+        first = path not in [p for p, _ in self.sent]
+        self.sent.append((path, self.headers.get('Authorization')))
+        if first:
+            self.send_response(429)
+            self.send_header('Retry-After', '0')
+            self.end_headers()
+            return
+        body = json.dumps({'data': {h: {'electricity': 0.25 * (i + 1)} for i, h in enumerate(HOURS)},
+                           'metadata': {'params': path}}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    StandIn.sent = []
+    httpd = HTTPServer(('127.0.0.1', 0), StandIn)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield 'http://127.0.0.1:%d/api/' % httpd.server_port
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_fetch_retries_caches_and_round_trips(server, tmp_path):
+    todo = ninja.jobs([(41.3, 27.9)], [2013], ('pv', 'wind'))
+    cache = str(tmp_path / 'cache')
+
+    fetcher = ninja.Fetcher(token='secret', base=server, cache=cache, workers=2, rate=100, per=1.0)
+    results = fetcher.fetch(todo)
+    assert sorted(results) == sorted(todo)
+    # one throttled and one served request per job, all with the token
+    assert sorted(path for path, _ in StandIn.sent) == ['/api/data/pv'] * 2 + ['/api/data/wind'] * 2
+    assert {auth for _, auth in StandIn.sent} == {'Token secret'}
+    hours, electricity, meta = results[todo[0]]
+    assert hours.tolist() == np.array(HOURS, dtype=np.int64).astype('datetime64[ms]').tolist()
+    assert electricity.tolist() == [0.25, 0.5]
+
+    # the same jobs again are answered from the cache alone
+    sent = len(StandIn.sent)
+    again = ninja.Fetcher(base=server, cache=cache, rate=100, per=1.0).fetch(todo)
+    assert len(StandIn.sent) == sent
+    assert all(np.array_equal(again[job][1], results[job][1]) for job in todo)
+
+    pytest.importorskip('pyarrow')
+    store = str(tmp_path / 'ninja.parquet')
+    ninja.write(results, store)
+    table = ninja.read(store, technology='wind', years=[2013])
+    assert len(table) == len(HOURS)
+    assert table['electricity'].tolist() == [0.25, 0.5]
+    assert (table['lat'] == 41.3).all() and (table['lon'] == 27.9).all()
+    assert len(ninja.read(store)) == 2 * len(HOURS)
+
+
+def test_write_keeps_other_sites(server, tmp_path):
+    pytest.importorskip('pyarrow')
+    cache = str(tmp_path / 'cache')
+    store = str(tmp_path / 'ninja.parquet')
+    fetcher = ninja.Fetcher(base=server, cache=cache, rate=100, per=1.0)
+
+    # two sites written one after the other to the same store
+    first = fetcher.fetch(ninja.jobs([(41.3, 27.9)], [2013], ('wind',)))
+    ninja.write(first, store)
+    second = fetcher.fetch(ninja.jobs([(39.9, 32.8)], [2013], ('wind',)))
+    ninja.write(second, store)
+
+    table = ninja.read(store, technology='wind', years=[2013])
+    assert sorted(set(zip(table['lat'], table['lon']))) == [(39.9, 32.8), (41.3, 27.9)]
+    assert len(table) == 2 * len(HOURS)
+
+    # writing a site again replaces its rows rather than adding to them
+    ninja.write(first, store)
+    assert len(ninja.read(store)) == 2 * len(HOURS)
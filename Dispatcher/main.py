@@ -1,78 +1,141 @@
-import pyomo.environ as pyomo
-import random 
-import matplotlib.pyplot as plt
-
-# Create a model
-model = pyomo.ConcreteModel()
-
-# Time series
-model.nt = pyomo.Param(initialize = 20)
-model.T = pyomo.Set(initialize = range(model.nt()))
-
-# Create some random input data
-xtmp = {}
-random.seed(123)
-for t in range(model.nt()):
-    xtmp[t] = random.uniform(0,100)
-
-# Assign parameter values
-model.X_in = pyomo.Param(model.T, initialize=xtmp)
-model.XM = pyomo.Param(initialize=max(xtmp.values()))
-model.X0 = pyomo.Param(initialize=50)
-
-# setup an array of continuous and binary variables over the time domain
-model.x = pyomo.Var(model.T, domain=pyomo.NonNegativeReals)
-model.y = pyomo.Var(model.T, domain=pyomo.Binary)
-
-# Maximize x 
-def f_objective(model):
-    return sum([model.x[t] for t in model.T])
-model.objective = pyomo.Objective(rule = f_objective, sense = pyomo.maximize)
-
-# ---Add some constraints
-
-# x[t] less than X_in for all t
-def f_x_lim(model, t):
-    return model.x[t] <= model.X_in[t]
-model.c_x_lim = pyomo.Constraint(model.T, rule = f_x_lim)
-
-# x[t] is limited by value of binary y[t]
-def f_x_y(model, t):
-    return model.x[t] <= model.XM()*model.y[t]
-model.c_x_y = pyomo.Constraint(model.T, rule = f_x_y)
-
-# y[t] can only be 1 when X_in[t] > X0
-def f_y_x0(model, t):
-    return model.y[t] <= model.X_in[t] / model.X0
-model.c_y_x0 = pyomo.Constraint(model.T, rule = f_y_x0)
-
-# ------ solve and print out results
-#solver setup
-solver = pyomo.SolverFactory('glpk')
-#solver = pyomo.SolverFactory('gurobi')
-#solver = pyomo.SolverFactory('cbc')
-res = solver.solve(model)
-
-print(res)
-print(model.objective())
-
-# Space-separated list of variables to print
-pouts = "X_in x y".split()
-
-# Automatically handle printing
-print('t\t'+'\t'.join(pouts))
-
-for t in model.T:
-    fmt = "{:d}" + "\t{:.1f}"*(len(pouts))
-    outs = []
-    for o in pouts:
-        try:
-            outs.append(model.__getattribute__(o)[t]() )
-        except:
-            outs.append(model.__getattribute__(o)[t] )
-    print( fmt.format(*([t]+outs)) )
-
-plt.plot([mt for mt in model.T], [mx() for mx in model.x.values()], \
-        [mt for mt in model.T], [mx for mx in model.X_in.values()], \
-        [0, model.nt()], [model.X0(), model.X0()], 'r--')
-plt.show()
\ No newline at end of file
+import argparse, os, sys, time
+import numpy as np
+import pandas as pd
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SIZING = os.path.join(HERE, '..', 'Sizing')
+sys.path.insert(0, SIZING)
+
+import matrix
+import optimize
+import rolling
+from benders import PENALTY
+
+# column blocks whose first hour is acted on
+SETPOINTS = ['Pgrid', 'chargeP', 'dischargeP', 'P_electrolyzer', 'P_fcell', 'P_unserved', 'P_excess']
+
+
+def ahead(values, hours):
+    """The first hours of a forecast, its last value held when it is short"""
+    values = np.asarray(values, dtype=float)[:hours]
+    return np.pad(values, (0, hours - len(values)), mode='edge')
+
+
+class Dispatcher():
+    """ Receding-horizon dispatch of a fixed plant: unit counts (n_smr,
+    n_wind, n_solar) plus the battery and hydrogen system of args. The
+    dispatch LP of the next horizon hours is built once. Every hour the new
+    forecast and the measured storage state move its row bounds, a grid
+    price forecast its costs, and HiGHS re-solves the model it holds from
+    the last basis. Only the first hour of each plan is acted on """
+
+    def __init__(self, args, counts, params=None, horizon=24, n_h2sys=100, tee=False):
+        params = dict(optimize.DEFAULTS, **(params or {}))
+        self.smr, self.wind, self.solar, prices, battery, hydrogen = optimize.setup(args, params)
+        self.args = args
+        self.counts = counts
+        self.horizon = horizon
+        self.tee = tee
+
+        # storage state before the coming hour, measured or else as planned
+        self.state = {}
+        if args.battery:
+            self.state['SOC'] = battery.INITIAL_CAPACITY
+        if args.hydrogen:
+            self.state['SOP'] = n_h2sys * hydrogen.MAX_STORAGE_CAPACITY / 2
+
+        # unserved demand at the Benders penalty keeps every hour feasible
+        zeros = np.zeros(horizon)
+        self.lp = matrix.build(args, zeros, zeros, zeros, self.smr, self.wind, self.solar, prices, battery, hydrogen,
+            params['gridpower'], n_h2sys, counts=counts, initial=self.state, shortfall=PENALTY)
+
+    def step(self, demand, wind_p, solar_p, soc=None, sop=None, grid=None):
+        """ Set-points for the coming hour. demand (kW) and the wind and
+        solar capacity factors forecast the next horizon hours, soc and sop
+        are the measured storage state and grid an hourly price forecast;
+        what is not given stays as before. Returns the set-points with the
+        planned state after the hour and the cost of the plan """
+
+        n_smr, n_wind, n_solar = self.counts
+        fixed = (n_smr * self.smr.capacity + n_wind * self.wind.capacity * ahead(wind_p, self.horizon)
+                 + n_solar * self.solar.capacity * ahead(solar_p, self.horizon))
+        for name, value in (('SOC', soc), ('SOP', sop)):
+            if value is not None and name in self.state:
+                self.state[name] = value
+
+        rolling.shift(self.lp, fixed - ahead(demand, self.horizon), self.state)
+        if grid is not None:
+            self.lp.price('Pgrid', ahead(grid, self.horizon))
+
+        solution = self.lp.solve(tee=self.tee, solver=self.args.solver, warm=True)
+        if solution.status != 'optimal':
+            raise RuntimeError("Dispatch from state %s: %s" % (self.state, solution.status))
+
+        setpoints = {name: float(getattr(solution, name)[0]) for name in SETPOINTS if name in self.lp.columns}
+        for name in self.state:
+            self.state[name] = setpoints[name] = float(getattr(solution, name)[0])
+        setpoints['cost'] = solution.objective
+        return setpoints
+
+
+def replay(dispatcher, demand, wind_p, solar_p, grid=None, hours=None, noise=0.0, seed=0):
+    """ Feeds a year to the dispatcher hour by hour. The forecast is the
+    actual series of the next hours, wrapping around the year end, with
+    wind and solar errors growing as the square root of the lead time; the
+    measured state is the planned one. Returns the set-points as arrays
+    and the latency of every step in seconds """
+
+    demand, wind_p, solar_p = (np.asarray(x, dtype=float) for x in (demand, wind_p, solar_p))
+    nt = len(demand)
+    hours = hours or nt
+    rng = np.random.default_rng(seed)
+    error = noise * np.sqrt(np.arange(dispatcher.horizon))
+
+    def window(series, t, spread=None):
+        values = np.take(series, np.arange(t, t + dispatcher.horizon), mode='wrap')
+        if spread is not None and noise:
+            values = np.clip(values + spread * rng.standard_normal(dispatcher.horizon), 0, 1)
+        return values
+
+    latency = np.empty(hours)
+    steps = []
+    for t in range(hours):
+        start = time.perf_counter()
+        steps.append(dispatcher.step(window(demand, t), window(wind_p, t, error), window(solar_p, t, error),
+                                     grid=None if grid is None else window(grid, t)))
+        latency[t] = time.perf_counter() - start
+
+    return {name: np.array([s[name] for s in steps]) for name in steps[0]}, latency
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Replays a year of RPG.csv through the receding-horizon dispatcher')
+    parser.add_argument("--hydrogen", action="store_true", help="Adds hydrogen system")
+    parser.add_argument("--battery", action="store_true", help="Adds batteries")
+    parser.add_argument("--units", type=int, nargs=3, default=[4, 40, 100], metavar=("N_SMR", "N_WIND", "N_SOLAR"))
+    parser.add_argument("--horizon", type=int, default=24, help="Hours planned ahead at every step")
+    parser.add_argument("--hours", type=int, default=None, help="Hours replayed (default: the whole year)")
+    parser.add_argument("--noise", type=float, default=0.0,
+        help="Spread of the wind and solar forecast error one hour ahead, in capacity factor")
+    parser.add_argument("--solver", default=None, help="Solver backend (default: HiGHS if installed, else GLPK)")
+    parser.add_argument("--output", default=None, help="Writes the hourly set-points to this CSV")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    demand_hourly, wind_p, solar_p = optimize.load_data(SIZING)
+    dispatcher = Dispatcher(args, args.units, horizon=args.horizon)
+    built = time.perf_counter()
+    setpoints, latency = replay(dispatcher, demand_hourly, wind_p, solar_p, hours=args.hours, noise=args.noise)
+    done = time.perf_counter()
+
+    print("load and build %6.2f s, %d hours replayed in %6.2f s, horizon %d h" % (built - start, len(latency),
+                                                                                  done - built, args.horizon))
+    print("latency ms: mean %7.2f  p50 %7.2f  p95 %7.2f  p99 %7.2f  max %7.2f" % (
+        1e3 * latency.mean(), *(1e3 * np.percentile(latency, [50, 95, 99, 100]))))
+    for name in SETPOINTS:
+        if name in setpoints:
+            print("%-15s %16.1f kWh" % (name, setpoints[name].sum()))
+
+    if args.output:
+        pd.DataFrame(setpoints).to_csv(args.output)
@@ -0,0 +1,191 @@
+import argparse, json, os, platform, resource, shutil, subprocess, tempfile, time
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import numpy as np
+import pandas as pd
+
+import optimize
+import extract
+import matrix
+from common import CACHE
+from solvers import Solver
+
+SIZES = [24, 168, 720, 8760, 3 * 8760]
+COMBOS = [(False, False), (True, False), (False, True), (True, True)]
+BUILDERS = ['rules', 'matrix']
+
+
+def synthetic(directory, hours, seed=0):
+    """ Writes RPG.csv, COSB_daily.csv and tuk1.csv of the given length with
+    the shapes of the real inputs: a seasonal daily demand spread by a fixed
+    day profile, autocorrelated wind and clear-sky solar with clouds """
+
+    rng = np.random.default_rng(seed)
+    days = -(-hours // 24)
+    day = np.arange(days)
+    hour = np.arange(days * 24)
+
+    demand = 5e6 * (1 + 0.15 * np.cos(2 * np.pi * day / 365)) * (1 + 0.05 * rng.standard_normal(days))
+    profile = 4000 + 1500 * np.sin(np.pi * np.clip(np.arange(24) - 6, 0, 12) / 12)
+
+    wind = np.empty(len(hour))
+    wind[0] = 0.4
+    shocks = 0.08 * rng.standard_normal(len(hour))
+    for t in range(1, len(hour)):
+        wind[t] = 0.4 + 0.95 * (wind[t - 1] - 0.4) + shocks[t]
+    wind = np.clip(wind, 0, 1)
+
+    daylight = np.clip(np.sin(np.pi * ((hour % 24) - 6) / 12), 0, None)
+    season = 0.75 + 0.25 * np.cos(2 * np.pi * (hour / 24 - 172) / 365)
+    clouds = np.repeat(rng.uniform(0.3, 1, days), 24)
+    solar = daylight * season * clouds
+
+    os.makedirs(directory, exist_ok=True)
+    pd.DataFrame({'solar': solar[:hours], 'wind': wind[:hours]}).to_csv(os.path.join(directory, 'RPG.csv'))
+    pd.DataFrame({'Demand': demand}).to_csv(os.path.join(directory, 'COSB_daily.csv'), index=False)
+    pd.DataFrame({'HR': ['%02d:00' % h for h in range(24)], 'Demand': profile}).to_csv(
+        os.path.join(directory, 'tuk1.csv'), index=False)
+
+
+def timed(component, phases, phase):
+    """Records the time spent in the constraints() of a storage component"""
+
+    constraints = component.constraints
+
+    def wrapper(model, period):
+        start = time.perf_counter()
+        result = constraints(model, period)
+        phases[phase] = time.perf_counter() - start
+        return result
+
+    component.constraints = wrapper
+
+
+def case(directory, builder, battery, hydrogen, solver=None):
+    """One benchmark run, in a process of its own so peak RSS is its own"""
+
+    args = optimize.parser().parse_args([])
+    args.battery, args.hydrogen, args.solver = battery, hydrogen, solver
+    params = optimize.DEFAULTS.copy()
+    phases = {}
+    row = {'builder': builder, 'battery': battery, 'hydrogen': hydrogen}
+
+    try:
+        # parsing the csv files, then reading them back from the column cache
+        shutil.rmtree(os.path.join(directory, CACHE), ignore_errors=True)
+        start = time.perf_counter()
+        optimize.load_data(directory)
+        phases['load'] = time.perf_counter() - start
+        start = time.perf_counter()
+        data = optimize.load_data(directory)
+        demand_hourly, wind_p, solar_p = data
+        phases['reload'] = time.perf_counter() - start
+        row['hours'] = len(demand_hourly)
+
+        smr, wind, solar, prices, battery, hydrogen = optimize.setup(args, params)
+        windP = wind_p * wind.capacity
+        solarP = solar_p * solar.capacity
+
+        start = time.perf_counter()
+        if builder == 'matrix':
+            lp = matrix.build(args, demand_hourly, windP, solarP, smr, wind, solar, prices, battery, hydrogen,
+                params['gridpower'])
+        else:
+            if battery:
+                timed(battery, phases, 'battery')
+            if hydrogen:
+                timed(hydrogen, phases, 'hydrogen')
+            model = optimize.build_model(args, demand_hourly.tolist(), windP.tolist(), solarP.tolist(), smr, wind,
+                solar, prices, battery, hydrogen, params['gridpower'])
+        phases['build'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        if builder == 'matrix':
+            model = results = lp.solve(solver=solver)
+        else:
+            results = Solver(solver).solve(model)
+        phases['solve'] = time.perf_counter() - start
+        row['status'] = optimize.status(results)
+
+        # hourly results as main writes them, then the KPIs
+        start = time.perf_counter()
+        extract.frame(args, model, params, data)
+        row['kpis'] = optimize.kpis(args, model, params, data)
+        phases['extract'] = time.perf_counter() - start
+    except Exception as e:
+        row['status'] = 'error: %s' % e
+
+    row['phases'] = phases
+    row['peak_rss_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return row
+
+
+def commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run(sizes, combos, builders, solver=None, seed=0):
+    report = {'commit': commit(), 'date': time.strftime('%Y-%m-%dT%H:%M:%S'), 'python': platform.python_version(),
+              'machine': platform.machine(), 'solver': solver or Solver().name, 'results': []}
+
+    context = multiprocessing.get_context('spawn')
+    with tempfile.TemporaryDirectory() as tmp:
+        for hours in sizes:
+            directory = os.path.join(tmp, str(hours))
+            synthetic(directory, hours, seed)
+            for builder in builders:
+                for battery, hydrogen in combos:
+                    with ProcessPoolExecutor(1, mp_context=context) as pool:
+                        row = pool.submit(case, directory, builder, battery, hydrogen, solver).result()
+                    report['results'].append(row)
+                    print("%-6s %6d h battery=%-5s hydrogen=%-5s %-8s %s rss %.0f MB" % (builder, hours, battery,
+                        hydrogen, row['status'], ' '.join('%s %.3f s' % item for item in row['phases'].items()),
+                        row['peak_rss_mb']))
+
+    return report
+
+
+def compare(base, head):
+    """Phase time ratios of head over base for the cases both ran"""
+
+    def key(row):
+        return row['builder'], row.get('hours'), row['battery'], row['hydrogen']
+
+    old = {key(row): row for row in base['results']}
+    print("%s -> %s" % (base['commit'], head['commit']))
+    for row in head['results']:
+        before = old.get(key(row))
+        if before is None:
+            continue
+        ratios = ['%s x%.2f' % (phase, value / before['phases'][phase])
+                  for phase, value in row['phases'].items() if before['phases'].get(phase)]
+        rss = row['peak_rss_mb'] / before['peak_rss_mb']
+        print("%-6s %6s h battery=%-5s hydrogen=%-5s %s rss x%.2f" % (key(row) + (' '.join(ratios), rss)))
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Times data load, model build, solve and result extraction')
+    parser.add_argument("--sizes", type=int, nargs='+', default=SIZES, help="Horizons in hours")
+    parser.add_argument("--builders", nargs='+', default=BUILDERS, choices=BUILDERS)
+    parser.add_argument("--storage", nargs='+', default=None, choices=['none', 'battery', 'hydrogen', 'both'],
+        help="Storage combinations (default: all)")
+    parser.add_argument("--solver", default=None)
+    parser.add_argument("--output", default='benchmark.json', help="Machine readable results")
+    parser.add_argument("--compare", default=None, metavar="BASE", help="Earlier results to compare the new ones with")
+    args = parser.parse_args()
+
+    names = {'none': (False, False), 'battery': (True, False), 'hydrogen': (False, True), 'both': (True, True)}
+    combos = [names[name] for name in args.storage] if args.storage else COMBOS
+
+    report = run(args.sizes, combos, args.builders, args.solver)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=1, default=float)
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report)
@@ -0,0 +1,227 @@
+import itertools, time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+import matrix
+from rolling import STATES
+
+MONTH_DAYS = [31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31]
+# cost per kWh of unserved demand, and per unit of a missed boundary state,
+# high enough that neither is used when the counts can avoid it
+PENALTY = 1e4
+# master costs in millions, keeping its cut coefficients in range
+SCALE = 1e-6
+COUNTS = ['n_smr', 'n_wind', 'n_solar']
+BOUNDS = {'n_smr': (1, 5), 'n_wind': (1, 100), 'n_solar': (100, 200000)}
+
+
+def periods(nt, length='month'):
+    """Edges of the dispatch subproblems: calendar months, weeks or a number of hours"""
+
+    if length == 'month':
+        sizes = itertools.cycle([24 * days for days in MONTH_DAYS])
+    elif length == 'week':
+        sizes = itertools.repeat(168)
+    else:
+        sizes = itertools.repeat(int(length))
+
+    edges = [0]
+    while edges[-1] < nt:
+        edges.append(min(nt, edges[-1] + next(sizes)))
+    return edges
+
+
+class Subproblem():
+    """ Dispatch LP of hours [start, end) for the unit counts and boundary
+    storage states of the master. All of them only move row bounds, so the
+    LP is built once and re-solved warm. The row duals give the slope of
+    its cost in every master variable """
+
+    def __init__(self, setup, start, end, first, last):
+        args, demand, windP, solarP, smr, wind, solar, prices, battery, hydrogen, gridpower, n_h2sys = setup
+        self.smr = smr
+        self.solver = args.solver
+        self.demand = demand[start:end]
+        self.windP = windP[start:end]
+        self.solarP = solarP[start:end]
+        self.states = [name for name, on in (('SOC', args.battery), ('SOP', args.hydrogen)) if on]
+        self.first, self.last = first, last
+
+        initial = None if first else {name: 0.0 for name in self.states}
+        lp = matrix.build(args, self.demand, self.windP, self.solarP, smr, wind, solar, prices, battery, hydrogen,
+            gridpower, n_h2sys, counts=(0, 0, 0), initial=initial, shortfall=PENALTY)
+        if not last:
+            # state after the last hour, met up to penalized slacks
+            for name in self.states:
+                lp.var(name + '_over', scalar=True, lb=0)
+                lp.var(name + '_under', scalar=True, lb=0)
+                lp.cost(name + '_over', PENALTY)
+                lp.cost(name + '_under', PENALTY)
+                lp.add(name + '_end', [(name, 1, [lp.nt - 1]), (name + '_over', -1), (name + '_under', 1)],
+                    lb=0, ub=0, nrows=1)
+        self.lp = lp
+
+    def solve(self, counts, start, end):
+        """Cost of the period and its slope in the counts and in the start and
+        end states. start and end map state names to values"""
+
+        lp = self.lp
+        coefs = [np.full(lp.nt, self.smr.capacity), self.windP, self.solarP]
+        balance = sum(n * coef for n, coef in zip(counts, coefs)) - self.demand
+        lp.bound('pexcesC', balance, balance)
+        lp.bound('demandC', lb=-balance)
+        for name in self.states:
+            if not self.first:
+                rhs = np.zeros(lp.nt)
+                rhs[0] = start[name]
+                lp.bound(STATES[name], rhs, rhs)
+            if not self.last:
+                lp.bound(name + '_end', end[name], end[name])
+
+        solution = lp.solve(solver=self.solver, warm=True)
+        if solution.status != 'optimal':
+            raise RuntimeError("Dispatch subproblem: %s" % solution.status)
+
+        # counts move pexcesC up and the demandC lower bound down
+        duals = solution.duals
+        slope = {name: duals['pexcesC'] @ coef - duals['demandC'] @ coef for name, coef in zip(COUNTS, coefs)}
+        for name in self.states:
+            slope[name + '_start'] = 0.0 if self.first else duals[STATES[name]][0]
+            slope[name + '_end'] = 0.0 if self.last else duals[name + '_end'][0]
+
+        return solution, slope
+
+
+# per worker: the model data and the subproblems built so far
+_setup = None
+_subproblems = {}
+
+
+def _init(setup):
+    global _setup
+    _setup = setup
+
+
+def _solve(k, edges, counts, start, end, values=False):
+    if k not in _subproblems:
+        _subproblems[k] = Subproblem(_setup, edges[k], edges[k + 1], k == 0, k == len(edges) - 2)
+    solution, slope = _subproblems[k].solve(counts, start, end)
+    hourly = None
+    if values:
+        lp = _subproblems[k].lp
+        hourly = {name: getattr(solution, name) for name, (col, size) in lp.columns.items() if size == lp.nt}
+
+    return solution.objective, slope, hourly
+
+
+def decompose(args, demand_hourly, windP, solarP, smr, wind, solar, prices, battery=None, hydrogen=None,
+              gridpower=40000, n_h2sys=100, length='month', workers=None, gap=1e-4, iterations=200):
+    """ Benders decomposition of the sizing problem. The master MILP holds
+    the unit counts, the storage states between periods and one cost
+    estimate per period; the period dispatch LPs are solved in parallel and
+    each adds an optimality cut per period. Stops when the master bound is
+    within gap of the best solution found, and returns that solution """
+
+    if not (args.battery or args.hydrogen):
+        raise ValueError("Benders decomposition needs storage (--battery or --hydrogen)")
+
+    demand = np.asarray(demand_hourly, dtype=float)
+    windP = np.asarray(windP, dtype=float)
+    solarP = np.asarray(solarP, dtype=float)
+    nt = len(demand)
+    edges = periods(nt, length)
+    P = len(edges) - 1
+
+    # per storage state: bounds, initial value and largest rise and fall per hour
+    states = {}
+    if args.battery:
+        power = battery.MAX_BATTERY_POWER/2
+        states['SOC'] = (battery.MAX_BATTERY_CAPACITY/2, battery.MAX_BATTERY_CAPACITY, battery.INITIAL_CAPACITY,
+                         power * battery.EFFICIENCY, power / battery.EFFICIENCY)
+    if args.hydrogen:
+        storeCap = n_h2sys * hydrogen.MAX_STORAGE_CAPACITY
+        sop_rate = (hydrogen.R_H2 * hydrogen.TEMP / (n_h2sys * hydrogen.TANK_VOLUME)) / hydrogen.LHV
+        states['SOP'] = (0, storeCap, storeCap/2, sop_rate * hydrogen.eff_SOEC * n_h2sys * hydrogen.ELECTROLYSER_POWER,
+                         sop_rate / hydrogen.eff_fcell * n_h2sys * hydrogen.FUEL_CELL_POWER)
+
+    # generation cost per unit over the whole horizon, paid in the master
+    energy = {'n_smr': smr.lcoe * smr.capacity * nt, 'n_wind': wind.lcoe * windP.sum(),
+              'n_solar': solar.lcoe * solarP.sum()}
+
+    if P < 2:
+        raise ValueError("Benders decomposition needs at least two periods")
+    hours = np.diff(edges)
+
+    master = matrix.LinearProgram(P)
+    for name in COUNTS:
+        master.var(name, scalar=True, lb=BOUNDS[name][0], ub=BOUNDS[name][1], integer=True)
+        master.cost(name, SCALE * energy[name])
+    for name, (low, high, initial, rise, fall) in states.items():
+        # change of the state from its initial value by the start of periods 1..P-1,
+        # no faster than the storage can charge or discharge
+        master.var(name, size=P - 1, lb=low - initial, ub=high - initial)
+        master.add(name + '_ramp', [(name, 1), (name, -1, -1)], lb=-fall * hours[:-1], ub=rise * hours[:-1], nrows=P - 1)
+    master.var('theta')
+    master.cost('theta', 1.0)
+
+    # start from the largest plant, which leaves no demand unserved
+    counts = [BOUNDS[name][1] for name in COUNTS]
+    boundary = {name: np.zeros(P - 1) for name in states}
+
+    setup = (args, demand, windP, solarP, smr, wind, solar, prices, battery, hydrogen, gridpower, n_h2sys)
+    print("Benders: %d periods, %d workers" % (P, workers or 0))
+    print("%5s %16s %16s %10s %9s" % ('iter', 'lower bound', 'upper bound', 'gap', 'time'))
+    lower, upper, best = -np.inf, np.inf, None
+    begin = time.perf_counter()
+    with ProcessPoolExecutor(workers, initializer=_init, initargs=(setup,)) as pool:
+        for it in range(iterations):
+            futures = [pool.submit(_solve, k, edges, counts,
+                {name: states[name][2] + value[k - 1] for name, value in boundary.items()} if k > 0 else None,
+                {name: states[name][2] + value[k] for name, value in boundary.items()} if k < P - 1 else None)
+                for k in range(P)]
+            results = [future.result() for future in futures]
+
+            cost = np.array([objective for objective, slope, hourly in results])
+            total = sum(n * energy[name] for name, n in zip(COUNTS, counts)) + cost.sum()
+            if total < upper:
+                upper, best = total, (list(counts), {name: value.copy() for name, value in boundary.items()})
+
+            # theta[k] >= cost[k] + slope[k] . (y - y_k), in master units
+            slopes = {key: SCALE * np.array([slope[key] for objective, slope, hourly in results]) for key in results[0][1]}
+            terms = [('theta', 1, np.arange(P))] + [(name, -slopes[name]) for name in COUNTS]
+            rhs = SCALE * cost - sum(slopes[name] * n for name, n in zip(COUNTS, counts))
+            for name, value in boundary.items():
+                terms += [(name, -slopes[name + '_start'], np.arange(P) - 1), (name, -slopes[name + '_end'], np.arange(P))]
+                rhs -= slopes[name + '_start'] * np.concatenate([[0], value])
+                rhs -= slopes[name + '_end'] * np.concatenate([value, [0]])
+            master.add('cut_%d' % it, terms, lb=rhs, nrows=P)
+
+            solution = master.solve(solver=args.solver)
+            if solution.status != 'optimal':
+                raise RuntimeError("Benders master: %s" % solution.status)
+            lower = solution.objective / SCALE
+            counts = [int(round(getattr(solution, name))) for name in COUNTS]
+            boundary = {name: np.atleast_1d(getattr(solution, name)) for name in states}
+
+            print("%5d %16.2f %16.2f %9.4f%% %8.2f s" % (it + 1, lower, upper,
+                100 * (upper - lower) / abs(upper), time.perf_counter() - begin))
+            if upper - lower <= gap * abs(upper):
+                break
+        else:
+            print("Benders: no convergence in %d iterations" % iterations)
+
+        # dispatch of the best counts, period by period
+        counts, boundary = best
+        futures = [pool.submit(_solve, k, edges, counts,
+            {name: states[name][2] + value[k - 1] for name, value in boundary.items()} if k > 0 else None,
+            {name: states[name][2] + value[k] for name, value in boundary.items()} if k < P - 1 else None, True)
+            for k in range(P)]
+        results = [future.result() for future in futures]
+
+    values = {name: np.concatenate([hourly[name] for objective, slope, hourly in results]) for name in results[0][2]}
+    values.update(zip(COUNTS, counts))
+    unserved = values['P_unserved'].sum()
+    if unserved > 1.0:
+        print("Benders: %.2f kWh of demand left unserved" % unserved)
+
+    return matrix.Solution(values, 'optimal', upper)
@@ -0,0 +1,196 @@
+import copy
+import numpy as np
+
+HOURS = 24
+
+
+class RepresentativeDays():
+    """ Typical days picked by k-medoids over the daily (demand, wind, solar)
+    profiles. The reduced model only dispatches the medoid days, weighted by
+    the number of calendar days each one stands for, while storage state is
+    chained through every calendar day of the year """
+
+    def __init__(self, k, seed=0, iterations=100):
+        self.k = k
+        self.seed = seed
+        self.iterations = iterations
+
+    def fit(self, demand, wind, solar):
+        profiles = [np.asarray(series, dtype=float).reshape(-1, HOURS) for series in (demand, wind, solar)]
+        # each series scaled to its peak so that none dominates the distance
+        features = np.hstack([p / (np.abs(p).max() or 1.0) for p in profiles])
+        ndays = len(features)
+        if not 0 < self.k <= ndays:
+            raise ValueError("Number of representative days must be between 1 and %d" % ndays)
+
+        sq = (features ** 2).sum(axis=1)
+        dist = np.sqrt(np.maximum(sq[:, None] + sq[None, :] - 2 * features @ features.T, 0))
+
+        # k-means++ seeding, then alternate assignment and medoid update
+        rng = np.random.default_rng(self.seed)
+        medoids = [int(rng.integers(ndays))]
+        for _ in range(1, self.k):
+            d = dist[:, medoids].min(axis=1) ** 2
+            medoids.append(int(rng.choice(ndays, p=d / d.sum())) if d.sum() > 0 else int(rng.integers(ndays)))
+
+        for _ in range(self.iterations):
+            assign = dist[:, medoids].argmin(axis=1)
+            update = []
+            for cluster, medoid in enumerate(medoids):
+                members = np.flatnonzero(assign == cluster)
+                if len(members) == 0:
+                    update.append(medoid)
+                    continue
+                update.append(int(members[dist[np.ix_(members, members)].sum(axis=1).argmin()]))
+            if update == medoids:
+                break
+            medoids = update
+
+        self.ndays = ndays
+        self.medoids = np.array(medoids)
+        self.assign = dist[:, medoids].argmin(axis=1)
+        self.weights = np.bincount(self.assign, minlength=self.k)
+
+        return self
+
+    def reduce(self, series):
+        """Hourly series of the medoid days, one day after the other"""
+        return np.asarray(series, dtype=float).reshape(-1, HOURS)[self.medoids].ravel()
+
+    def expand(self, series):
+        """Calendar year series rebuilt from a reduced one"""
+        return np.asarray(series, dtype=float).reshape(-1, HOURS)[self.assign].ravel()
+
+    def hourly_weights(self):
+        return np.repeat(self.weights, HOURS).astype(float)
+
+    def error(self, series):
+        """RMSE of the reduced representation relative to the series mean"""
+        series = np.asarray(series, dtype=float)
+        rmse = np.sqrt(np.mean((self.expand(self.reduce(series)) - series) ** 2))
+        return rmse / abs(series.mean()) if series.mean() else rmse
+
+    def day_starts(self, nt):
+        """1 for hours chained to the previous hour, 0 at each day start"""
+        return np.where(np.arange(nt) % HOURS == 0, 0.0, 1.0)
+
+    def link(self, lp, name, initial, lower=None, upper=None):
+        """ Chains a storage state through the calendar year. lp[name] holds
+        the change since the start of the representative day; name_day the
+        absolute state at the start of every calendar day and name_low /
+        name_high its envelope over the days of each cluster. Returns the
+        terms that bound the absolute hourly state from above and below """
+
+        ndays = self.ndays
+        days = np.arange(ndays)
+        cluster = np.repeat(np.arange(self.k), HOURS)
+
+        lp.var(name + '_day', size=ndays + 1)
+        lp.var(name + '_low', size=self.k)
+        lp.var(name + '_high', size=self.k)
+
+        lp.add(name + '_first', [(name + '_day', 1, [0])], lb=initial, ub=initial, nrows=1)
+        # state at the start of the next day = start state + change over the medoid day
+        lp.add(name + '_link', [(name + '_day', 1, days + 1), (name + '_day', -1, days),
+            (name, -1, self.assign * HOURS + HOURS - 1)], lb=0, ub=0, nrows=ndays)
+        lp.add(name + '_lowC', [(name + '_day', 1, days), (name + '_low', -1, self.assign)], lb=0, nrows=ndays)
+        lp.add(name + '_highC', [(name + '_day', 1, days), (name + '_high', -1, self.assign)], ub=0, nrows=ndays)
+
+        above = [(name, 1), (name + '_high', 1, cluster)]
+        below = [(name, 1), (name + '_low', 1, cluster)]
+        if lower is not None:
+            lp.add(name + '_min', below, lb=lower)
+        if upper is not None:
+            lp.add(name + '_max', above, ub=upper)
+
+        return above, below
+
+    def unfold(self, lp, solution):
+        """Maps a reduced solution back onto the calendar year"""
+
+        full = copy.copy(solution)
+        for name, (start, size) in lp.columns.items():
+            if size != lp.nt:
+                continue
+            hourly = self.expand(getattr(solution, name))
+            if name + '_day' in lp.columns:
+                hourly = hourly + np.repeat(getattr(solution, name + '_day')[:-1], HOURS)
+            setattr(full, name, hourly)
+
+        return full
+
+
+class Segments():
+    """ Runs of similar consecutive hours merged into segments of variable
+    length, each dispatched once at the mean of its hours and weighted by
+    its duration. A segment ends before the hour that would move any of the
+    (demand, wind, solar) profiles, scaled to their peaks, further than
+    max_error from the segment mean. Storage state is kept at segment ends
+    and charges for the whole duration; power being constant within a
+    segment, the hourly state in between is linear and stays within the
+    bounds of its ends """
+
+    # column blocks that are states at the segment ends, not segment means
+    STATES = ('SOC', 'SOP')
+
+    def __init__(self, max_error):
+        self.max_error = max_error
+
+    def fit(self, demand, wind, solar):
+        profiles = [np.asarray(series, dtype=float) for series in (demand, wind, solar)]
+        features = np.vstack([p / (np.abs(p).max() or 1.0) for p in profiles]).T
+        nt = len(features)
+
+        # the first hour stays alone, the storage state before it is pinned
+        starts = [0]
+        if nt > 1:
+            starts.append(1)
+            total, low, high, size = features[1].copy(), features[1].copy(), features[1].copy(), 1
+            for t in range(2, nt):
+                x = features[t]
+                mean = (total + x) / (size + 1)
+                lo, hi = np.minimum(low, x), np.maximum(high, x)
+                if np.max(np.maximum(hi - mean, mean - lo)) > self.max_error:
+                    starts.append(t)
+                    total, low, high, size = x.copy(), x.copy(), x.copy(), 1
+                else:
+                    total, low, high, size = total + x, lo, hi, size + 1
+
+        self.nt = nt
+        self.starts = np.array(starts)
+        self.durations = np.diff(np.append(self.starts, nt)).astype(float)
+        self.assign = np.repeat(np.arange(len(starts)), self.durations.astype(int))
+
+        return self
+
+    def reduce(self, series):
+        """Mean of every segment"""
+        return np.add.reduceat(np.asarray(series, dtype=float), self.starts) / self.durations
+
+    def expand(self, series):
+        """Hourly series rebuilt from a reduced one"""
+        return np.asarray(series, dtype=float)[self.assign]
+
+    def hourly_weights(self):
+        return self.durations
+
+    def error(self, series):
+        """RMSE of the reduced representation relative to the series mean"""
+        series = np.asarray(series, dtype=float)
+        rmse = np.sqrt(np.mean((self.expand(self.reduce(series)) - series) ** 2))
+        return rmse / abs(series.mean()) if series.mean() else rmse
+
+    def unfold(self, lp, solution):
+        """ Maps a reduced solution back onto every hour: powers are held
+        over their segment, states interpolated between segment ends """
+
+        full = copy.copy(solution)
+        ends = np.cumsum(self.durations) - 1
+        for name, (start, size) in lp.columns.items():
+            if size != lp.nt:
+                continue
+            value = getattr(solution, name)
+            hourly = np.interp(np.arange(self.nt), ends, value) if name in self.STATES else self.expand(value)
+            setattr(full, name, hourly)
+
+        return full
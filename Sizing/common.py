@@ -1,5 +1,11 @@
+import hashlib, json, os, shutil, tempfile
+import numpy as np
 import pandas as pd
 
+# Parsed inputs are kept next to them in this directory, one .npy per column
+CACHE = '.datacache'
+
+
 class Unit():
 
     def __int__(self, capacity, eff, lcoe):
@@ -8,32 +14,130 @@ class Unit():
         self.lcoe = lcoe
 class Data():
 
-    def __int__(self, filename):
+    def __init__(self, filename=None, sheet=None):
         self.filename = filename
+        self.sheet = sheet
 
     @staticmethod
-    def read(filename):
-        df = pd.read_csv(filename)
+    def read(filename, sheet=None):
+        if filename.endswith(('.xlsx', '.xls')):
+            df = pd.read_excel(filename, sheet_name=sheet or 0)
+        else:
+            df = pd.read_csv(filename)
 
         return df
 
+    @staticmethod
+    def digest(filename):
+        sha = hashlib.sha1()
+        with open(filename, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                sha.update(chunk)
+        return sha.hexdigest()
+
+    def cachedir(self):
+        head, tail = os.path.split(os.path.abspath(self.filename))
+        if self.sheet:
+            tail += '.' + self.sheet
+        return os.path.join(head, CACHE, tail)
+
+    @staticmethod
+    def _publish(meta, cache):
+        """Replaces meta.json whole, readers see the old or the new one"""
+
+        fd, tmp = tempfile.mkstemp(dir=cache)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp, os.path.join(cache, 'meta.json'))
+
+    def _valid(self, cache):
+        """Cache metadata if it still matches the source file. A changed mtime
+        alone only triggers a hash check, not a reparse"""
+
+        try:
+            with open(os.path.join(cache, 'meta.json')) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        stat = os.stat(self.filename)
+        if meta['size'] != stat.st_size or not os.path.isdir(os.path.join(cache, meta['sha1'])):
+            return None
+        if meta['mtime'] != stat.st_mtime_ns:
+            if meta['sha1'] != self.digest(self.filename):
+                return None
+            meta['mtime'] = stat.st_mtime_ns
+            self._publish(meta, cache)
+
+        return meta
+
+    def _convert(self, cache):
+        """ Parses the source once and writes every column as a .npy file,
+        in a directory named by the content hash. A finished directory is
+        never changed or removed, so processes converting and reading at
+        the same time only ever see whole ones """
+
+        stat = os.stat(self.filename)
+        meta = {'source': os.path.basename(self.filename), 'sheet': self.sheet, 'size': stat.st_size,
+                'mtime': stat.st_mtime_ns, 'sha1': self.digest(self.filename), 'columns': {}}
+        target = os.path.join(cache, meta['sha1'])
+
+        os.makedirs(cache, exist_ok=True)
+        if os.path.isdir(target):
+            # another process converted the same content first
+            with open(os.path.join(target, 'meta.json')) as f:
+                meta['columns'] = json.load(f)['columns']
+            self._publish(meta, cache)
+            return meta
+
+        df = self.read(self.filename, self.sheet)
+        tmp = tempfile.mkdtemp(dir=cache)
+        for i, name in enumerate(df.columns):
+            values = df[name].to_numpy()
+            if values.dtype.kind not in 'biuf':
+                # text and dates as fixed width strings so they stay mappable
+                values = values.astype(str)
+            np.save(os.path.join(tmp, '%d.npy' % i), values, allow_pickle=False)
+            meta['columns'][str(name)] = '%d.npy' % i
+        with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+            json.dump(meta, f)
+
+        # published with one rename; when another process got there first
+        # its directory holds the same columns and ours is dropped
+        try:
+            os.rename(tmp, target)
+        except OSError:
+            shutil.rmtree(tmp, ignore_errors=True)
+        self._publish(meta, cache)
+
+        return meta
+
+    def columns(self, *names):
+        """Columns of the file as read-only memory-mapped arrays, all of them
+        when no names are given. The file is parsed once into a columnar
+        cache and parsed again only when its content changes"""
+
+        cache = self.cachedir()
+        meta = self._valid(cache) or self._convert(cache)
+        names = names or list(meta['columns'])
+        missing = [name for name in names if name not in meta['columns']]
+        if missing:
+            raise KeyError("%s has no column %s" % (self.filename, ', '.join(missing)))
+
+        return {name: np.load(os.path.join(cache, meta['sha1'], meta['columns'][name]), mmap_mode='r')
+                for name in names}
+
     def daily(self, parameter):
-        df = self.read(self.filename)
 
-        return df[parameter].tolist()
+        return self.columns(parameter)[parameter]
 
     hourly = daily
 
     def profile(self, demandlist):
-        """Normizing according to sum since norm hour value will be 
+        """Normizing according to sum since norm hour value will be
         multiplied by daily total consumption"""
 
-        normlist = [float(i)/sum(demandlist) for i in demandlist]
+        demand = np.asarray(demandlist, dtype=float)
+        normlist = demand / demand.sum()
 
         return normlist
-
-
-
-
-
-
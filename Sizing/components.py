@@ -1,3 +1,4 @@
+import numpy as np
 import pyomo.environ as pe
 
 class Battery():
@@ -64,6 +65,42 @@ class Battery():
 
         return constraintlist
 
+    def blocks(self, lp, days=None, initial=None):
+        """ Sparse counterpart of constraints(), adding the SOC column and
+        the same row blocks to a matrix.LinearProgram. With representative
+        days SOC is the change within the day and the absolute state is
+        chained through the calendar year by days.link. With
+        clustering.Segments SOC is the state at the end of each segment and
+        energy moves for the whole segment duration. An initial state given
+        here is the SOC before the first hour, which then charges and
+        discharges like any other """
+
+        # hours a row stands for, more than one in merged segments
+        hours = getattr(days, 'durations', 1.0)
+        if days is None or hasattr(days, 'durations'):
+            first = np.arange(lp.nt) == 0
+            step = flow = np.where(first, 0.0, 1.0)
+            if initial is not None:
+                flow = 1.0
+            flow = flow * hours
+            initial = np.where(first, self.INITIAL_CAPACITY if initial is None else initial, 0.0)
+            lp.var('SOC', lb=self.MIN_BATTERY_CAPACITY, ub=self.MAX_BATTERY_CAPACITY)
+            above = below = [('SOC', 1)]
+        else:
+            step, flow, initial = days.day_starts(lp.nt), 1.0, 0.0
+            lp.var('SOC')
+            above, below = days.link(lp, 'SOC', self.INITIAL_CAPACITY, self.MIN_BATTERY_CAPACITY, self.MAX_BATTERY_CAPACITY)
+
+        lp.add('chargingLimit_cons', [('chargeP', 1)], ub=self.MAX_BATTERY_POWER/2)
+        lp.add('dischargingLimit_cons', [('dischargeP', 1)], ub=self.MAX_BATTERY_POWER/2)
+        lp.add('over_charge', [('chargeP', hours)] + above, ub=self.MAX_BATTERY_CAPACITY)
+        lp.add('over_discharge', [('dischargeP', hours)] + [(var, -self.EFFICIENCY * coef, *index) for var, coef, *index in below], ub=0)
+        lp.add('SOC_limit', below, lb=self.MAX_BATTERY_CAPACITY/2)
+        # SOC[0] is pinned to the initial capacity (zero change at each day
+        # start with representative days), later hours follow SOC[t-1]
+        lp.add('SOC_constraint', [('SOC', 1), ('SOC', -step, -1), ('chargeP', -self.EFFICIENCY * flow),
+            ('dischargeP', flow / self.EFFICIENCY)], lb=initial, ub=initial)
+
 
 
 class Hydrogen():
@@ -148,4 +185,42 @@ class Hydrogen():
         model.hydrogenSysC = pe.Constraint(period, rule = hydrogen_balance)
         constraintlist.append(model.hydrogenSysC)
 
-        return constraintlist
\ No newline at end of file
+        return constraintlist
+
+    def blocks(self, lp, n_h2sys, days=None, initial=None):
+        """ Sparse counterpart of constraints(), adding the SOP column and
+        the same row blocks to a matrix.LinearProgram. With representative
+        days SOP is chained through the calendar year, with segments it
+        moves for the segment duration, and an initial state is taken before
+        the first hour, like Battery.SOC """
+
+        tank = n_h2sys * self.TANK_VOLUME
+        storeCap = n_h2sys * self.MAX_STORAGE_CAPACITY
+        # SOP -> deliverable fuel cell power
+        sop_power = self.gen(tank / (self.R_H2 * self.TEMP))
+        # electric power -> SOP change
+        sop_rate = (self.R_H2 * self.TEMP / tank) / self.LHV
+
+        lp.var('SOP')
+        hours = getattr(days, 'durations', 1.0)
+        if days is None or hasattr(days, 'durations'):
+            first = np.arange(lp.nt) == 0
+            step = flow = np.where(first, 0.0, 1.0)
+            if initial is not None:
+                flow = 1.0
+            flow = flow * hours
+            initial = np.where(first, storeCap/2 if initial is None else initial, 0.0)
+            above = below = [('SOP', 1)]
+        else:
+            step, flow, initial = days.day_starts(lp.nt), 1.0, 0.0
+            above, below = days.link(lp, 'SOP', storeCap/2)
+
+        lp.add('hydrogenChaC', [('M_electrolyzer', 1), ('P_electrolyzer', -self.mdot(1.0))], lb=0, ub=0)
+        lp.add('discharge', [('P_fcell', hours)] + [(var, -sop_power * coef, *index) for var, coef, *index in below], ub=0)
+        lp.add('charge', [('P_electrolyzer', hours)] + [(var, sop_power * coef, *index) for var, coef, *index in above],
+            ub=storeCap * sop_power)
+        lp.add('ChaC', [('P_electrolyzer', 1), ('P_excess', -1)], ub=0)
+        lp.add('genC', [('P_electrolyzer', 1)], ub=n_h2sys * self.ELECTROLYSER_POWER)
+        lp.add('fcellC', [('P_fcell', 1)], ub=n_h2sys * self.FUEL_CELL_POWER)
+        lp.add('hydrogenSysC', [('SOP', 1), ('SOP', -step, -1), ('P_electrolyzer', -sop_rate * self.eff_SOEC * flow),
+            ('P_fcell', sop_rate / self.eff_fcell * flow)], lb=initial, ub=initial)
@@ -0,0 +1,94 @@
+import json, os
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+
+def values(model, name):
+    """ A whole model variable at once: an hourly array for indexed pyomo
+    Vars and matrix.Solution blocks, a float for scalars, None if the model
+    has no such variable """
+
+    component = getattr(model, name, None)
+    if component is None:
+        return None
+    if isinstance(component, np.ndarray):
+        return component.astype(float, copy=False)
+    if hasattr(component, 'is_indexed') and component.is_indexed():
+        return np.fromiter((np.nan if v.value is None else v.value for v in component.values()),
+                           dtype=float, count=len(component))
+    if hasattr(component, 'value'):
+        return float(component.value)
+    return float(component)
+
+
+def frame(args, model, params, data):
+    """Hourly results of a solved run, the columns of Results.csv"""
+
+    demand_hourly, wind_p, solar_p = data
+    nt = len(demand_hourly)
+    zeros = np.zeros(nt)
+
+    table = {'Nuclear': np.full(nt, values(model, 'n_smr') * params['smr_capacity']),
+             'Wind': values(model, 'n_wind') * np.asarray(wind_p) * params['wind_capacity'],
+             'Solar': values(model, 'n_solar') * np.asarray(solar_p) * params['solar_capacity'],
+             'Grid': values(model, 'Pgrid')}
+    battery_gen = values(model, 'dischargeP') if args.battery else zeros
+    table['TotalGEN'] = table['Nuclear'] + table['Wind'] + table['Solar'] + table['Grid'] + battery_gen
+    table['Demand'] = np.asarray(demand_hourly, dtype=float)
+
+    if args.hydrogen:
+        table['Hydrogen'] = values(model, 'P_fcell')
+        table['M_Electrolyzer'] = values(model, 'M_electrolyzer')
+        table['P_Electrolyzer'] = values(model, 'P_electrolyzer')
+        table['SOP'] = values(model, 'SOP')
+    if args.battery:
+        table['Battery Power'] = battery_gen
+        table['Battery Charge'] = values(model, 'chargeP')
+        table['SOC'] = values(model, 'SOC')
+
+    return pd.DataFrame(table)
+
+
+def write(df, filename, meta=None):
+    """ Writes the results by extension: .csv as text, .parquet through
+    pyarrow and .h5/.hdf5 through PyTables, the last two with float64
+    columns and the run metadata stored alongside the table """
+
+    meta = meta or {}
+    ext = os.path.splitext(filename)[1].lower()
+    typed = df.astype(float).rename_axis('hour')
+
+    if ext == '.parquet':
+        if pyarrow is None:
+            raise ImportError("Parquet output needs pyarrow")
+        table = pyarrow.Table.from_pandas(typed)
+        table = table.replace_schema_metadata(dict(table.schema.metadata or {}, sizing=json.dumps(meta, default=str)))
+        pyarrow.parquet.write_table(table, filename)
+    elif ext in ('.h5', '.hdf5'):
+        with pd.HDFStore(filename, 'w') as store:
+            store.put('results', typed, format='table')
+            store.get_storer('results').attrs.metadata = json.dumps(meta, default=str)
+    else:
+        df.to_csv(filename)
+
+
+def read(filename):
+    """Results table and run metadata written by write()"""
+
+    ext = os.path.splitext(filename)[1].lower()
+    if ext == '.parquet':
+        if pyarrow is None:
+            raise ImportError("Parquet input needs pyarrow")
+        table = pyarrow.parquet.read_table(filename)
+        meta = json.loads((table.schema.metadata or {}).get(b'sizing', b'{}'))
+        return table.to_pandas(), meta
+    if ext in ('.h5', '.hdf5'):
+        with pd.HDFStore(filename, 'r') as store:
+            return store['results'], json.loads(getattr(store.get_storer('results').attrs, 'metadata', '{}'))
+    return pd.read_csv(filename, index_col=0), {}
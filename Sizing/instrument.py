@@ -0,0 +1,95 @@
+import cProfile, json, os, pstats, resource, time, tracemalloc
+from contextlib import contextmanager
+
+
+def rss():
+    """Resident set size of this process in MB, None where /proc is missing"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+    except (OSError, ValueError):
+        return None
+
+
+def peak_rss():
+    """Largest resident set size so far in MB (ru_maxrss is in kB on Linux)"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def highs_stats(h):
+    """Effort statistics of the last run of a highspy.Highs instance"""
+
+    info = h.getInfo()
+    return {'solver': 'highs', 'status': h.modelStatusToString(h.getModelStatus()),
+            'nodes': int(info.mip_node_count), 'simplex_iterations': int(info.simplex_iteration_count),
+            'ipm_iterations': int(info.ipm_iteration_count), 'mip_gap': float(info.mip_gap),
+            'time': float(h.getRunTime())}
+
+
+def incumbents(h):
+    """ Collects (running time, objective) of every improving MIP solution
+    a highspy.Highs instance finds, in the returned list. Older highspy
+    without the callback events leaves it empty """
+
+    found = []
+    if hasattr(h, 'cbMipImprovingSolution'):
+        h.cbMipImprovingSolution.subscribe(
+            lambda event: found.append((event.data_out.running_time, event.data_out.objective_function_value)))
+    return found
+
+
+class RunReport():
+    """ Wall and CPU time, memory and solver statistics of the stages of a
+    run, written as one JSON document. With profile, the whole run is also
+    captured by cProfile and tracemalloc """
+
+    def __init__(self, profile=False, top=25):
+        self.profile = profile
+        self.top = top
+        self.meta = {'started': time.strftime('%Y-%m-%dT%H:%M:%S')}
+        self.stages = []
+        self.solver = {}
+        self.profiler = None
+        if profile:
+            tracemalloc.start()
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+
+    @contextmanager
+    def stage(self, name):
+        """Times the block and records memory after it"""
+
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            entry = {'name': name, 'wall': time.perf_counter() - wall, 'cpu': time.process_time() - cpu,
+                     'rss_mb': rss(), 'peak_rss_mb': peak_rss()}
+            if tracemalloc.is_tracing():
+                current, peak = tracemalloc.get_traced_memory()
+                entry['traced_mb'], entry['traced_peak_mb'] = current / 2**20, peak / 2**20
+            self.stages.append(entry)
+
+    def write(self, filename):
+        """Writes the report; with profile also the raw cProfile dump next to it"""
+
+        report = {'meta': self.meta, 'stages': self.stages, 'solver': self.solver,
+                  'total': {'wall': sum(s['wall'] for s in self.stages), 'peak_rss_mb': peak_rss()}}
+
+        if self.profiler is not None:
+            self.profiler.disable()
+            self.profiler.dump_stats(os.path.splitext(filename)[0] + '.prof')
+            stats = pstats.Stats(self.profiler)
+            report['profile'] = [
+                {'function': '%s:%d(%s)' % func, 'calls': calls, 'tottime': tottime, 'cumtime': cumtime}
+                for func, (cc, calls, tottime, cumtime, callers) in
+                sorted(stats.stats.items(), key=lambda item: -item[1][3])[:self.top]]
+            snapshot = tracemalloc.take_snapshot()
+            report['allocations'] = [{'line': str(stat.traceback), 'size_mb': stat.size / 2**20, 'count': stat.count}
+                                     for stat in snapshot.statistics('lineno')[:self.top]]
+            tracemalloc.stop()
+
+        with open(filename, 'w') as f:
+            json.dump(report, f, indent=1, default=str)
@@ -0,0 +1,462 @@
+import math, os, shutil, subprocess, tempfile, time
+import numpy as np
+import scipy.sparse as sp
+
+from instrument import highs_stats, incumbents
+
+try:
+    import highspy
+except ImportError:
+    highspy = None
+
+
+class LinearProgram():
+    """ Sparse LP/MILP assembled from NumPy arrays. Columns are grouped in
+    named blocks (one entry per hour, a single scalar or any fixed size) and
+    rows are added one block at a time, so no Python callback runs per hour """
+
+    def __init__(self, nt):
+        self.nt = nt
+        self.ncols = 0
+        self.columns = {}   # name -> (start, size)
+        self.lb, self.ub, self.integer, self.c = [], [], [], []
+        self.rows = {}      # name -> (A, lb, ub)
+        self.highs = None   # HiGHS instance of the last in-memory solve
+        self.found = None   # its improving MIP solutions, (time, objective)
+
+    def var(self, name, scalar=False, lb=-np.inf, ub=np.inf, integer=False, size=None):
+        size = 1 if scalar else size or self.nt
+        self.columns[name] = (self.ncols, size)
+        self.ncols += size
+        self.lb.append(np.full(size, lb, dtype=float))
+        self.ub.append(np.full(size, ub, dtype=float))
+        self.integer.append(np.full(size, integer))
+        self.c.append(np.zeros(size))
+
+    def cost(self, name, coef):
+        """Adds coef to the objective coefficients of a column block"""
+        block = list(self.columns).index(name)
+        self.c[block] = self.c[block] + coef
+
+    def price(self, name, coef):
+        """Replaces the objective coefficients of a column block, also in the
+        loaded HiGHS model, if any"""
+        block = list(self.columns).index(name)
+        start, size = self.columns[name]
+        self.c[block] = np.broadcast_to(np.asarray(coef, dtype=float), (size,)).copy()
+        if self.highs is not None:
+            self.highs.changeColsCost(size, np.arange(start, start + size, dtype=np.int32), self.c[block])
+
+    def add(self, name, terms, lb=-np.inf, ub=np.inf, nrows=None):
+        """Adds one row per hour: lb[t] <= sum(coef[t] * var[t + lag]) <= ub[t].
+        terms are (var, coef) or (var, coef, lag) tuples; a scalar var gets
+        coef[t] in every row and lagged entries before the first hour are dropped.
+        lag may also be an array giving the position in var used by each row,
+        for row blocks of nrows that are not indexed by hour"""
+
+        nrows = nrows or self.nt
+        hours = np.arange(nrows)
+        rows, cols, vals = [], [], []
+        for term in terms:
+            var, coef = term[0], term[1]
+            lag = term[2] if len(term) > 2 else 0
+            start, size = self.columns[var]
+            coef = np.broadcast_to(np.asarray(coef, dtype=float), (nrows,))
+            if size == 1:
+                keep = hours
+                col = np.full(nrows, start)
+            else:
+                index = hours + lag if np.isscalar(lag) else np.asarray(lag)
+                keep = hours[(index >= 0) & (index < size)]
+                col = start + index[keep]
+            rows.append(keep)
+            cols.append(col)
+            vals.append(coef[keep])
+
+        A = sp.coo_matrix((np.concatenate(vals), (np.concatenate(rows), np.concatenate(cols))),
+                          shape=(nrows, self.ncols)).tocsr()
+        A.eliminate_zeros()
+        lb = np.broadcast_to(np.asarray(lb, dtype=float), (nrows,))
+        ub = np.broadcast_to(np.asarray(ub, dtype=float), (nrows,))
+        self.rows[name] = (A, lb, ub)
+
+    def total(self, name, var, coef=1.0, lb=-np.inf, ub=np.inf):
+        """Adds a single row lb <= sum(coef[t] * var[t]) <= ub over a column block"""
+
+        start, size = self.columns[var]
+        coef = np.broadcast_to(np.asarray(coef, dtype=float), (size,))
+        A = sp.csr_matrix((coef, (np.zeros(size, dtype=int), start + np.arange(size))), shape=(1, self.ncols))
+        A.eliminate_zeros()
+        self.rows[name] = (A, np.array([lb], dtype=float), np.array([ub], dtype=float))
+
+    def bound(self, name, lb=None, ub=None):
+        """Replaces the bounds of a row block, keeping its coefficients. The
+        change is also passed to the loaded HiGHS model, if any"""
+
+        A, old_lb, old_ub = self.rows[name]
+        nrows = A.shape[0]
+        lb = old_lb if lb is None else np.broadcast_to(np.asarray(lb, dtype=float), (nrows,))
+        ub = old_ub if ub is None else np.broadcast_to(np.asarray(ub, dtype=float), (nrows,))
+        self.rows[name] = (A, lb, ub)
+
+        if self.highs is not None:
+            start = 0
+            for block, (B, _, _) in self.rows.items():
+                if block == name:
+                    break
+                start += B.shape[0]
+            self.highs.changeRowsBounds(nrows, np.arange(start, start + nrows, dtype=np.int32),
+                                        np.ascontiguousarray(lb), np.ascontiguousarray(ub))
+
+    def matrix(self):
+        """Stacks every row block into one CSR matrix with its row bounds"""
+        A = sp.vstack([sp.csr_matrix(A, shape=(A.shape[0], self.ncols)) for A, _, _ in self.rows.values()], format='csr')
+        lb = np.concatenate([lb for _, lb, _ in self.rows.values()])
+        ub = np.concatenate([ub for _, _, ub in self.rows.values()])
+        return A, lb, ub
+
+    def bounds(self):
+        return np.concatenate(self.lb), np.concatenate(self.ub), np.concatenate(self.integer)
+
+    def objective(self):
+        return np.concatenate(self.c)
+
+    def names(self):
+        """Column names, block name plus hour, in column order"""
+        names = []
+        for name, (start, size) in self.columns.items():
+            names.extend([name] if size == 1 else ['%s_%d' % (name, t) for t in range(size)])
+        return names
+
+    def write(self, filename):
+        """Writes the program in free MPS format straight from the sparse
+        blocks. Rows and columns keep their order, so solver output can be
+        mapped back by position"""
+
+        colnames = self.names()
+        rownames = ['%s_%d' % (name, t) for name, (A, _, _) in self.rows.items() for t in range(A.shape[0])]
+        A, rlb, rub = self.matrix()
+        xlb, xub, integer = self.bounds()
+        c = self.objective()
+
+        # objective entry for every column keeps empty columns in the file
+        A = A.tocoo()
+        M = sp.csc_matrix((np.concatenate([c, A.data]),
+                           (np.concatenate([np.zeros(self.ncols, dtype=int), A.row + 1]),
+                            np.concatenate([np.arange(self.ncols), A.col]))),
+                          shape=(A.shape[0] + 1, self.ncols))
+        rows = ['obj'] + rownames
+        values = M.data.tolist()
+        entries = [rows[i] for i in M.indices.tolist()]
+
+        lines = ['NAME sizing', 'ROWS', ' N obj']
+        equal = rlb == rub
+        types = np.where(equal, ' E ', np.where(np.isfinite(rlb), ' G ', ' L '))
+        lines.extend([kind + name for kind, name in zip(types.tolist(), rownames)])
+
+        lines.append('COLUMNS')
+        marker = False
+        for j, name in enumerate(colnames):
+            if integer[j] != marker:
+                marker = integer[j]
+                lines.append(" M%d 'MARKER' '%s'" % (j, 'INTORG' if marker else 'INTEND'))
+            for k in range(M.indptr[j], M.indptr[j + 1]):
+                lines.append(' %s %s %r' % (name, entries[k], values[k]))
+        if marker:
+            lines.append(" M%d 'MARKER' 'INTEND'" % self.ncols)
+
+        lines.append('RHS')
+        rhs = np.where(np.isfinite(rlb), rlb, rub)
+        for name, value in zip(rownames, rhs.tolist()):
+            if value != 0 and np.isfinite(value):
+                lines.append(' rhs %s %r' % (name, value))
+
+        ranged = np.flatnonzero(~equal & np.isfinite(rlb) & np.isfinite(rub))
+        if len(ranged):
+            lines.append('RANGES')
+            for i in ranged:
+                lines.append(' rng %s %r' % (rownames[i], float(rub[i] - rlb[i])))
+
+        lines.append('BOUNDS')
+        for name, lb, ub in zip(colnames, xlb.tolist(), xub.tolist()):
+            if lb == ub:
+                lines.append(' FX bnd %s %r' % (name, lb))
+                continue
+            if math.isinf(lb) and math.isinf(ub):
+                lines.append(' FR bnd %s' % name)
+                continue
+            lines.append(' MI bnd %s' % name if math.isinf(lb) else ' LO bnd %s %r' % (name, lb))
+            lines.append(' PL bnd %s' % name if math.isinf(ub) else ' UP bnd %s %r' % (name, ub))
+        lines.append('ENDATA')
+
+        with open(filename, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+
+    def solve(self, tee=False, keepfiles=False, solver=None, warm=False, mps=None, start=None):
+        """Solves in memory with HiGHS when highspy is installed, otherwise
+        through an MPS file and glpsol. With warm, HiGHS re-solves the model
+        it already holds from the last basis, after any bound() changes,
+        and from start if given.
+        mps names an MPS file of this very program for the file-based
+        solver: glpsol reads it when it exists instead of writing the
+        program again, and it is written there when it does not. HiGHS
+        takes the program from memory, no slower than from a file, so it
+        neither reads nor writes one. start is a feasible column vector
+        HiGHS takes as its first incumbent; glpsol has no MIP start"""
+
+        if solver in ('highs', 'appsi_highs') or (solver is None and highspy is not None):
+            if warm and self.highs is not None:
+                self._start(self.highs, start)
+                solution = self._run(self.highs)
+                if solution.status == 'optimal':
+                    return solution
+                # a warm start that stalls is retried from scratch
+            solution = self._highs(tee, start)
+            if solution.status == 'Unknown':
+                # postsolve at times leaves an optimal model unclassified
+                self.highs.setOptionValue('presolve', 'off')
+                self.highs.clearSolver()
+                solution = self._run(self.highs)
+                self.highs.setOptionValue('presolve', 'choose')
+            elif solution.status == 'Solve error':
+                # an incumbent a hair outside the MIP feasibility tolerance once
+                # unscaled is rejected; it is kept at a tenfold tolerance
+                self.highs.setOptionValue('mip_feasibility_tolerance', 1e-5)
+                self.highs.clearSolver()
+                solution = self._run(self.highs)
+                self.highs.setOptionValue('mip_feasibility_tolerance', 1e-6)
+            return solution
+        if solver not in (None, 'glpk'):
+            raise ValueError("The matrix path solves with highs or glpk, not %s" % solver)
+
+        tmpdir = tempfile.mkdtemp()
+        sol = os.path.join(tmpdir, 'sizing.sol')
+        if mps is None:
+            mps = os.path.join(tmpdir, 'sizing.mps')
+            self.write(mps)
+        elif not os.path.exists(mps):
+            os.makedirs(os.path.dirname(os.path.abspath(mps)), exist_ok=True)
+            self.write(mps + '.tmp')
+            os.replace(mps + '.tmp', mps)
+        start = time.perf_counter()
+        proc = subprocess.run(['glpsol', '--freemps', mps, '--write', sol],
+            stdout=None if tee else subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+        if proc.returncode != 0:
+            raise RuntimeError("glpsol failed:\n%s" % (proc.stdout or ''))
+        solution = Solution.read(self, sol)
+        solution.stats = {'solver': 'glpk', 'status': solution.status, 'time': time.perf_counter() - start}
+        if not keepfiles:
+            shutil.rmtree(tmpdir)
+
+        return solution
+
+    def _highs(self, tee=False, start=None):
+        """Hands the CSC matrix straight to HiGHS, no files involved"""
+
+        A, rlb, rub = self.matrix()
+        A = A.tocsc()
+        xlb, xub, integer = self.bounds()
+
+        lp = highspy.HighsLp()
+        lp.num_col_ = self.ncols
+        lp.num_row_ = A.shape[0]
+        lp.col_cost_ = self.objective()
+        lp.col_lower_ = xlb
+        lp.col_upper_ = xub
+        lp.row_lower_ = rlb
+        lp.row_upper_ = rub
+        lp.a_matrix_.format_ = highspy.MatrixFormat.kColwise
+        lp.a_matrix_.start_ = A.indptr
+        lp.a_matrix_.index_ = A.indices
+        lp.a_matrix_.value_ = A.data
+        if integer.any():
+            lp.integrality_ = [highspy.HighsVarType.kInteger if i else highspy.HighsVarType.kContinuous for i in integer]
+
+        h = highspy.Highs()
+        h.setOptionValue('output_flag', bool(tee))
+        h.passModel(lp)
+        self._load(h, start)
+
+        return self._run(h)
+
+    def _load(self, h, start=None):
+        """Keeps h as the loaded model, watching for its MIP incumbents"""
+
+        self.highs = h
+        self.found = incumbents(h)
+        self._start(h, start)
+
+    @staticmethod
+    def _start(h, start=None):
+        if start is not None:
+            solution = highspy.HighsSolution()
+            solution.col_value = np.asarray(start, dtype=float).tolist()
+            solution.value_valid = True
+            h.setSolution(solution)
+
+    def _run(self, h):
+
+        del self.found[:]
+        h.run()
+
+        model_status = h.getModelStatus()
+        status = 'optimal' if model_status == highspy.HighsModelStatus.kOptimal else h.modelStatusToString(model_status)
+        info = h.getInfo()
+        x = np.array(h.getSolution().col_value) if info.primal_solution_status else np.full(self.ncols, np.nan)
+        y = np.array(h.getSolution().row_dual) if info.dual_solution_status else None
+        z = np.array(h.getSolution().col_dual) if info.dual_solution_status else None
+
+        solution = Solution.columns(self, x, status, info.objective_function_value, y, z)
+        solution.stats = highs_stats(h)
+        if self.found:
+            solution.stats.update(first_incumbent=self.found[0][0], incumbents=len(self.found))
+
+        return solution
+
+
+class Solution():
+    """ Column values of a solved LinearProgram, one attribute (float or
+    hourly array) per column block, so pe.value(solution.Pgrid[t]) reads like
+    the pyomo model. duals maps row blocks to their dual values (objective
+    change per unit of row bound) when the solver reports them, reduced
+    the reduced costs of the column blocks likewise, and stats the solver's
+    effort statistics """
+
+    def __init__(self, values, status, objective, duals=None, reduced=None):
+        self.status = status
+        self.objective = objective
+        self.duals = duals or {}
+        self.reduced = reduced or {}
+        self.stats = {}
+        for name, value in values.items():
+            setattr(self, name, value)
+
+    @classmethod
+    def columns(cls, lp, x, status, objective, y=None, z=None):
+        """Splits the column vector x, row duals y and reduced costs z into
+        the blocks of lp"""
+        values = {name: x[start] if size == 1 else x[start:start + size] for name, (start, size) in lp.columns.items()}
+        duals = {}
+        if y is not None:
+            start = 0
+            for name, (A, _, _) in lp.rows.items():
+                duals[name] = y[start:start + A.shape[0]]
+                start += A.shape[0]
+        reduced = {}
+        if z is not None:
+            reduced = {name: z[start:start + size] for name, (start, size) in lp.columns.items()}
+        return cls(values, status, objective, duals, reduced)
+
+    @classmethod
+    def read(cls, lp, filename):
+        """Parses a glpsol --write raw solution (basic, interior or mip)"""
+
+        x = np.zeros(lp.ncols)
+        z = np.zeros(lp.ncols)
+        y = np.zeros(sum(A.shape[0] for A, _, _ in lp.rows.values()))
+        status, objective, ptype = 'unknown', None, None
+        with open(filename) as f:
+            for line in f:
+                row = line.split()
+                if not row:
+                    continue
+                if row[0] == 's':
+                    ptype = row[1]
+                    if ptype == 'bas':
+                        status = 'optimal' if row[4] == 'f' and row[5] == 'f' else 'not optimal'
+                        objective = float(row[6])
+                    else:
+                        status = {'o': 'optimal', 'f': 'feasible', 'n': 'infeasible'}.get(row[4], 'unknown')
+                        objective = float(row[5])
+                elif row[0] == 'i' and ptype != 'mip':
+                    y[int(row[1]) - 1] = float(row[4] if ptype == 'bas' else row[3])
+                elif row[0] == 'j':
+                    x[int(row[1]) - 1] = float(row[3] if ptype == 'bas' else row[2])
+                    if ptype != 'mip':
+                        z[int(row[1]) - 1] = float(row[4] if ptype == 'bas' else row[3])
+
+        # a MIP solution carries no duals
+        if ptype == 'mip':
+            return cls.columns(lp, x, status, objective)
+        return cls.columns(lp, x, status, objective, y, z)
+
+    def write(self):
+        print("Solver status: %s" % self.status)
+        print("Objective: %s" % self.objective)
+
+
+def build(args, demand_hourly, windP, solarP, smr, wind, solar, prices, battery=None, hydrogen=None,
+          gridpower=40000, n_h2sys=100, days=None, counts=None, initial=None, shortfall=None):
+    """Same model as optimize.build_model, assembled as sparse row blocks.
+    Given clustering.RepresentativeDays, only the medoid days are dispatched
+    and their hourly costs weighted by the days they stand for. Fixed unit
+    counts (n_smr, n_wind, n_solar) leave a dispatch-only LP whose generation
+    sits in the row bounds, and initial gives the {'SOC', 'SOP'} storage
+    state before the first hour. With a shortfall cost, demand may go
+    unserved at that price, so any fixed counts stay feasible"""
+
+    initial = initial or {}
+
+    demand = np.asarray(demand_hourly, dtype=float)
+    windP = np.asarray(windP, dtype=float)
+    solarP = np.asarray(solarP, dtype=float)
+    if days is not None:
+        demand, windP, solarP = days.reduce(demand), days.reduce(windP), days.reduce(solarP)
+        weights = days.hourly_weights()
+    else:
+        weights = np.ones(len(demand))
+    nt = len(demand)
+
+    lp = LinearProgram(nt)
+
+    if counts is None:
+        lp.var('n_smr', scalar=True, lb=1, ub=5, integer=True)
+        lp.var('n_wind', scalar=True, lb=1, ub=100, integer=True)
+        lp.var('n_solar', scalar=True, lb=100, ub=200000, integer=True)
+
+        # sum over T of the per-hour generation cost
+        lp.cost('n_smr', weights.sum() * smr.lcoe * smr.capacity)
+        lp.cost('n_wind', wind.lcoe * (weights * windP).sum())
+        lp.cost('n_solar', solar.lcoe * (weights * solarP).sum())
+
+        generation = [('n_smr', smr.capacity), ('n_wind', windP), ('n_solar', solarP)]
+        fixed = 0.0
+    else:
+        n_smr, n_wind, n_solar = counts
+        generation = []
+        fixed = n_smr * smr.capacity + n_wind * windP + n_solar * solarP
+
+    lp.var('P_excess')
+    lp.var('Pgrid', lb=0, ub=gridpower)
+    lp.cost('Pgrid', prices['grid'] * weights)
+
+    supply = generation + [('Pgrid', 1)]
+
+    if args.battery:
+        lp.var('chargeP', lb=0)
+        lp.var('dischargeP', lb=0)
+        lp.cost('dischargeP', prices['battery'] * weights)
+        battery.blocks(lp, days, initial.get('SOC'))
+        supply += [('dischargeP', 1), ('chargeP', -1)]
+
+    if args.hydrogen:
+        lp.var('P_electrolyzer', lb=0)
+        lp.var('M_electrolyzer', lb=0)
+        lp.var('P_fcell', lb=0)
+        lp.cost('P_fcell', prices['fcell'] * weights)
+        lp.cost('M_electrolyzer', -prices['h2'] * weights)
+        hydrogen.blocks(lp, n_h2sys, days, initial.get('SOP'))
+        supply += [('P_fcell', 1), ('P_electrolyzer', -1)]
+
+    if shortfall is not None:
+        # unserved demand counts as supply, at a price nothing else pays
+        lp.var('P_unserved', lb=0)
+        lp.cost('P_unserved', shortfall * weights)
+        generation = generation + [('P_unserved', 1)]
+        supply = supply + [('P_unserved', 1)]
+
+    lp.add('pexcesC', [('P_excess', 1)] + [(var, -coef) for var, coef in supply], lb=fixed - demand, ub=fixed - demand)
+    # without storage the grid is left out of the demand balance, as in build_model
+    lp.add('demandC', supply if (args.battery or args.hydrogen) else generation, lb=demand - fixed)
+
+    return lp
@@ -0,0 +1,190 @@
+import argparse, time
+import numpy as np
+import pyomo.environ as pe
+
+import optimize
+import runcache
+import simulate
+from benders import COUNTS
+
+# absolute row and bound violation a start may have
+TOLERANCE = 1e-6
+
+
+def dispatch(args, params, data, counts, n_h2sys=100):
+    """ Greedy hourly dispatch of fixed unit counts that keeps every row of
+    the sizing model: a surplus charges the battery, then runs the
+    electrolyser on at most half of what is left (it may not exceed the
+    excess power after itself); a deficit is met by the battery, the fuel
+    cell and the grid. The storage state before the first hour is pinned,
+    as in the model. Returns every column block by name; demand left
+    unserved shows as a negative P_excess """
+
+    smr, wind, solar, prices, battery, hydrogen = optimize.setup(args, params)
+    demand_hourly, wind_p, solar_p = data
+    demand = np.asarray(demand_hourly, dtype=float)
+    n_smr, n_wind, n_solar = counts
+    net = (n_smr * smr.capacity + n_wind * wind.capacity * np.asarray(wind_p, dtype=float)
+           + n_solar * solar.capacity * np.asarray(solar_p, dtype=float) - demand).tolist()
+    nt = len(demand)
+    # the grid only counts towards demand with storage, as in build_model
+    gridpower = params['gridpower'] if (args.battery or args.hydrogen) else 0.0
+
+    columns = ['Pgrid', 'P_excess']
+    if args.battery:
+        columns += ['chargeP', 'dischargeP', 'SOC']
+        eff, limit, capacity = battery.EFFICIENCY, battery.MAX_BATTERY_POWER/2, battery.MAX_BATTERY_CAPACITY
+        soc = battery.INITIAL_CAPACITY
+    if args.hydrogen:
+        columns += ['P_electrolyzer', 'M_electrolyzer', 'P_fcell', 'SOP']
+        tank = n_h2sys * hydrogen.TANK_VOLUME
+        storeCap = n_h2sys * hydrogen.MAX_STORAGE_CAPACITY
+        sop_power = hydrogen.gen(tank / (hydrogen.R_H2 * hydrogen.TEMP))
+        sop_rate = (hydrogen.R_H2 * hydrogen.TEMP / tank) / hydrogen.LHV
+        rise, fall = sop_rate * hydrogen.eff_SOEC, sop_rate / hydrogen.eff_fcell
+        sop = storeCap/2
+    values = {name: np.zeros(nt) for name in columns}
+
+    for t in range(nt):
+        surplus, deficit = max(net[t], 0.0), max(-net[t], 0.0)
+        # the first hour moves no state, its limits are on the pinned one
+        first = t == 0
+
+        if args.battery:
+            if first:
+                charge = min(surplus, limit, capacity - soc)
+                discharge = min(deficit, limit, eff * soc)
+            else:
+                charge = min(surplus, limit, (capacity - soc) / (1 + eff))
+                discharge = min(deficit, limit, max(0.0, min(eff * (soc - capacity/2), eff * soc / 2)))
+                soc += eff * charge - discharge / eff
+            surplus -= charge
+            deficit -= discharge
+            values['chargeP'][t], values['dischargeP'][t], values['SOC'][t] = charge, discharge, soc
+
+        if args.hydrogen:
+            if first:
+                electrolyser = min(surplus / 2, n_h2sys * hydrogen.ELECTROLYSER_POWER, sop_power * (storeCap - sop))
+                fcell = min(deficit, n_h2sys * hydrogen.FUEL_CELL_POWER, sop_power * sop)
+            else:
+                electrolyser = min(surplus / 2, n_h2sys * hydrogen.ELECTROLYSER_POWER,
+                                   sop_power * (storeCap - sop) / (1 + sop_power * rise))
+                fcell = min(deficit, n_h2sys * hydrogen.FUEL_CELL_POWER, sop_power * sop / (1 + sop_power * fall))
+                sop += rise * electrolyser - fall * fcell
+            surplus -= electrolyser
+            deficit -= fcell
+            values['P_electrolyzer'][t], values['P_fcell'][t], values['SOP'][t] = electrolyser, fcell, sop
+
+        grid = min(deficit, gridpower)
+        values['Pgrid'][t] = grid
+        values['P_excess'][t] = surplus - (deficit - grid)
+
+    if args.hydrogen:
+        values['M_electrolyzer'] = hydrogen.mdot(values['P_electrolyzer'])
+    values.update(zip(COUNTS, (float(c) for c in counts)))
+    return values
+
+
+def vector(lp, values):
+    """Column vector of lp from blocks by name, blocks not given are zero"""
+
+    x = np.zeros(lp.ncols)
+    for name, (start, size) in lp.columns.items():
+        if name in values:
+            x[start:start + size] = values[name]
+    return x
+
+
+def violation(lp, x):
+    """Largest violation of the rows, bounds and integrality of lp by x"""
+
+    A, rlb, rub = lp.matrix()
+    xlb, xub, integer = lp.bounds()
+    activity = A @ x
+    return max(np.max(rlb - activity, initial=0), np.max(activity - rub, initial=0),
+               np.max(xlb - x, initial=0), np.max(x - xub, initial=0),
+               np.max(np.abs(x[integer] - np.round(x[integer])), initial=0))
+
+
+def greedy(args, params, data, lp, samples=2000, tries=20, seed=0):
+    """ Unit counts screened by simulate over random candidates, cheapest
+    first by LCOE among those serving all demand, each dispatched greedily
+    until one keeps every row of lp. Returns its blocks, or None """
+
+    result = simulate.simulate(args, params, data, simulate.sample(samples, seed))
+    served = np.flatnonzero(result['unserved'] < 1.0)
+    for i in served[np.argsort(result['lcoe'][served])][:tries]:
+        values = dispatch(args, params, data, [result[name][i] for name in COUNTS])
+        if violation(lp, vector(lp, values)) <= TOLERANCE:
+            return values
+    return None
+
+
+def incumbent(args, params, data, lp=None, stored=None):
+    """ A feasible start for the sizing MILP: the stored solution of the
+    nearest earlier run when it keeps every row, else its counts dispatched
+    greedily, else greedily screened counts. lp is the matrix model to check
+    against, built when not given. Returns the blocks by name, the column
+    vector, its objective and where it came from; None if nothing fits """
+
+    if lp is None:
+        lp = optimize.build_matrix(args, params, data)
+
+    found = []
+    if stored is not None:
+        values = runcache.vectors(stored)
+        found.append(('stored', values))
+        counts = [np.round(values[name]) for name in COUNTS]
+        found.append(('stored counts', lambda: dispatch(args, params, data, counts)))
+    found.append(('greedy', lambda: greedy(args, params, data, lp)))
+
+    for origin, values in found:
+        values = values() if callable(values) else values
+        if values is None:
+            continue
+        x = vector(lp, values)
+        if len(values.get('Pgrid', ())) == lp.nt and violation(lp, x) <= TOLERANCE:
+            return values, x, float(lp.objective() @ x), origin
+    return None
+
+
+def apply(model, values):
+    """Sets the values of a pyomo model's variables, for a warm start"""
+
+    for name, value in values.items():
+        var = getattr(model, name, None)
+        if var is None or not isinstance(var, pe.Var):
+            continue
+        if var.is_indexed():
+            var.set_values(dict(enumerate(np.asarray(value, dtype=float).tolist())))
+        else:
+            var.set_value(float(value))
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Times the sizing MILP without and with a greedy MIP start')
+    parser.add_argument("--hydrogen", action="store_true", help="Adds hydrogen system")
+    parser.add_argument("--battery", action="store_true", help="Adds batteries")
+    parser.add_argument("--hours", type=int, default=None, help="Hours of the year to size on (default: all)")
+    parser.add_argument("--solver", default=None)
+    args = parser.parse_args()
+
+    params = optimize.DEFAULTS.copy()
+    data = [np.asarray(x, dtype=float)[:args.hours] for x in optimize.load_data()]
+
+    start = time.perf_counter()
+    found = incumbent(args, params, data)
+    if found is None:
+        raise SystemExit("No feasible start found")
+    values, x, objective, origin = found
+    print("start (%s) counts %s objective %14.2f in %5.3f s" % (
+        origin, [int(values[name]) for name in COUNTS], objective, time.perf_counter() - start))
+
+    print("%-10s %16s %16s %12s %14s" % ('start', 'first incumbent', 'its objective', 'solve s', 'objective'))
+    for name, x0 in [('none', None), (origin, x)]:
+        lp = optimize.build_matrix(args, params, data)
+        solution = lp.solve(solver=args.solver, start=x0)
+        first = lp.found[0] if lp.found else (np.nan, np.nan)
+        print("%-10s %14.3f s %16.2f %12.3f %14.2f" % (name, first[0], first[1], solution.stats.get('time', np.nan),
+                                                       solution.objective))
@@ -1,68 +1,28 @@
 import argparse
 import pyomo.environ as pe
-import matplotlib.pyplot as plt
-import pandas as pd
+import numpy as np
 from components import Hydrogen, Battery
 from common import Data, Unit
-import os, sys
-
-
-def main(args):
-
-    smr = Unit()
-    wind = Unit()
-    solar = Unit()
-
-    if args.hydrogen:
-        storageCap = 3e6 #3e6 # 30 bar
-        eff_SOEC = 0.83
-        eff_fcell = 0.60
-        hydrogen = Hydrogen(storageCap, eff_SOEC, eff_fcell)
-    
-    if args.battery:
-        battery = Battery()
-
-    smr.capacity = 77000  # kW
-    wind.capacity = 2000  # kW
-    solar.capacity = 1 # kW
-
-    smr.lcoe = 64.00e-3  # $/kW
-    wind.lcoe = 36.93e-3  # $/kW
-    solar.lcoe = 30.43e-3  # $/kW
-
-    gridPrice = 0.14 # $/kW
-    batterylcoe = 0.1 # (0.15) $/kW
-    fcprice = 0.2
-    h2price = 8  
-
-    profile = Data()
-    demand = Data()
-    rpg = Data()
-
-    demand.filename = 'COSB_daily.csv'
-    rpg.filename = 'RPG.csv'
-    
-    wind_p = rpg.hourly('wind')
-    solar_p = rpg.hourly('solar')
-
-    windP = [i * wind.capacity for i in wind_p]
-    solarP = [i * solar.capacity for i in solar_p]
-
-    # Hourly demand profile taken from a day in GEBZE OSB
-    profile.filename = 'tuk1.csv'
-
-    profileList = profile.hourly('Demand')
-    normlist = profile.profile(profileList)
-
-    demand_daily = demand.daily('Demand')
-
-    demand_aday, demand_hourly = [], []
-    for aday in demand_daily:
-        demand_aday =  [hour * aday for hour in normlist]
-        demand_hourly.extend(demand_aday)
-
-
-    C = [smr.lcoe * smr.capacity, wind.lcoe * wind.capacity, solar.lcoe * solar.capacity]
+import matrix
+import rolling
+import benders
+import stochastic
+from clustering import RepresentativeDays, Segments
+from solvers import Solver
+from instrument import RunReport
+import extract
+import runcache
+import mipstart
+import presolve
+import pareto
+import sensitivity
+import portfolio
+import os, sys, time
+
+
+def build_model(args, demand_hourly, windP, solarP, smr, wind, solar, prices, battery=None, hydrogen=None,
+                gridpower=40000, n_h2sys=100):
+    """Builds the sizing model with one pyomo rule call per hour"""
 
     # Create a model
     model = pe.ConcreteModel()
@@ -71,11 +31,20 @@ def main(args):
     model.nt = pe.Param(initialize=len(demand_hourly))
     model.T = pe.Set(initialize=range(model.nt()))
 
-    # Assign parameter values
-    model.Demand = pe.Param(model.T, initialize=demand_hourly)
-    model.WindP = pe.Param(model.T, initialize=windP)
-    model.SolarP = pe.Param(model.T, initialize=solarP)
-    model.smrP = pe.Param(initialize=smr.capacity)
+    # Assign parameter values, mutable so update() can change them in place
+    model.Demand = pe.Param(model.T, initialize=demand_hourly, mutable=True)
+    model.WindP = pe.Param(model.T, initialize=windP, mutable=True)
+    model.SolarP = pe.Param(model.T, initialize=solarP, mutable=True)
+    model.smrP = pe.Param(initialize=smr.capacity, mutable=True)
+
+    model.smrLcoe = pe.Param(initialize=smr.lcoe, mutable=True)
+    model.windLcoe = pe.Param(initialize=wind.lcoe, mutable=True)
+    model.solarLcoe = pe.Param(initialize=solar.lcoe, mutable=True)
+    model.gridPrice = pe.Param(initialize=prices['grid'], mutable=True)
+    model.batteryLcoe = pe.Param(initialize=prices['battery'], mutable=True)
+    model.fcPrice = pe.Param(initialize=prices['fcell'], mutable=True)
+    model.h2Price = pe.Param(initialize=prices['h2'], mutable=True)
+    model.gridpower = pe.Param(initialize=gridpower, mutable=True)
 
     model.P_excess = pe.Var(model.T, domain=pe.Reals)
     # model.power_gen = pe.Var(model.T, domain=pe.NonNegativeReals)
@@ -94,14 +63,24 @@ def main(args):
     model.n_wind = pe.Var(within=pe.PositiveIntegers,  initialize = 10, bounds=[1, 100])
     model.n_solar = pe.Var(within=pe.PositiveIntegers, initialize = 1000, bounds=[100, 200000])
 
-    model.n_h2sys = pe.Param(initialize=100)
+    model.n_h2sys = pe.Param(initialize=n_h2sys)
+
+    model.Pgrid = pe.Var(model.T, initialize=0, bounds=(0, model.gridpower))
 
-    gridpower = 40000
-    model.Pgrid = pe.Var(model.T, initialize=0, bounds=[0,gridpower])
+    # storage terms only for the storage that is modelled
+    def storage(model, t):
+        power, cost = 0, 0
+        if args.battery:
+            power += model.dischargeP[t] - model.chargeP[t]
+            cost += model.batteryLcoe * model.dischargeP[t]
+        if args.hydrogen:
+            power += model.P_fcell[t] - model.P_electrolyzer[t]
+            cost += (model.fcPrice * model.P_fcell[t]) - (model.h2Price * model.M_electrolyzer[t])
+        return power, cost
 
     def objFunc(model): 
-        return sum((smr.lcoe * model.n_smr* model.smrP) + (wind.lcoe*model.n_wind*model.WindP[t]) + (solar.lcoe*model.n_solar*model.SolarP[t]
-            + (gridPrice * model.Pgrid[t]) + (batterylcoe * model.dischargeP[t]) + (fcprice * model.P_fcell[t]) - (h2price * model.M_electrolyzer[t])) for t in model.T)  
+        return sum((model.smrLcoe * model.n_smr* model.smrP) + (model.windLcoe*model.n_wind*model.WindP[t]) + (model.solarLcoe*model.n_solar*model.SolarP[t]
+            + (model.gridPrice * model.Pgrid[t]) + storage(model, t)[1]) for t in model.T)  
 
     model.OBJ = pe.Objective(sense=pe.minimize, expr=objFunc)
 
@@ -120,22 +99,383 @@ def main(args):
         hydrogenCs = [cons for cons in hydrogen.constraints(model, model.T)]
         batteryCs = [cons for cons in battery.constraints(model, model.T)]
 
+    elif args.hydrogen:
+        def provide_demand(model, t):
+            return (model.n_smr * model.smrP + model.n_wind * model.WindP[t] + model.n_solar * model.SolarP[t] +
+                model.Pgrid[t] + model.P_fcell[t] - model.P_electrolyzer[t]) >= model.Demand[t]
+        hydrogenCs = [cons for cons in hydrogen.constraints(model, model.T)]
+
     else:
         def provide_demand(model, t):
             return (model.n_smr * model.smrP + model.n_wind * model.WindP[t] + model.n_solar * model.SolarP[t]) >= model.Demand[t]
 
     def p_excess(model,t):
-        return model.P_excess[t] == model.n_smr * model.smrP + model.n_wind * model.WindP[t] + model.n_solar * model.SolarP[t] + model.dischargeP[t] - model.chargeP[t] + model.Pgrid[t] + model.P_fcell[t] -model.P_electrolyzer[t] - model.Demand[t]
+        return model.P_excess[t] == model.n_smr * model.smrP + model.n_wind * model.WindP[t] + model.n_solar * model.SolarP[t] + model.Pgrid[t] + storage(model, t)[0] - model.Demand[t]
     model.pexcesC = pe.Constraint(model.T, rule= p_excess)
 
 
     model.demandC = pe.Constraint(model.T, rule= provide_demand)
 
+    return model
+
+
+def update(args, model, params, data):
+    """Pushes new prices, capacities and profiles into the mutable Params of
+    a build_model model, so it can be solved again without a rebuild"""
+
+    demand_hourly, wind_p, solar_p = data
+
+    model.Demand.store_values(dict(enumerate(np.asarray(demand_hourly, dtype=float).tolist())))
+    model.WindP.store_values(dict(enumerate((np.asarray(wind_p) * params['wind_capacity']).tolist())))
+    model.SolarP.store_values(dict(enumerate((np.asarray(solar_p) * params['solar_capacity']).tolist())))
+    model.smrP.set_value(params['smr_capacity'])
+
+    model.smrLcoe.set_value(params['smr_lcoe'])
+    model.windLcoe.set_value(params['wind_lcoe'])
+    model.solarLcoe.set_value(params['solar_lcoe'])
+    model.gridPrice.set_value(params['gridPrice'])
+    model.batteryLcoe.set_value(params['batterylcoe'])
+    model.fcPrice.set_value(params['fcprice'])
+    model.h2Price.set_value(params['h2price'])
+    model.gridpower.set_value(params['gridpower'])
+
+    if args.hydrogen:
+        model.storeCap.set_value(pe.value(model.n_h2sys) * params['storageCap'])
+
+
+# Inputs of a sizing run, sweep.py varies them by name
+DEFAULTS = {
+    'smr_capacity': 77000,  # kW
+    'wind_capacity': 2000,  # kW
+    'solar_capacity': 1,  # kW
+    'smr_lcoe': 64.00e-3,  # $/kW
+    'wind_lcoe': 36.93e-3,  # $/kW
+    'solar_lcoe': 30.43e-3,  # $/kW
+    'gridPrice': 0.14,  # $/kW
+    'batterylcoe': 0.1,  # (0.15) $/kW
+    'fcprice': 0.2,
+    'h2price': 8,
+    'storageCap': 3e6,  # 30 bar
+    'eff_SOEC': 0.83,
+    'eff_fcell': 0.60,
+    'gridpower': 40000,  # kW
+}
+
+# DEFAULTS that update() can change on a built model, the rest need a rebuild
+MUTABLE = {'smr_capacity', 'wind_capacity', 'solar_capacity', 'smr_lcoe', 'wind_lcoe', 'solar_lcoe',
+           'gridPrice', 'batterylcoe', 'fcprice', 'h2price', 'storageCap', 'gridpower'}
+
+
+def load_data(directory='', report=None):
+    """Hourly demand and wind/solar capacity factors of the sizing year"""
+
+    report = report or RunReport()
+
+    with report.stage('parse'):
+        demand = Data(os.path.join(directory, 'COSB_daily.csv'))
+        rpg = Data(os.path.join(directory, 'RPG.csv'))
+
+        rpgColumns = rpg.columns('wind', 'solar')
+        wind_p = rpgColumns['wind']
+        solar_p = rpgColumns['solar']
+
+        # Hourly demand profile taken from a day in GEBZE OSB
+        profile = Data(os.path.join(directory, 'tuk1.csv'))
+
+        profileList = profile.hourly('Demand')
+        demand_daily = demand.daily('Demand')
+
+    with report.stage('demand'):
+        normlist = profile.profile(profileList)
+
+        # each day's total spread over the hours by the profile
+        demand_hourly = np.outer(demand_daily, normlist).ravel()
+
+    return demand_hourly, wind_p, solar_p
+
+
+def setup(args, params):
+    """Units, prices and storage components of a run"""
+
+    smr = Unit()
+    wind = Unit()
+    solar = Unit()
+
+    battery = hydrogen = None
+    if args.hydrogen:
+        hydrogen = Hydrogen(params['storageCap'], params['eff_SOEC'], params['eff_fcell'])
+    
+    if args.battery:
+        battery = Battery()
+
+    smr.capacity = params['smr_capacity']
+    wind.capacity = params['wind_capacity']
+    solar.capacity = params['solar_capacity']
+
+    smr.lcoe = params['smr_lcoe']
+    wind.lcoe = params['wind_lcoe']
+    solar.lcoe = params['solar_lcoe']
+
+    prices = {'grid': params['gridPrice'], 'battery': params['batterylcoe'], 'fcell': params['fcprice'], 'h2': params['h2price']}
+
+    return smr, wind, solar, prices, battery, hydrogen
+
+
+def build_matrix(args, params, data, **kwargs):
+    """matrix.build on the inputs of a run"""
+
+    smr, wind, solar, prices, battery, hydrogen = setup(args, params)
+    demand_hourly, wind_p, solar_p = data
+    return matrix.build(args, demand_hourly, np.asarray(wind_p) * wind.capacity, np.asarray(solar_p) * solar.capacity,
+                        smr, wind, solar, prices, battery, hydrogen, params['gridpower'], **kwargs)
+
+
+def solve(args, params, data, tee=False, model=None, solver=None, report=None, cache=None):
+    """Builds and solves one sizing run. Returns the model, or the solution
+    arrays standing in for it on the matrix path, and the solver results.
+    A model returned by an earlier rule-based run is updated in place and
+    solved again by the same persistent solver instead of being rebuilt.
+    Stage times and solver statistics go to report. With a RunCache a run
+    of the same inputs returns its stored solution, and the same model under
+    glpk reads the MPS file an earlier glpk run stored instead of writing it
+    again; HiGHS runs write no file"""
+
+    report = report or RunReport()
+    # a Pareto front is many runs, not one to store
+    if cache is None or args.pareto:
+        return _solve(args, params, data, tee, model, solver, report)
+
+    components = setup(args, params)
+    key = runcache.model_key(args, params, data, components[:3] + components[4:])
+    run = runcache.run_key(key, args)
+    report.meta['cache'] = {'key': run, 'hit': False}
+    stored = cache.get(run)
+    if stored is not None:
+        report.meta['cache']['hit'] = True
+        report.solver = stored.stats
+        print("Stored run %s" % run[:12])
+        return stored, stored
+
+    inputs = runcache.inputs(args, params, data)
+    stored = cache.nearest(inputs) if args.mip_start == 'stored' else None
+    model, results = _solve(args, params, data, tee, model, solver, report, mps=cache.mps(key), stored=stored)
+    if status(results) == 'optimal':
+        objective = results.objective if isinstance(results, matrix.Solution) else pe.value(model.OBJ)
+        cache.put(run, model, 'optimal', objective, report.solver, inputs)
+    return model, results
+
+
+def _solve(args, params, data, tee, model, solver, report, mps=None, stored=None):
+
+    smr, wind, solar, prices, battery, hydrogen = setup(args, params)
+    demand_hourly, wind_p, solar_p = data
+    gridpower = params['gridpower']
+
+    windP = wind_p * wind.capacity
+    solarP = solar_p * solar.capacity
+
+    days = None
+    if args.representative_days:
+        days = RepresentativeDays(args.representative_days).fit(demand_hourly, windP, solarP)
+        print("Representative days: %s (weights %s)" % (days.medoids.tolist(), days.weights.tolist()))
+        print("Profile error (RMSE/mean) demand: %5.3f wind: %5.3f solar: %5.3f" % (
+            days.error(demand_hourly), days.error(windP), days.error(solarP)))
+    elif args.max_error:
+        # merged runs of similar hours take the place of representative days
+        days = Segments(args.max_error).fit(demand_hourly, windP, solarP)
+        print("Segments: %d of %d hours, longest %d h" % (len(days.durations), days.nt, days.durations.max()))
+        print("Profile error (RMSE/mean) demand: %5.3f wind: %5.3f solar: %5.3f" % (
+            days.error(demand_hourly), days.error(windP), days.error(solarP)))
+
+    if args.pareto or args.portfolio is not None:
+        # the front is swept, and solvers raced, on the sparse program
+        args = argparse.Namespace(**dict(vars(args), matrix=True))
+
+    if args.rolling:
+        if not args.units:
+            raise ValueError("--rolling dispatches fixed unit counts, given by --units")
+        start = time.perf_counter()
+        with report.stage('solve'):
+            model = results = rolling.dispatch(args, demand_hourly, windP, solarP, smr, wind, solar, prices,
+                battery, hydrogen, gridpower, counts=args.units, window=args.rolling, overlap=args.overlap)
+        print("Rolling horizon time: %5.3f s" % (time.perf_counter() - start))
+        return model, results
+
+    if args.scenarios:
+        cases = stochastic.scenarios(args.scenarios, data)
+        start = time.perf_counter()
+        with report.stage('solve'):
+            counts, expected, costs, converged = stochastic.hedge(args, cases, smr, wind, solar, prices, battery,
+                hydrogen, gridpower, rho=args.rho, workers=args.workers)
+            # dispatch of the loaded year with the hedged counts, for the post processing
+            model = results = matrix.build(args, demand_hourly, windP, solarP, smr, wind, solar, prices, battery,
+                hydrogen, gridpower, counts=counts, shortfall=benders.PENALTY).solve(solver=args.solver)
+            model.n_smr, model.n_wind, model.n_solar = counts
+            # the dispatch LP leaves out the generation cost of the counts,
+            # the run is judged by its expected cost over the scenarios
+            model.objective = expected
+        report.meta['scenarios'] = {'source': args.scenarios, 'expected_cost': expected, 'costs': costs.tolist(),
+                                    'converged': converged}
+        print("Stochastic sizing time: %5.3f s" % (time.perf_counter() - start))
+        return model, results
+
+    if args.benders:
+        start = time.perf_counter()
+        with report.stage('solve'):
+            model = results = benders.decompose(args, demand_hourly, windP, solarP, smr, wind, solar, prices,
+                battery, hydrogen, gridpower, length=args.benders, workers=args.workers, gap=args.gap)
+        print("Benders time: %5.3f s" % (time.perf_counter() - start))
+        return model, results
+
+    start = time.perf_counter()
+    with report.stage('build'):
+        if args.matrix or days:
+            lp = matrix.build(args, demand_hourly, windP, solarP, smr, wind, solar, prices,
+                battery, hydrogen, gridpower, days=days)
+        elif model is None:
+            model = build_model(args, demand_hourly.tolist(), windP.tolist(), solarP.tolist(), smr, wind, solar, prices,
+                battery, hydrogen, gridpower)
+        else:
+            update(args, model, params, data)
+    print("Model build time: %5.3f s" % (time.perf_counter() - start))
+
+    # a feasible incumbent for the sizing MILP, before branch-and-bound
+    begin = found = None
+    if args.mip_start and not days and not args.pareto:
+        start = time.perf_counter()
+        with report.stage('start'):
+            found = mipstart.incumbent(args, params, data, lp if args.matrix else None, stored)
+        if found is None:
+            print("No feasible MIP start found")
+        else:
+            values, begin, objective, origin = found
+            if not args.matrix:
+                mipstart.apply(model, values)
+            report.meta['mip_start'] = {'origin': origin, 'objective': objective,
+                                        'time': time.perf_counter() - start}
+            print("MIP start (%s): objective %5.2f, found in %5.3f s" % (origin, objective,
+                                                                         time.perf_counter() - start))
+
+    # bounds from the data, and an incumbent if there is one, then the rows they make redundant
+    if args.presolve and not days and not args.pareto:
+        start = time.perf_counter()
+        with report.stage('presolve'):
+            reduction = presolve.tighten(args, params, data, upper=found[2] if found else None)
+            (rows, nonzeros), (rows_after, nonzeros_after) = reduction.reduce(
+                lp if args.matrix else build_matrix(args, params, data))
+            if not args.matrix:
+                reduction.apply(model)
+        for line in reduction.log:
+            print("Presolve: " + line)
+        print("Presolve: dropped %s; rows %d -> %d, nonzeros %d -> %d in %5.3f s" % (
+            ', '.join(reduction.dropped) or 'no rows', rows, rows_after, nonzeros, nonzeros_after,
+            time.perf_counter() - start))
+        report.meta['presolve'] = {'bounds': reduction.log, 'dropped': reduction.dropped, 'rows': [rows, rows_after],
+                                   'nonzeros': [nonzeros, nonzeros_after]}
+        if found and not reduction.admits(found[0]):
+            print("MIP start is outside the presolved bounds, not used")
+            begin = None
+
     # ------ solve and print out results
     # solver setup
-    solver = pe.SolverFactory('glpk')
-    
-    results = solver.solve(model, tee = True)
+    start = time.perf_counter()
+    with report.stage('solve'):
+        if args.matrix or days:
+            # solution arrays stand in for the model in the post processing
+            if args.pareto:
+                # the cheapest end of the front stands for the run
+                found, results = pareto.front(lp, args.pareto, days.hourly_weights() if days else None,
+                                              solver = args.solver, workers = args.workers)
+            elif args.portfolio is not None:
+                results = portfolio.race(lp, args.portfolio, args.deadline, begin, portfolio.configuration(args, lp))
+            else:
+                results = lp.solve(tee = tee, solver = args.solver, mps = mps, start = begin)
+            model = results
+            report.solver = results.stats
+            if days:
+                model = days.unfold(lp, model)
+        else:
+            solver = solver or Solver(args.solver)
+        
+            results = solver.solve(model, tee = tee, warmstart = begin is not None)
+            report.solver = solver.stats(results)
+    print("Solve time: %5.3f s" % (time.perf_counter() - start))
+    if args.pareto:
+        front = pareto.table(found, np.sum(demand_hourly))
+        filename = os.path.splitext(args.output)[0] + '_pareto.csv'
+        front.to_csv(filename, index=False)
+        report.meta['pareto'] = {'file': filename, 'points': front.to_dict('records')}
+        print("Pareto front of cost against grid import (%.2f kg CO2/kWh), written to %s" % (pareto.GRID_CO2, filename))
+        print(front.to_string(index=False, float_format=lambda x: '%.4g' % x if abs(x) < 1 else '%.1f' % x))
+    for entry in report.solver.get('race', []):
+        print("Portfolio %-18s %-22s %8.3f s%s" % (entry['solver'], entry['status'], entry['time'],
+                                                    ' *' if entry['winner'] else ''))
+    if 'first_incumbent' in report.solver:
+        print("First incumbent after %5.3f s" % report.solver['first_incumbent'])
+
+    if days and args.compare:
+        start = time.perf_counter()
+        full = matrix.build(args, demand_hourly, windP, solarP, smr, wind, solar, prices,
+            battery, hydrogen, gridpower).solve(solver = args.solver)
+        print("Full-year solve time: %5.3f s" % (time.perf_counter() - start))
+        for name in ['objective', 'n_smr', 'n_wind', 'n_solar']:
+            reduced, exact = getattr(results, name), getattr(full, name)
+            print("%-9s reduced: %12.2f full year: %12.2f error: %6.2f%%" % (
+                name, reduced, exact, 100 * (reduced - exact) / exact))
+
+    return model, results
+
+
+def status(results):
+    if isinstance(results, matrix.Solution):
+        return results.status
+    return str(results.solver.termination_condition)
+
+
+def kpis(args, model, params, data):
+    """Unit counts, LCOE and hydrogen output of a solved run"""
+
+    demand_hourly, wind_p, solar_p = data
+    nt = len(demand_hourly)
+
+    n_smr, n_wind, n_solar = (extract.values(model, name) for name in ('n_smr', 'n_wind', 'n_solar'))
+    nuclear_gen = n_smr * params['smr_capacity'] * nt
+    wind_gen = n_wind * params['wind_capacity'] * np.sum(wind_p)
+    solar_gen = n_solar * params['solar_capacity'] * np.sum(solar_p)
+    grid_gen = extract.values(model, 'Pgrid').sum()
+    battery_gen = extract.values(model, 'dischargeP').sum() if args.battery else 0
+    m_electrolyzer = extract.values(model, 'M_electrolyzer').sum() if args.hydrogen else 0
+
+    return dict(levelized(params, nuclear_gen, wind_gen, solar_gen, grid_gen, battery_gen, m_electrolyzer),
+                n_smr=n_smr, n_wind=n_wind, n_solar=n_solar, hydrogen=m_electrolyzer)
+
+
+def levelized(params, nuclear_gen, wind_gen, solar_gen, grid_gen, battery_gen, m_electrolyzer):
+    """LCOE with and without hydrogen sales from energy totals, floats or
+    arrays of them"""
+
+    power_gen = nuclear_gen + wind_gen + solar_gen + grid_gen + battery_gen
+    cost = (params['smr_lcoe'] * nuclear_gen + params['wind_lcoe'] * wind_gen + params['solar_lcoe'] * solar_gen
+        + params['gridPrice'] * grid_gen + params['batterylcoe'] * battery_gen)
+
+    return {'lcoe': (cost - params['h2price'] * m_electrolyzer) / power_gen, 'lcoe_woH2': cost / power_gen}
+
+
+def main(args):
+
+    # before the sizing solve, not after it
+    if args.sensitivity:
+        sensitivity.require()
+
+    report = RunReport(profile=args.profile)
+    report.meta['args'] = vars(args)
+
+    params = DEFAULTS.copy()
+    data = load_data(report=report)
+    demand_hourly, wind_p, solar_p = data
+
+    cache = None if args.no_cache else runcache.RunCache(args.cache, args.cache_budget * 2**20)
+    model, results = solve(args, params, data, tee = True, report = report, cache = cache)
 
     # model.pprint()
 
@@ -152,98 +492,94 @@ def main(args):
 
 
     # Post Processing
-    nuclear_gen = [pe.value(model.n_smr * smr.capacity) for t in range(model.nt())]
-    wind_gen = [pe.value(model.n_wind * model.WindP[t]) for t in model.WindP]
-    solar_gen = [pe.value(model.n_solar * model.SolarP[t]) for t in model.SolarP]
-
-    grid_gen = [pe.value(model.Pgrid[t]) for t in model.Pgrid ]
-    hydrogen_gen = [pe.value(model.P_fcell[t]) for t in model.P_fcell]
-    battery_gen = [pe.value(model.dischargeP[t]) for t in model.dischargeP]
-    power_gen = [(nuclear_gen[t] + wind_gen[t] + solar_gen[t] + grid_gen[t] + battery_gen[t]) for t in range(model.nt())]
-
-    dict = {'Nuclear': nuclear_gen, 'Wind': wind_gen, 'Solar': solar_gen,'Grid':grid_gen, 'TotalGEN': power_gen, 'Demand': demand_hourly}
-
-    if args.hydrogen:
-        hydrogen_gen = [pe.value(model.P_fcell[t]) for t in model.P_fcell]
-        m_electrolyzer = [pe.value(model.M_electrolyzer[t]) for t in model.M_electrolyzer]
-        p_electrolyzer = [pe.value(model.M_electrolyzer[t]) for t in model.P_electrolyzer]
-        tank = [pe.value(model.SOP[t]) for t in model.SOP]
-        dict['Hydrogen'] = hydrogen_gen
-        dict['M_Electrolyzer'] = m_electrolyzer
-        dict['P_Electrolyzer'] = p_electrolyzer
-        dict['SOP'] = tank
-    if args.battery:
-        batteryDischarge = [pe.value(model.dischargeP[t]) for t in model.dischargeP]
-        batteryCharge = [pe.value(model.chargeP[t]) for t in model.chargeP]
-        batteryCapacity = [pe.value(model.SOC[t]) for t in model.SOC]
-        dict['Battery Power'] = batteryDischarge
-        dict['Battery Charge'] = batteryCharge
-        dict['SOC'] = batteryCapacity
+    # whole variables at once, the pyomo model and the matrix solution alike
+    with report.stage('extract'):
+        df = extract.frame(args, model, params, data)
+        summary = kpis(args, model, params, data)
+    nt = len(df)
+    report.meta.update(summary, status=status(results), hours=nt)
+    if 'cache' in report.meta:
+        cache.update(report.meta['cache']['key'], kpis=summary)
+
+    print("System LCOE: %5.2f $/MW" % (1e3* summary['lcoe']))
+    print("LCOE without Hydrogen: %5.2f $/MW" % (1e3* summary['lcoe_woH2']))
+    print("Total Hydrogen generated: %5.2f kg" % (summary['hydrogen']))
+
+    # prices and shadow values from the dispatch LP of the counts found
+    if args.sensitivity:
+        start = time.perf_counter()
+        with report.stage('sensitivity'):
+            analysis = sensitivity.analyse(args, params, data, [round(summary[name]) for name in benders.COUNTS])
+        sensitivity.write(analysis)
+        print("Sensitivity time: %5.3f s" % (time.perf_counter() - start))
+        df['Marginal price'] = analysis['price']
+        report.meta['sensitivity'] = {key: analysis[key] for key in ('reduced', 'prices', 'capacities')}
 
-    df = pd.DataFrame(dict)
+    # Writing the results
+    with report.stage('write'):
+        extract.write(df, args.output, report.meta)
 
-    lcoe_sys = (smr.lcoe * sum(nuclear_gen) + wind.lcoe * sum(wind_gen) + solar.lcoe * sum(solar_gen) + gridPrice * sum(grid_gen) 
-        + sum(battery_gen) - h2price * sum(m_electrolyzer)) / sum(power_gen)
-    lcoe_woH2 = (smr.lcoe * sum(nuclear_gen) + wind.lcoe * sum(wind_gen) + solar.lcoe * sum(solar_gen) + gridPrice * sum(grid_gen) 
-        + sum(battery_gen)) / sum(power_gen)
+    # run report next to the results
+    reportfile = os.path.join(os.path.dirname(args.output), 'RunReport.json')
+    if args.headless:
+        report.write(reportfile)
+        return
 
-    print("System LCOE: %5.2f $/MW" % (1e3* lcoe_sys))
-    print("LCOE without Hydrogen: %5.2f $/MW" % (1e3* lcoe_woH2))
-    print("Total Hydrogen generated: %5.2f kg" % (sum(m_electrolyzer)))
+    import matplotlib.pyplot as plt
 
-    # Show graphs
-    if args.horizon and args.battery:
+    with report.stage('plot'):
+        # Show graphs
+        if args.horizon and args.battery:
 
-        df[['Nuclear','Wind','Solar','Grid', 'Battery Power']].iloc[100:125].plot(kind='bar', stacked=True, figsize=(16,8))
-        plt.plot(demand_hourly[100:125], label = 'Demand')
-        # plt.show()
+            df[['Nuclear','Wind','Solar','Grid', 'Battery Power']].iloc[100:125].plot(kind='bar', stacked=True, figsize=(16,8))
+            plt.plot(demand_hourly[100:125], label = 'Demand')
+            # plt.show()
 
-    if args.bstate and args.battery:
+        if args.bstate and args.battery:
 
-        df[['BatteryCharge', 'Battery', 'BattCapacity']].plot(figsize=(12, 4), subplots=True)
+            df[['BatteryCharge', 'Battery', 'BattCapacity']].plot(figsize=(12, 4), subplots=True)
         
 
-    if args.subplots:  
-
-        if args.battery and not args.hydrogen:
-            subplots = df[['Nuclear','Wind','Solar','Grid', 'Battery Power','Battery Charge', 'SOC','TotalGEN','Demand']].plot(figsize=(12, 4), 
-                subplots=True, grid=True)
-            subplots[6].set_ylim(bottom=0)
-            fig, ax = plt.subplots()
-            labels = 'Nuclear','Wind', 'Solar', 'Grid', 'Battery'
-            explode = [0, 0, 0, 0.1, 0.2]
-            patches, texts, autotexts = ax.pie([sum(nuclear_gen), sum(wind_gen), sum(solar_gen), sum(grid_gen), sum(battery_gen)],  
-                labels=labels, autopct='%1.1f%%', labeldistance=1.2, explode=explode)
-        elif args.hydrogen and args.battery:
-            subplots = df[['Nuclear','Wind','Solar','Grid', 'Battery Power','Battery Charge', 'SOC','TotalGEN','P_Electrolyzer','Demand']].plot(figsize=(12, 4), 
-                subplots=True, grid=True)
-            fig, ax = plt.subplots()
-            labels = 'Nuclear','Wind', 'Solar', 'Grid', 'Battery'
-            explode = [0, 0, 0, 0.1, 0.2]
-            patches, texts, autotexts = ax.pie([sum(nuclear_gen), sum(wind_gen), sum(solar_gen), sum(grid_gen), sum(battery_gen)],  
-                labels=labels, autopct='%1.1f%%', labeldistance=1.2, explode=explode)
-            df[['Hydrogen', 'M_Electrolyzer','SOP']].plot(figsize=(12, 4), subplots=True)
-        elif args.hydrogen and not args.battery:
-            pass
-
-        else:
-            df[['Nuclear','Wind','Solar','TotalGEN','Demand']].plot.area(figsize=(12, 4), subplots=True)
-
-    # Writing the results
-    df.to_csv('Results.csv')
+        if args.subplots:  
+
+            if args.battery and not args.hydrogen:
+                subplots = df[['Nuclear','Wind','Solar','Grid', 'Battery Power','Battery Charge', 'SOC','TotalGEN','Demand']].plot(figsize=(12, 4), 
+                    subplots=True, grid=True)
+                subplots[6].set_ylim(bottom=0)
+                fig, ax = plt.subplots()
+                labels = 'Nuclear','Wind', 'Solar', 'Grid', 'Battery'
+                explode = [0, 0, 0, 0.1, 0.2]
+                patches, texts, autotexts = ax.pie(df[['Nuclear', 'Wind', 'Solar', 'Grid', 'Battery Power']].sum(),  
+                    labels=labels, autopct='%1.1f%%', labeldistance=1.2, explode=explode)
+            elif args.hydrogen and args.battery:
+                subplots = df[['Nuclear','Wind','Solar','Grid', 'Battery Power','Battery Charge', 'SOC','TotalGEN','P_Electrolyzer','Demand']].plot(figsize=(12, 4), 
+                    subplots=True, grid=True)
+                fig, ax = plt.subplots()
+                labels = 'Nuclear','Wind', 'Solar', 'Grid', 'Battery'
+                explode = [0, 0, 0, 0.1, 0.2]
+                patches, texts, autotexts = ax.pie(df[['Nuclear', 'Wind', 'Solar', 'Grid', 'Battery Power']].sum(),  
+                    labels=labels, autopct='%1.1f%%', labeldistance=1.2, explode=explode)
+                df[['Hydrogen', 'M_Electrolyzer','SOP']].plot(figsize=(12, 4), subplots=True)
+            elif args.hydrogen and not args.battery:
+                pass
+
+            else:
+                df[['Nuclear','Wind','Solar','TotalGEN','Demand']].plot.area(figsize=(12, 4), subplots=True)
+
+        # plt.legend(loc='upper left')
+        plt.tight_layout()
+        plt.xlabel('Hour')
+        # plt.ylabel('kW')
+
+    # before the interactive window blocks
+    report.write(reportfile)
 
     # Show graphs
-    # plt.legend(loc='upper left')
-    plt.tight_layout()
-    plt.xlabel('Hour')
-    # plt.ylabel('kW')
     plt.show()
 
 
 
-if __name__ == '__main__':
-
-    workingDirectory  = os.path.realpath(sys.argv[0])
+def parser():
 
     parser = argparse.ArgumentParser(description='Parameters')
     parser.add_argument("--hydrogen", action="store_true", help="Adds hydrogen system")
@@ -251,7 +587,58 @@ if __name__ == '__main__':
     parser.add_argument("--horizon", action="store_true", help="Show graphs")
     parser.add_argument("--bstate", action="store_true", help="Show graphs")
     parser.add_argument("--subplots", action="store_true", help="Show graphs")
-        
-    args = parser.parse_args()
+    parser.add_argument("--matrix", action="store_true", help="Builds the model from sparse matrix blocks")
+    parser.add_argument("--representative-days", type=int, default=0, metavar="K",
+        help="Solves on K clustered representative days (implies --matrix)")
+    parser.add_argument("--max-error", type=float, default=0.0,
+        help="Merges runs of consecutive hours within this error of their mean, relative to each profile's peak, "
+             "into weighted segments (implies --matrix)")
+    parser.add_argument("--compare", action="store_true",
+        help="Reports the representative-day or segment error against the full-year solve")
+    parser.add_argument("--rolling", type=int, default=0, metavar="WINDOW",
+        help="Rolling horizon dispatch in windows of WINDOW hours, for the unit counts of --units")
+    parser.add_argument("--overlap", type=int, default=24, help="Hours of each rolling window re-solved by the next one")
+    parser.add_argument("--units", type=int, nargs=3, default=None, metavar=("N_SMR", "N_WIND", "N_SOLAR"),
+        help="Fixed unit counts for --rolling")
+    parser.add_argument("--benders", default=None, metavar="PERIOD",
+        help="Benders decomposition with dispatch subproblems per month, week or number of hours")
+    parser.add_argument("--workers", type=int, default=None, help="Processes solving Benders or scenario subproblems (default: all cores)")
+    parser.add_argument("--gap", type=float, default=1e-4, help="Relative Benders gap to stop at")
+    parser.add_argument("--scenarios", default=None, metavar="SOURCE",
+        help="Sizes against many years by progressive hedging: a DataGen/DATA/scenarios.py .npy "
+             "or a glob of RPGss workbooks such as '../DataGen/RPGss*.xlsx'")
+    parser.add_argument("--rho", type=float, default=0.1, help="Progressive hedging penalty, relative to unit costs")
+    parser.add_argument("--pareto", type=int, default=0, metavar="POINTS",
+        help="Pareto front of cost against grid import and emissions, swept by an epsilon constraint "
+             "over POINTS caps in parallel (implies --matrix)")
+    parser.add_argument("--presolve", action="store_true",
+        help="Tightens bounds from the data and drops the rows they make redundant before solving")
+    parser.add_argument("--mip-start", choices=['greedy', 'stored'], default=None,
+        help="Starts branch-and-bound from a greedy dispatch, or from the nearest stored run")
+    parser.add_argument("--sensitivity", action="store_true",
+        help="Reports marginal prices, shadow values and the price ranges keeping the dispatch optimal")
+    parser.add_argument("--portfolio", nargs='*', default=None, metavar="SOLVER",
+        help="Races these solvers, or all installed ones (%s), in parallel processes and keeps the first "
+             "proven optimum (implies --matrix)" % ', '.join(list(portfolio.VARIANTS) + list(portfolio.COMMANDS)))
+    parser.add_argument("--deadline", type=float, default=None,
+        help="Seconds after which the portfolio takes the best incumbent")
+    parser.add_argument("--solver", default=None, help="Solver backend (default: HiGHS if installed, else GLPK)")
+    parser.add_argument("--output", default='Results.csv',
+        help="Hourly results, written as .csv, .parquet (pyarrow) or .h5 (PyTables) with run metadata")
+    parser.add_argument("--cache", default=runcache.CACHE, help="Directory of stored runs (default: %(default)s)")
+    parser.add_argument("--cache-budget", type=int, default=runcache.BUDGET >> 20, metavar="MB",
+        help="Disk budget of the run cache, least recently used runs are evicted beyond it")
+    parser.add_argument("--no-cache", action="store_true", help="Solves again even when the run is stored")
+    parser.add_argument("--headless", action="store_true", help="Skips matplotlib entirely, for batch runs")
+    parser.add_argument("--profile", action="store_true", help="Adds cProfile and tracemalloc captures to RunReport.json")
+
+    return parser
+
+
+if __name__ == '__main__':
+
+    workingDirectory  = os.path.realpath(sys.argv[0])
+
+    args = parser().parse_args()
 
-    main(args)
\ No newline at end of file
+    main(args)
@@ -0,0 +1,114 @@
+import copy, os, time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+
+from benders import COUNTS
+
+# kg CO2 per kWh imported; the grid is the only fossil supply of the plant,
+# so emissions and the fossil share are grid import scaled
+GRID_CO2 = 0.39
+
+
+# per worker: the built sizing program, its hourly weights and the solver
+_setup = None
+
+
+def _init(setup):
+    global _setup
+    _setup = setup
+
+
+def _program():
+    """The worker's program to change, sharing its arrays but no solver"""
+    lp = copy.copy(_setup[0])
+    lp.c, lp.rows, lp.highs = list(lp.c), dict(lp.rows), None
+    return lp
+
+
+def _point(solution, weights, elapsed):
+    return dict({name: float(np.round(getattr(solution, name))) for name in COUNTS},
+                grid=float(weights @ solution.Pgrid), cost=solution.objective, time=elapsed)
+
+
+def _column(solution, lp):
+    """The column vector of a solution, a start for the next point"""
+    return np.concatenate([np.atleast_1d(getattr(solution, name)) for name in lp.columns])
+
+
+def _anchor(kind):
+    """ One end of the front: the cheapest sizing, or the one importing the
+    least from the grid at any cost. Returns the point, its column vector
+    and, for the cheapest, the solution itself """
+
+    _, weights, solver = _setup
+    lp = _program()
+    if kind == 'grid':
+        lp.c = [np.zeros(len(c)) for c in lp.c]
+        lp.cost('Pgrid', weights)
+    start = time.perf_counter()
+    solution = lp.solve(solver=solver)
+    if solution.status != 'optimal':
+        raise RuntimeError("Least %s sizing: %s" % (kind, solution.status))
+    return _point(solution, weights, time.perf_counter() - start), _column(solution, lp), \
+        solution if kind == 'cost' else None
+
+
+def _sweep(caps, start):
+    """ The cheapest sizing under each grid import cap, in increasing order,
+    on one program whose cap row moves between points. Each point starts
+    from the solution of the one before, which keeps the looser cap """
+
+    _, weights, solver = _setup
+    lp = _program()
+    lp.total('epsilonC', 'Pgrid', weights, ub=caps[0])
+    points = []
+    for cap in caps:
+        lp.bound('epsilonC', ub=cap)
+        begin = time.perf_counter()
+        solution = lp.solve(solver=solver, warm=True, start=start)
+        if solution.status != 'optimal':
+            raise RuntimeError("Grid import cap %.1f kWh: %s" % (cap, solution.status))
+        points.append(dict(_point(solution, weights, time.perf_counter() - begin), cap=cap))
+        start = _column(solution, lp)
+    return points
+
+
+def front(lp, points=20, weights=None, solver=None, workers=None):
+    """ Pareto front of cost against grid import by the epsilon-constraint
+    method. Both ends are solved first, in parallel; the caps in between are
+    spread evenly and split into contiguous runs, one per worker, each run
+    swept upwards from the least import solution, always feasible. Returns
+    the points, least import first, and the solution of the cheapest end """
+
+    weights = np.ones(lp.nt) if weights is None else np.asarray(weights, dtype=float)
+    with ProcessPoolExecutor(workers, initializer=_init, initargs=((lp, weights, solver),)) as pool:
+        cheapest, least = pool.submit(_anchor, 'cost'), pool.submit(_anchor, 'grid')
+        (high, _, solution), (low, x, _) = cheapest.result(), least.result()
+
+        # the cheapest end is the last point, a cap at its import changes nothing
+        caps = np.linspace(low['grid'], high['grid'], max(points, 2))[:-1]
+        # a hair above the least import, which the solver only meets within tolerance
+        caps[0] += 1e-6 * max(abs(caps[0]), 1.0)
+        runs = np.array_split(caps, min(workers or os.cpu_count(), len(caps)))
+        swept = [pool.submit(_sweep, run, x) for run in runs if len(run)]
+        found = [point for future in swept for point in future.result()]
+
+    return found + [dict(high, cap=high['grid'])], solution
+
+
+def table(found, demand=None):
+    """ The front as a DataFrame: unit counts, cost, grid import (kWh),
+    emissions (t CO2), fossil share of the demand if given, and whether
+    another point is at least as good in both and better in one; a cap
+    that does not bind may give such a point """
+
+    df = pd.DataFrame(found, columns=['cap', 'grid', 'cost'] + COUNTS + ['time'])
+    df['emissions'] = GRID_CO2 * df['grid'] / 1e3
+    if demand is not None:
+        df['fossil_share'] = df['grid'] / demand
+    grid, cost = df['grid'].to_numpy(), df['cost'].to_numpy()
+    tol = 1e-6 * np.maximum(np.abs(cost), 1.0)
+    df['dominated'] = [bool(np.any((grid <= g + 1e-3) & (cost <= c - t) | (grid < g - 1e-3) & (cost <= c + t)))
+                       for g, c, t in zip(grid, cost, tol)]
+    return df
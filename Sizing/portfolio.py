@@ -0,0 +1,211 @@
+import argparse, csv, multiprocessing, os, queue, shutil, subprocess, tempfile, time
+import numpy as np
+
+import matrix
+
+try:
+    import highspy
+except ImportError:
+    highspy = None
+
+# HiGHS settings raced as solvers of their own: on a MIP the seed and
+# presolve move the time to optimality about as much as the backend does
+VARIANTS = {'highs': {}, 'highs-seed': {'random_seed': 7}, 'highs-nopresolve': {'presolve': 'off'}}
+# shell solvers reading free MPS, by executable
+COMMANDS = {'glpk': 'glpsol', 'cbc': 'cbc'}
+# every race appends its per-solver timings here
+LOG = 'portfolio.csv'
+FIELDS = ['started', 'configuration', 'solver', 'status', 'objective', 'time', 'winner']
+# seconds the solvers get past the deadline to hand back their incumbent
+GRACE = 10.0
+
+
+def available():
+    """The portfolio entries installed here"""
+    names = list(VARIANTS) if highspy is not None else []
+    return names + [name for name, command in COMMANDS.items() if shutil.which(command)]
+
+
+def configuration(args, lp):
+    """What the timings of a race are filed under: components, hours, problem type"""
+
+    parts = [name for name in ('battery', 'hydrogen') if getattr(args, name, False)]
+    if getattr(args, 'representative_days', 0):
+        parts.append('%d days' % args.representative_days)
+    if getattr(args, 'max_error', 0):
+        parts.append('segments %g' % args.max_error)
+    kind = 'MILP' if lp.bounds()[2].any() else 'LP'
+    return '%s %dh %s' % ('+'.join(parts) or 'plain', lp.nt, kind)
+
+
+def _highs(name, mps, options, deadline, start, results):
+    """Child process: HiGHS with options on the MPS file, its result queued"""
+
+    h = highspy.Highs()
+    h.setOptionValue('output_flag', False)
+    h.readModel(mps)
+    for option, value in options.items():
+        h.setOptionValue(option, value)
+    if deadline:
+        h.setOptionValue('time_limit', float(deadline))
+    if start is not None:
+        solution = highspy.HighsSolution()
+        solution.col_value = list(start)
+        solution.value_valid = True
+        h.setSolution(solution)
+    h.run()
+
+    status = h.getModelStatus()
+    info = h.getInfo()
+    results.put((name, 'optimal' if status == highspy.HighsModelStatus.kOptimal else h.modelStatusToString(status),
+                 info.objective_function_value if info.primal_solution_status else None,
+                 np.array(h.getSolution().col_value) if info.primal_solution_status else None))
+
+
+def _command(name, mps, sol, deadline):
+    """Command line of a shell solver, within the deadline if given"""
+
+    if name == 'glpk':
+        return ['glpsol', '--freemps', mps, '--write', sol] + (['--tmlim', str(int(deadline))] if deadline else [])
+    if name == 'cbc':
+        return ['cbc', mps] + (['sec', str(deadline)] if deadline else []) + ['solve', 'solu', sol]
+    raise ValueError("Unknown portfolio solver %s" % name)
+
+
+def read_cbc(lp, filename):
+    """ Parses a cbc solution file: a status line, then index, name, value
+    and reduced cost of every nonzero column """
+
+    x = np.zeros(lp.ncols)
+    with open(filename) as f:
+        header = f.readline()
+        for line in f:
+            row = line.split()
+            if row and row[0] == '**':
+                row = row[1:]
+            if len(row) >= 3:
+                x[int(row[0])] = float(row[2])
+    status = 'optimal' if header.startswith('Optimal') else header.split(' - ')[0].strip().lower()
+    objective = float(header.rsplit(' ', 1)[-1]) if 'objective value' in header else None
+    return matrix.Solution.columns(lp, x, status, objective)
+
+
+def race(lp, solvers=None, deadline=None, start=None, label=None, log=LOG):
+    """ Solves lp with every solver of the portfolio at once, each in its
+    own process on the same MPS file, and takes the first proven optimum;
+    the rest are killed. With a deadline every solver stops there and the
+    best incumbent wins. The time and outcome of each solver go to log.
+    Returns the winning matrix.Solution, its stats listing the whole race """
+
+    solvers = solvers or available()
+    missing = set(solvers) - set(available())
+    if missing:
+        raise ValueError("Portfolio solvers not available here: %s" % ', '.join(sorted(missing)))
+
+    tmpdir = tempfile.mkdtemp()
+    mps = os.path.join(tmpdir, 'sizing.mps')
+    lp.write(mps)
+
+    results = multiprocessing.Queue()
+    running = {}
+    begin = time.perf_counter()
+    for name in solvers:
+        if name in VARIANTS:
+            process = multiprocessing.Process(target=_highs, args=(name, mps, VARIANTS[name], deadline,
+                None if start is None else np.asarray(start, dtype=float).tolist(), results), daemon=True)
+            process.start()
+        else:
+            sol = os.path.join(tmpdir, name + '.sol')
+            process = subprocess.Popen(_command(name, mps, sol, deadline), stdout=subprocess.DEVNULL,
+                                       stderr=subprocess.DEVNULL)
+            process.sol = sol
+        running[name] = process
+
+    done = {}
+    winner = None
+    while running and winner is None:
+        try:
+            name, status, objective, x = results.get(timeout=0.05)
+            running.pop(name).join()
+            solution = matrix.Solution.columns(lp, x if x is not None else np.full(lp.ncols, np.nan), status, objective)
+            done[name] = (solution, time.perf_counter() - begin)
+        except queue.Empty:
+            pass
+        for name, process in list(running.items()):
+            if isinstance(process, multiprocessing.Process) and process.exitcode not in (None, 0):
+                # a child that died queues nothing
+                del running[name]
+                done[name] = (matrix.Solution({}, 'failed', None), time.perf_counter() - begin)
+            elif isinstance(process, subprocess.Popen) and process.poll() is not None:
+                del running[name]
+                reader = matrix.Solution.read if name == 'glpk' else read_cbc
+                solution = reader(lp, process.sol) if os.path.exists(process.sol) else \
+                    matrix.Solution({}, 'failed', None)
+                done[name] = (solution, time.perf_counter() - begin)
+        winner = next((name for name, (solution, _) in done.items() if solution.status == 'optimal'), None)
+        if deadline and time.perf_counter() - begin > deadline + GRACE:
+            break
+
+    stopped = time.perf_counter() - begin
+    for name, process in running.items():
+        process.kill()
+        if isinstance(process, subprocess.Popen):
+            process.wait()
+        else:
+            process.join()
+    shutil.rmtree(tmpdir, ignore_errors=True)
+
+    if winner is None:
+        # no proven optimum by the deadline: the best incumbent
+        found = [name for name, (solution, _) in done.items() if solution.objective is not None]
+        if not found:
+            raise RuntimeError("No portfolio solver found a solution: %s" % {
+                name: solution.status for name, (solution, _) in done.items()})
+        winner = min(found, key=lambda name: done[name][0].objective)
+
+    entries = [{'solver': name, 'status': solution.status, 'objective': solution.objective, 'time': seconds,
+                'winner': name == winner} for name, (solution, seconds) in done.items()]
+    entries += [{'solver': name, 'status': 'killed', 'objective': None, 'time': stopped, 'winner': False}
+                for name in running]
+    if log:
+        started = time.strftime('%Y-%m-%dT%H:%M:%S')
+        new = not os.path.exists(log)
+        with open(log, 'a', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=FIELDS)
+            if new:
+                writer.writeheader()
+            for entry in entries:
+                writer.writerow(dict(entry, started=started, configuration=label or '%dh' % lp.nt))
+
+    solution = done[winner][0]
+    solution.stats = {'solver': winner, 'status': solution.status, 'time': done[winner][1], 'race': entries}
+    return solution
+
+
+def summary(log=LOG):
+    """ Per configuration and solver: races, wins, and the median time to a
+    proven optimum, fastest first, from the race log """
+
+    table = {}
+    with open(log, newline='') as f:
+        for row in csv.DictReader(f):
+            entry = table.setdefault((row['configuration'], row['solver']), {'races': 0, 'wins': 0, 'times': []})
+            entry['races'] += 1
+            entry['wins'] += row['winner'] == 'True'
+            if row['status'] == 'optimal':
+                entry['times'].append(float(row['time']))
+
+    rows = [(configuration, solver, entry['races'], entry['wins'],
+             np.median(entry['times']) if entry['times'] else np.inf) for (configuration, solver), entry in table.items()]
+    return sorted(rows, key=lambda row: (row[0], row[4], -row[3]))
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Which solver to default to, from the portfolio race log')
+    parser.add_argument("--log", default=LOG)
+    args = parser.parse_args()
+
+    print("%-34s %-18s %6s %6s %12s" % ('configuration', 'solver', 'races', 'wins', 'median s'))
+    for row in summary(args.log):
+        print("%-34s %-18s %6d %6d %12.3f" % row)
@@ -0,0 +1,196 @@
+import math
+import numpy as np
+import pyomo.environ as pe
+
+import optimize
+from benders import BOUNDS, COUNTS
+
+
+class Reduction():
+    """ Tightened column bounds and redundant row blocks of a sizing model,
+    by block name, so they apply alike to a matrix.LinearProgram and to the
+    pyomo model of build_model, whose components carry the same names.
+    bounds maps a column block to its (lb, ub), scalars or hourly arrays """
+
+    def __init__(self):
+        self.bounds = {}
+        self.dropped = []
+        self.log = []
+
+    def tighten(self, name, lb=None, ub=None, current=(-np.inf, np.inf)):
+        old_lb, old_ub = self.bounds.get(name, current)
+        lb = old_lb if lb is None else np.maximum(old_lb, lb)
+        ub = old_ub if ub is None else np.minimum(old_ub, ub)
+        if np.any(lb > ub + 1e-9):
+            raise ValueError("Presolve: %s has no feasible value, the model is infeasible" % name)
+        self.bounds[name] = (lb, np.maximum(lb, ub))
+
+    def reduce(self, lp):
+        """ Applies the bounds to lp, then moves its single-entry row blocks
+        into column bounds and drops the blocks no point within the bounds
+        can violate. Returns the rows and nonzeros before and after """
+
+        before = lp.matrix()[0]
+        for name, (lb, ub) in self.bounds.items():
+            self.clip(lp, name, lb, ub)
+
+        for name, (A, rlb, rub) in list(lp.rows.items()):
+            A = A.tocsr()
+            counts = np.diff(A.indptr)
+            if np.all(counts == 1):
+                # one entry per row: a bound on that column
+                col, coef = A.indices, A.data
+                lb = np.where(coef > 0, rlb, rub) / coef
+                ub = np.where(coef > 0, rub, rlb) / coef
+                xlb, xub, _ = lp.bounds()
+                if len(np.unique(col)) != len(col):
+                    continue
+                xlb[col], xub[col] = np.maximum(xlb[col], lb), np.minimum(xub[col], ub)
+                self.set(lp, xlb, xub)
+                del lp.rows[name]
+                self.dropped.append(name)
+                continue
+
+            # activity range of every row over the column bounds; a block
+            # only spans the columns that existed when it was added
+            xlb, xub, _ = lp.bounds()
+            xlb, xub = xlb[:A.shape[1]], xub[:A.shape[1]]
+            positive, negative = A.maximum(0), A.minimum(0)
+            with np.errstate(invalid='ignore'):
+                high = positive @ xub + negative @ xlb
+                low = positive @ xlb + negative @ xub
+            if np.all((high <= rub + 1e-9) & (low >= rlb - 1e-9)):
+                del lp.rows[name]
+                self.dropped.append(name)
+
+        after = lp.matrix()[0]
+        return (before.shape[0], before.nnz), (after.shape[0], after.nnz)
+
+    @staticmethod
+    def clip(lp, name, lb, ub):
+        block = list(lp.columns).index(name)
+        size = lp.columns[name][1]
+        lp.lb[block] = np.maximum(lp.lb[block], np.broadcast_to(lb, (size,)))
+        lp.ub[block] = np.minimum(lp.ub[block], np.broadcast_to(ub, (size,)))
+
+    def set(self, lp, xlb, xub):
+        """Writes whole bound vectors back into the blocks of lp, and notes them"""
+
+        for block, (name, (start, size)) in enumerate(lp.columns.items()):
+            lb, ub = xlb[start:start + size], xub[start:start + size]
+            if np.any(lb != lp.lb[block]) or np.any(ub != lp.ub[block]):
+                lp.lb[block], lp.ub[block] = lb.copy(), ub.copy()
+                self.bounds[name] = (lb.copy() if size > 1 else lb[0], ub.copy() if size > 1 else ub[0])
+
+    def admits(self, values, tol=1e-6):
+        """Whether a solution, blocks by name, keeps within the bounds"""
+
+        return all(np.all(np.asarray(values[name]) >= lb - tol) and np.all(np.asarray(values[name]) <= ub + tol)
+                   for name, (lb, ub) in self.bounds.items() if name in values)
+
+    def apply(self, model):
+        """The same reduction on a pyomo model: bounds set, blocks deactivated"""
+
+        for name, (lb, ub) in self.bounds.items():
+            var = getattr(model, name, None)
+            if var is None:
+                continue
+            if var.is_indexed():
+                lb = np.broadcast_to(lb, (len(var),)).tolist()
+                ub = np.broadcast_to(ub, (len(var),)).tolist()
+                for t, v in var.items():
+                    v.setlb(lb[t])
+                    v.setub(ub[t])
+            else:
+                var.setlb(float(lb))
+                var.setub(float(ub))
+        for name in self.dropped:
+            component = getattr(model, name, None)
+            if isinstance(component, pe.Constraint):
+                component.deactivate()
+
+
+def tighten(args, params, data, upper=None, n_h2sys=100):
+    """ Bounds the sizing model from its data before it is built. Counts
+    of units get the lower bound covering the worst hour with everything
+    else at its upper bound, and an upper bound past which a unit could be
+    removed with all hours still absorbing their supply: demand plus full
+    battery charging plus twice the electrolyser (it may not exceed the
+    excess left after itself). Given the objective of a feasible solution,
+    no count may cost more than it plus the largest hydrogen revenue. The
+    grid only serves what the least generation leaves unabsorbed, and is
+    fixed at zero without storage, where it meets no demand. SOC and SOP
+    get the ranges their rows imply. Returns a Reduction """
+
+    smr, wind, solar, prices, battery, hydrogen = optimize.setup(args, params)
+    demand_hourly, wind_p, solar_p = data
+    demand = np.asarray(demand_hourly, dtype=float)
+    nt = len(demand)
+    storage = args.battery or args.hydrogen
+    reduction = Reduction()
+
+    # hourly output per unit, and the yearly cost of one
+    output = np.vstack([np.full(nt, float(smr.capacity)), wind.capacity * np.asarray(wind_p, dtype=float),
+                        solar.capacity * np.asarray(solar_p, dtype=float)])
+    unit = np.array([smr.lcoe * output[0].sum(), wind.lcoe * output[1].sum(), solar.lcoe * output[2].sum()])
+    lb = np.array([BOUNDS[name][0] for name in COUNTS], dtype=float)
+    ub = np.array([BOUNDS[name][1] for name in COUNTS], dtype=float)
+
+    # what may supply the demand besides the units, and what may absorb
+    other = np.zeros(nt)
+    absorb = demand.copy()
+    revenue = 0.0
+    if storage:
+        other += params['gridpower']
+    if args.battery:
+        other += battery.MAX_BATTERY_POWER/2
+        absorb += battery.MAX_BATTERY_POWER/2
+    if args.hydrogen:
+        other += n_h2sys * hydrogen.FUEL_CELL_POWER
+        absorb += 2 * n_h2sys * hydrogen.ELECTROLYSER_POWER
+        revenue = prices['h2'] * hydrogen.mdot(n_h2sys * hydrogen.ELECTROLYSER_POWER) * nt
+
+    for _ in range(10):
+        previous = lb.copy(), ub.copy()
+        for k in range(len(COUNTS)):
+            rest = np.delete(np.arange(len(COUNTS)), k)
+            g = output[k]
+            on = g > 0
+            # coverage: the worst hour with all else at its most
+            need = demand - other - ub[rest] @ output[rest]
+            if np.any(need[~on] > 1e-9):
+                raise ValueError("Presolve: demand cannot be met in %d hours" % np.sum(need[~on] > 1e-9))
+            if np.any(on):
+                lb[k] = max(lb[k], math.ceil(np.max(need[on] / g[on]) - 1e-9))
+            # absorption: a unit more than the hours can take is removable
+            if np.any(on) and unit[k] > 0:
+                spare = (absorb - lb[rest] @ output[rest])[on] / g[on]
+                ub[k] = min(ub[k], max(lb[k], math.ceil(np.max(spare) - 1e-9)))
+            # cost: no count may cost more than the incumbent allows
+            if upper is not None and unit[k] > 0:
+                ub[k] = min(ub[k], max(lb[k], math.floor((upper + revenue - lb[rest] @ unit[rest]) / unit[k] + 1e-9)))
+        if np.array_equal(previous[0], lb) and np.array_equal(previous[1], ub):
+            break
+
+    for k, name in enumerate(COUNTS):
+        reduction.tighten(name, lb[k], ub[k], BOUNDS[name])
+        if (lb[k], ub[k]) != tuple(BOUNDS[name]):
+            reduction.log.append("%s [%d, %d] -> [%d, %d]" % (name, *BOUNDS[name], lb[k], ub[k]))
+
+    # grid beyond what the hours can absorb could be cut at a saving
+    least = lb @ output
+    grid = np.clip(absorb - least, 0, params['gridpower']) if storage else np.zeros(nt)
+    if prices['grid'] <= 0:
+        grid = np.full(nt, float(params['gridpower']))
+    reduction.tighten('Pgrid', 0.0, grid, (0.0, params['gridpower']))
+    reduction.log.append("Pgrid fixed at 0 in %d of %d hours, bounded below the grid limit in %d" % (
+        np.sum(grid == 0), nt, np.sum((grid > 0) & (grid < params['gridpower']))))
+
+    if args.battery:
+        # SOC_limit as a bound
+        reduction.tighten('SOC', battery.MAX_BATTERY_CAPACITY/2, battery.MAX_BATTERY_CAPACITY)
+    if args.hydrogen:
+        # the charge and discharge rows keep SOP within the tank
+        reduction.tighten('SOP', 0.0, n_h2sys * hydrogen.MAX_STORAGE_CAPACITY)
+
+    return reduction
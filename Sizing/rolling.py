@@ -0,0 +1,81 @@
+import numpy as np
+
+import matrix
+
+# storage state column -> the row block that pins it before the first hour
+STATES = {'SOC': 'SOC_constraint', 'SOP': 'hydrogenSysC'}
+
+
+def shift(lp, balance, initial):
+    """ Moves a dispatch LP built with fixed counts to a new window: balance
+    is the fixed generation minus demand of every hour, initial the storage
+    state before the first. Same coefficients, only row bounds change, so a
+    loaded HiGHS model can be re-solved from its basis """
+
+    lp.bound('pexcesC', balance, balance)
+    lp.bound('demandC', lb=-balance)
+    for name, value in initial.items():
+        rhs = np.zeros(lp.nt)
+        rhs[0] = value
+        lp.bound(STATES[name], rhs, rhs)
+
+
+def dispatch(args, demand_hourly, windP, solarP, smr, wind, solar, prices, battery=None, hydrogen=None,
+             gridpower=40000, n_h2sys=100, counts=None, window=168, overlap=24, tee=False):
+    """ Dispatch for fixed unit counts (n_smr, n_wind, n_solar), solved one
+    window at a time. Of each window the first window - overlap hours are
+    committed and their terminal storage state starts the next one. Windows
+    only differ in row bounds, so the same HiGHS model is re-solved from the
+    previous basis; the short last window gets a program of its own.
+    Returns a matrix.Solution over the whole horizon """
+
+    if not (args.battery or args.hydrogen):
+        raise ValueError("Rolling horizon dispatch needs storage (--battery or --hydrogen)")
+    if not 0 <= overlap < window:
+        raise ValueError("Overlap must be shorter than the window")
+
+    demand = np.asarray(demand_hourly, dtype=float)
+    nt = len(demand)
+    step = window - overlap
+    n_smr, n_wind, n_solar = counts
+    fixed = n_smr * smr.capacity + n_wind * np.asarray(windP) + n_solar * np.asarray(solarP)
+
+    initial = {}
+    if args.battery:
+        initial['SOC'] = battery.INITIAL_CAPACITY
+    if args.hydrogen:
+        initial['SOP'] = n_h2sys * hydrogen.MAX_STORAGE_CAPACITY / 2
+
+    committed = {}
+    cost = 0.0
+    lp = None
+    for start in range(0, nt, step):
+        end = min(start + window, nt)
+        if lp is None or lp.nt != end - start:
+            lp = matrix.build(args, demand[start:end], windP[start:end], solarP[start:end], smr, wind, solar, prices,
+                battery, hydrogen, gridpower, n_h2sys, counts=counts, initial=initial)
+        else:
+            shift(lp, fixed[start:end] - demand[start:end], initial)
+
+        solution = lp.solve(tee=tee, solver=args.solver, warm=True)
+        if solution.status != 'optimal':
+            raise RuntimeError("Window starting at hour %d: %s" % (start, solution.status))
+
+        keep = end - start if end == nt else step
+        c = lp.objective()
+        for name, (col, size) in lp.columns.items():
+            if size == lp.nt:
+                values = getattr(solution, name)[:keep]
+                committed.setdefault(name, []).append(values)
+                cost += c[col:col + keep] @ values
+        initial = {name: getattr(solution, name)[keep - 1] for name in initial}
+
+        if end == nt:
+            break
+
+    values = {name: np.concatenate(pieces) for name, pieces in committed.items()}
+    values.update(n_smr=n_smr, n_wind=n_wind, n_solar=n_solar)
+    # generation cost is fixed by the unit counts
+    cost += n_smr * smr.capacity * smr.lcoe * nt + n_wind * wind.lcoe * np.sum(windP) + n_solar * solar.lcoe * np.sum(solarP)
+
+    return matrix.Solution(values, 'optimal', cost)
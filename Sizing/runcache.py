@@ -0,0 +1,228 @@
+import ast, glob, hashlib, json, os, shutil, tempfile, time
+import numpy as np
+import pyomo.environ as pe
+
+import extract
+import matrix
+
+# Solved runs are kept here, one directory per input hash
+CACHE = '.runcache'
+# disk budget in bytes, the least recently used entries go first
+BUDGET = 2 << 30
+HERE = os.path.dirname(os.path.abspath(__file__))
+# module that builds and solves a run, every local module it imports
+# shapes the model and its solution
+ENTRY = 'optimize.py'
+# arguments that change nothing in the solution
+IGNORED = {'output', 'headless', 'profile', 'workers', 'horizon', 'bstate', 'subplots', 'compare', 'no_cache',
+           'cache', 'cache_budget'}
+# Solution attributes that are not column blocks
+RESERVED = {'status', 'objective', 'duals', 'reduced', 'stats', 'kpis'}
+
+_version = None
+
+
+def sources(entry=ENTRY):
+    """ The local modules entry imports, directly or through one another,
+    itself included, so a mode added to the run is hashed without being
+    listed """
+
+    found, pending = set(), [entry]
+    while pending:
+        name = pending.pop()
+        if name in found:
+            continue
+        found.add(name)
+        with open(os.path.join(HERE, name)) as f:
+            tree = ast.parse(f.read(), name)
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                modules = [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom) and not node.level and node.module:
+                modules = [node.module]
+            else:
+                continue
+            for module in modules:
+                filename = module.split('.')[0] + '.py'
+                if os.path.isfile(os.path.join(HERE, filename)):
+                    pending.append(filename)
+    return sorted(found)
+
+
+def version():
+    """Hash of the modelling code, so a code change misses the cache"""
+
+    global _version
+    if _version is None:
+        sha = hashlib.sha256()
+        for name in sources():
+            with open(os.path.join(HERE, name), 'rb') as f:
+                sha.update(f.read())
+        _version = sha.hexdigest()
+    return _version
+
+
+def digest(*parts):
+    """ sha256 of arrays, by dtype, shape and bytes, and of anything JSON
+    can write, by its sorted JSON text """
+
+    sha = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, np.ndarray):
+            part = np.ascontiguousarray(part)
+            sha.update(('%s%s' % (part.dtype.str, part.shape)).encode())
+            sha.update(part.data)
+        else:
+            sha.update(json.dumps(part, sort_keys=True, default=str).encode())
+    return sha.hexdigest()
+
+
+def model_key(args, params, data, components):
+    """ Everything the model depends on: the input arrays, parameters,
+    component settings, flags and code version, but not the solver """
+
+    flags = {key: value for key, value in vars(args).items() if key not in IGNORED and key != 'solver'}
+    sources = {}
+    if flags.get('scenarios'):
+        sources = {f: [os.stat(f).st_size, os.stat(f).st_mtime_ns] for f in sorted(glob.glob(flags['scenarios']))}
+    settings = [None if c is None else vars(c) for c in components]
+    return digest(version(), flags, params, settings, sources, *(np.asarray(x, dtype=float) for x in data))
+
+
+def run_key(model, args):
+    return digest(model, args.solver)
+
+
+def inputs(args, params, data):
+    """What nearest() compares runs by: the shape of the model and its inputs"""
+
+    demand, wind_p, solar_p = (np.asarray(x, dtype=float) for x in data)
+    return {'hours': len(demand), 'battery': bool(args.battery), 'hydrogen': bool(args.hydrogen),
+            'values': dict(params, demand=demand.mean(), wind=wind_p.mean(), solar=solar_p.mean())}
+
+
+def vectors(model):
+    """Every variable of a solved pyomo model or matrix.Solution as arrays"""
+
+    if isinstance(model, matrix.Solution):
+        return {name: np.asarray(value, dtype=float) for name, value in vars(model).items() if name not in RESERVED}
+    return {v.local_name: np.asarray(extract.values(model, v.local_name))
+            for v in model.component_objects(pe.Var, descend_into=False)}
+
+
+class RunCache():
+    """ Content-addressed store of solved runs. A run is keyed by the hash
+    of its model and solver and keeps the solution vectors, duals, solver
+    statistics and KPIs; the model alone keeps its MPS file, so the same
+    model under another solver is not serialized again. Entries beyond the
+    disk budget are evicted, least recently used first """
+
+    def __init__(self, directory=CACHE, budget=BUDGET):
+        self.directory = directory
+        self.budget = budget
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key, name=''):
+        return os.path.join(self.directory, key, name)
+
+    def mps(self, key):
+        """Where the MPS file of a model lives; a file-based solver writes it there"""
+
+        self.touch(key)
+        return self.path(key, 'model.mps')
+
+    def touch(self, key):
+        if os.path.isdir(self.path(key)):
+            os.utime(self.path(key))
+
+    def get(self, key):
+        """The stored run as a matrix.Solution, None on a miss"""
+
+        try:
+            with open(self.path(key, 'meta.json')) as f:
+                meta = json.load(f)
+            with np.load(self.path(key, 'solution.npz')) as stored:
+                arrays = dict(stored)
+        except (OSError, ValueError):
+            return None
+
+        self.touch(key)
+        values = {name[4:]: value[()] if value.ndim == 0 else value
+                  for name, value in arrays.items() if name.startswith('col:')}
+        duals = {name[5:]: value for name, value in arrays.items() if name.startswith('dual:')}
+        solution = matrix.Solution(values, meta['status'], meta['objective'], duals)
+        solution.stats = meta['stats']
+        solution.kpis = meta.get('kpis')
+        return solution
+
+    def put(self, key, model, status, objective, stats=None, inputs=None):
+        """Stores a solved run, swapped in whole like common.Data does"""
+
+        arrays = {'col:' + name: value for name, value in vectors(model).items()}
+        if isinstance(model, matrix.Solution):
+            arrays.update({'dual:' + name: value for name, value in model.duals.items()})
+
+        tmp = tempfile.mkdtemp(dir=self.directory)
+        np.savez(os.path.join(tmp, 'solution.npz'), **arrays)
+        with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+            json.dump({'status': status, 'objective': objective, 'stats': stats or {}, 'stored': time.time(),
+                       'inputs': inputs}, f, default=float)
+
+        shutil.rmtree(self.path(key), ignore_errors=True)
+        try:
+            os.rename(tmp, self.path(key))
+        except OSError:
+            shutil.rmtree(tmp, ignore_errors=True)
+        self.evict()
+
+    def nearest(self, inputs):
+        """ The stored run of the same model shape whose inputs differ least,
+        summing relative differences, as a matrix.Solution; None if none """
+
+        best, distance = None, np.inf
+        for key in os.listdir(self.directory):
+            try:
+                with open(self.path(key, 'meta.json')) as f:
+                    other = json.load(f).get('inputs')
+            except (OSError, ValueError):
+                continue
+            if not other or any(other[name] != inputs[name] for name in ('hours', 'battery', 'hydrogen')):
+                continue
+            d = sum(abs(value - other['values'].get(name, np.inf)) / max(abs(value), 1e-12)
+                    for name, value in inputs['values'].items())
+            if d < distance:
+                best, distance = key, d
+        return None if best is None else self.get(best)
+
+    def update(self, key, **fields):
+        """Adds fields, the KPIs of a run, to its stored metadata"""
+
+        filename = self.path(key, 'meta.json')
+        try:
+            with open(filename) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return
+        meta.update(fields)
+        fd, tmp = tempfile.mkstemp(dir=self.path(key))
+        with os.fdopen(fd, 'w') as f:
+            json.dump(meta, f, default=float)
+        os.replace(tmp, filename)
+
+    def evict(self):
+        """Removes the least recently used entries until the cache fits"""
+
+        entries = []
+        for key in os.listdir(self.directory):
+            path = self.path(key)
+            if not os.path.isdir(path):
+                continue
+            size = sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+            entries.append((os.path.getmtime(path), size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.budget:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
@@ -0,0 +1,226 @@
+import argparse, copy
+import numpy as np
+import scipy.sparse as sp
+import scipy.sparse.linalg
+
+import matrix
+import optimize
+from benders import COUNTS
+
+try:
+    import highspy
+except ImportError:
+    highspy = None
+
+# price parameters, the column block whose hourly cost each one is, and its sign
+PRICES = {'gridPrice': ('Pgrid', 1.0), 'batterylcoe': ('dischargeP', 1.0), 'fcprice': ('P_fcell', 1.0),
+          'h2price': ('M_electrolyzer', -1.0)}
+# prices optimize.levelized leaves out, fuel cell output is not in the LCOE
+# so it has no LCOE slope
+UNLEVELIZED = {'fcprice'}
+# capacities given a shadow value, with the unit one more of them adds
+CAPACITIES = {'battery': 'kWh of battery', 'storageCap': 'unit of hydrogen storage per system',
+              'gridpower': 'kW of grid connection'}
+# relative size below which a reduced cost or slack change counts as zero
+TOLERANCE = 1e-9
+
+
+class Basis():
+    """ The optimal basis of a LinearProgram that HiGHS solved, factorized
+    once. Row activities count as variables r = A x bounded by the row
+    bounds, so the basis is made of columns of [A -I]. Reduced costs, and
+    how far costs or bounds may move along a direction before the basis
+    changes, each take one solve with the factors """
+
+    def __init__(self, lp):
+        h = lp.highs
+        if h is None or highspy is None:
+            raise ValueError("Sensitivity needs the LP solved in memory by HiGHS")
+        basis = h.getBasis()
+        if not basis.valid:
+            raise ValueError("HiGHS returned no basis for the dispatch LP")
+
+        A, rlb, rub = lp.matrix()
+        xlb, xub, _ = lp.bounds()
+        m = A.shape[0]
+        self.n = lp.ncols
+        self.M = sp.hstack([A, -sp.identity(m)], format='csc')
+        self.lb = np.concatenate([xlb, rlb])
+        self.ub = np.concatenate([xub, rub])
+        self.c = np.concatenate([lp.objective(), np.zeros(m)])
+        solution = h.getSolution()
+        self.x = np.concatenate([solution.col_value, solution.row_value])
+
+        status = np.array([int(s) for s in list(basis.col_status) + list(basis.row_status)])
+        self.basic = status == int(highspy.HighsBasisStatus.kBasic)
+        self.lower = status == int(highspy.HighsBasisStatus.kLower)
+        self.upper = status == int(highspy.HighsBasisStatus.kUpper)
+        self.lu = scipy.sparse.linalg.splu(self.M[:, self.basic].tocsc())
+        self.d = self.reduced(self.c)
+
+    def reduced(self, c):
+        """Reduced costs of every variable for costs c"""
+        y = self.lu.solve(c[self.basic], trans='T')
+        return c - self.M.T @ y
+
+    def cost_range(self, dc):
+        """ Steps t for which costs c + t dc keep the basis optimal, and the
+        objective change per unit step within them """
+
+        dd = self.reduced(dc)
+        # nonbasic variables that may move stay priced out: d >= 0 at the
+        # lower bound, d <= 0 at the upper, d = 0 if free
+        free = ~(self.basic | self.lower | self.upper)
+        sign = np.where(self.upper, -1.0, 1.0)
+        movable = ~self.basic & (self.lb < self.ub)
+        a = np.maximum(sign * self.d, 0)[movable & ~free]
+        b = (sign * dd)[movable & ~free]
+        low, high = self._ratio(a, b)
+        if np.any(np.abs(dd[movable & free]) > TOLERANCE * max(np.abs(dd).max(), 1.0)):
+            low, high = 0.0, 0.0
+        return low, high, float(dc[:self.n] @ self.x[:self.n])
+
+    def bound_range(self, dlb, dub):
+        """ Steps t for which bounds lb + t dlb, ub + t dub keep the basis
+        optimal, and the objective change per unit step within them: the
+        shadow value of whatever moves the bounds """
+
+        dx = np.where(self.lower, dlb, np.where(self.upper, dub, 0.0))
+        dx[self.basic] = -self.lu.solve(self.M[:, ~self.basic] @ dx[~self.basic])
+        # basic variables stay within their moving bounds
+        basic = self.basic
+        below = basic & np.isfinite(self.lb)
+        above = basic & np.isfinite(self.ub)
+        a = np.concatenate([np.maximum(self.x - self.lb, 0)[below], np.maximum(self.ub - self.x, 0)[above]])
+        b = np.concatenate([(dx - dlb)[below], (dub - dx)[above]])
+        low, high = self._ratio(a, b)
+        return low, high, float(self.c @ dx)
+
+    @staticmethod
+    def _ratio(a, b):
+        """The steps t around zero keeping every a + t b >= 0"""
+        tol = TOLERANCE * max(np.abs(b).max(initial=0), 1.0)
+        up, down = b < -tol, b > tol
+        high = np.min(a[up] / -b[up], initial=np.inf)
+        low = -np.min(a[down] / b[down], initial=np.inf)
+        return low, high
+
+
+def dispatch(args, params, data, counts, battery=None, n_h2sys=100):
+    """The dispatch LP of fixed unit counts; battery replaces the default one"""
+
+    smr, wind, solar, prices, default, hydrogen = optimize.setup(args, params)
+    demand_hourly, wind_p, solar_p = data
+    return matrix.build(args, demand_hourly, np.asarray(wind_p) * wind.capacity, np.asarray(solar_p) * solar.capacity,
+                        smr, wind, solar, prices, battery or default, hydrogen, params['gridpower'], n_h2sys,
+                        counts=counts)
+
+
+def direction(lp, other):
+    """Bound changes of every variable of Basis(lp) that turn lp into other"""
+
+    A, rlb, rub = lp.matrix()
+    B, olb, oub = other.matrix()
+    if A.shape != B.shape or abs(A - B).max() > 0:
+        raise ValueError("The programs differ in more than their bounds")
+    xlb, xub, _ = lp.bounds()
+    ylb, yub, _ = other.bounds()
+    with np.errstate(invalid='ignore'):
+        dlb = np.nan_to_num(np.concatenate([ylb - xlb, olb - rlb]), nan=0.0)
+        dub = np.nan_to_num(np.concatenate([yub - xub, oub - rub]), nan=0.0)
+    return dlb, dub
+
+
+def require():
+    """Fails early without highspy: the basis and duals come from HiGHS alone"""
+    if highspy is None:
+        raise ValueError("Sensitivity needs highspy, the dispatch LP is analysed from the HiGHS basis")
+
+
+def analyse(args, params, data, counts, n_h2sys=100):
+    """ Sensitivity of a sizing to its prices and capacities, from the
+    dispatch LP of its unit counts solved once. Returns the hourly marginal
+    price of demand, the reduced cost of one more unit of each kind, and for
+    every price and capacity its objective slope with the range over which
+    the dispatch stays optimal; LCOE is linear within it """
+
+    require()
+    smr, wind, solar, prices, battery, hydrogen = optimize.setup(args, params)
+    demand_hourly, wind_p, solar_p = data
+    nt = len(demand_hourly)
+
+    lp = dispatch(args, params, data, counts, n_h2sys=n_h2sys)
+    solution = lp.solve(solver='highs')
+    if solution.status != 'optimal':
+        raise RuntimeError("Dispatch of counts %s: %s" % (list(counts), solution.status))
+    basis = Basis(lp)
+    solution.n_smr, solution.n_wind, solution.n_solar = counts
+
+    # one more kW of demand moves both balance rows, as generation does in benders
+    price = solution.duals['demandC'] - solution.duals['pexcesC']
+    output = [np.full(nt, float(smr.capacity)), wind.capacity * np.asarray(wind_p, dtype=float),
+              solar.capacity * np.asarray(solar_p, dtype=float)]
+    unit = [u.lcoe * g.sum() for u, g in zip((smr, wind, solar), output)]
+    reduced = {name: float(cost - price @ g) for name, cost, g in zip(COUNTS, unit, output)}
+
+    result = {'objective': solution.objective, 'price': price, 'reduced': reduced, 'prices': {}, 'capacities': {}}
+    lcoe = optimize.kpis(args, solution, params, data)['lcoe']
+    for name, (block, sign) in PRICES.items():
+        if block not in lp.columns:
+            continue
+        start, size = lp.columns[block]
+        dc = np.zeros(len(basis.c))
+        dc[start:start + size] = sign
+        low, high, slope = basis.cost_range(dc)
+        # the dispatch is fixed within the range, so LCOE moves linearly
+        step = None
+        if name not in UNLEVELIZED:
+            step = optimize.kpis(args, solution, dict(params, **{name: params[name] + 1}), data)['lcoe'] - lcoe
+        result['prices'][name] = {'value': params[name], 'low': params[name] + low, 'high': params[name] + high,
+                                  'slope': slope, 'lcoe_slope': step}
+
+    for name in CAPACITIES:
+        if name == 'battery':
+            if not args.battery:
+                continue
+            larger = copy.copy(battery)
+            larger.MAX_BATTERY_CAPACITY += 1
+            value = battery.MAX_BATTERY_CAPACITY
+            other = dispatch(args, params, data, counts, larger, n_h2sys)
+        else:
+            if name == 'storageCap' and not args.hydrogen:
+                continue
+            value = params[name]
+            other = dispatch(args, dict(params, **{name: value + 1}), data, counts, n_h2sys=n_h2sys)
+        low, high, slope = basis.bound_range(*direction(lp, other))
+        result['capacities'][name] = {'value': value, 'low': value + low, 'high': value + high, 'shadow': slope}
+
+    return result
+
+
+def write(result):
+    price = result['price']
+    print("Dispatch cost %14.2f" % result['objective'])
+    print("Marginal price of demand $/kWh: mean %7.4f  max %7.4f  min %7.4f  hours above the mean %d" % (
+        price.mean(), price.max(), price.min(), np.sum(price > price.mean())))
+    for name, value in result['reduced'].items():
+        print("Reduced cost of one more %-8s %16.2f" % (name[2:], value))
+    for name, entry in result['prices'].items():
+        lcoe = '%9s' % 'n/a' if entry['lcoe_slope'] is None else '%9.4g' % entry['lcoe_slope']
+        print("%-12s %8.4g  basis optimal in [%9.4g, %9.4g]  cost slope %14.2f  LCOE slope %s" % (
+            name, entry['value'], entry['low'], entry['high'], entry['slope'], lcoe))
+    for name, entry in result['capacities'].items():
+        print("%-12s %8.4g  basis optimal in [%9.4g, %9.4g]  shadow value %10.4g $ per %s" % (
+            name, entry['value'], entry['low'], entry['high'], entry['shadow'], CAPACITIES[name]))
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Prices and shadow values of a sizing, from its dispatch LP')
+    parser.add_argument("--hydrogen", action="store_true", help="Adds hydrogen system")
+    parser.add_argument("--battery", action="store_true", help="Adds batteries")
+    parser.add_argument("--units", type=int, nargs=3, required=True, metavar=("N_SMR", "N_WIND", "N_SOLAR"))
+    args = parser.parse_args()
+
+    params = optimize.DEFAULTS.copy()
+    write(analyse(args, params, optimize.load_data(), args.units))
@@ -0,0 +1,175 @@
+import argparse, time
+import numpy as np
+
+import matrix
+import optimize
+from benders import BOUNDS, COUNTS
+
+
+def simulate(args, params, data, candidates, n_h2sys=100):
+    """ Merit-order dispatch of many sizing candidates at once, without a
+    solver. Every hour the surplus charges the battery, then runs the
+    electrolyser on at most half of what is left (the ChaC row keeps it
+    below the excess power after itself), and the rest is curtailed; a
+    deficit is met by the battery, the fuel cell, the grid and is left
+    unserved, in that order. The storage state before the first hour is
+    pinned, as in the model, so every dispatch is one the MILP could take.
+    candidates maps n_smr, n_wind and n_solar to equal length arrays; the
+    result holds the optimize.kpis values of every candidate, the unserved
+    energy and the dispatch cost, the objective less the generation cost """
+
+    smr, wind, solar, prices, battery, hydrogen = optimize.setup(args, params)
+    demand_hourly, wind_p, solar_p = data
+    demand = np.asarray(demand_hourly, dtype=float)
+    windP = np.asarray(wind_p, dtype=float) * wind.capacity
+    solarP = np.asarray(solar_p, dtype=float) * solar.capacity
+    n_smr, n_wind, n_solar = (np.asarray(candidates[name], dtype=float) for name in COUNTS)
+    # the grid only counts towards demand with storage, as in build_model
+    gridpower = params['gridpower'] if (args.battery or args.hydrogen) else 0.0
+
+    # constant per candidate, the rest moves with the hour
+    base = n_smr * smr.capacity
+    size = base.shape
+    discharged = np.zeros(size)
+    electrolysed = np.zeros(size)
+    fuelcell = np.zeros(size)
+    grid = np.zeros(size)
+    unserved = np.zeros(size)
+
+    if args.battery:
+        eff = battery.EFFICIENCY
+        limit = battery.MAX_BATTERY_POWER/2
+        capacity = battery.MAX_BATTERY_CAPACITY
+        soc = np.full(size, float(battery.INITIAL_CAPACITY))
+    if args.hydrogen:
+        tank = n_h2sys * hydrogen.TANK_VOLUME
+        storeCap = n_h2sys * hydrogen.MAX_STORAGE_CAPACITY
+        # SOP -> deliverable fuel cell power, electric power -> SOP change
+        sop_power = hydrogen.gen(tank / (hydrogen.R_H2 * hydrogen.TEMP))
+        sop_rate = (hydrogen.R_H2 * hydrogen.TEMP / tank) / hydrogen.LHV
+        rise, fall = sop_rate * hydrogen.eff_SOEC, sop_rate / hydrogen.eff_fcell
+        sop = np.full(size, storeCap/2)
+
+    for t in range(len(demand)):
+        net = base + windP[t] * n_wind + solarP[t] * n_solar - demand[t]
+        surplus = np.maximum(net, 0)
+        deficit = np.maximum(-net, 0)
+        # the first hour moves no state, its limits are on the pinned one
+        first = t == 0
+
+        # limits on the state after the hour, as in Battery/Hydrogen.constraints
+        if args.battery:
+            if first:
+                charge = np.minimum(surplus, min(limit, capacity - battery.INITIAL_CAPACITY))
+                discharge = np.minimum(deficit, min(limit, eff * battery.INITIAL_CAPACITY))
+            else:
+                charge = np.minimum(surplus, np.minimum(limit, (capacity - soc) / (1 + eff)))
+                discharge = np.minimum(deficit, np.minimum(limit, np.maximum(0,
+                    np.minimum(eff * (soc - capacity/2), eff * soc / 2))))
+                soc += eff * charge - discharge / eff
+            surplus -= charge
+            deficit -= discharge
+            discharged += discharge
+
+        if args.hydrogen:
+            if first:
+                electrolyser = np.minimum(surplus / 2, min(n_h2sys * hydrogen.ELECTROLYSER_POWER,
+                    sop_power * (storeCap - storeCap/2)))
+                fcell = np.minimum(deficit, min(n_h2sys * hydrogen.FUEL_CELL_POWER, sop_power * storeCap/2))
+            else:
+                electrolyser = np.minimum(surplus / 2, np.minimum(n_h2sys * hydrogen.ELECTROLYSER_POWER,
+                    sop_power * (storeCap - sop) / (1 + sop_power * rise)))
+                fcell = np.minimum(deficit, np.minimum(n_h2sys * hydrogen.FUEL_CELL_POWER,
+                    sop_power * sop / (1 + sop_power * fall)))
+                sop += rise * electrolyser - fall * fcell
+            deficit -= fcell
+            electrolysed += electrolyser
+            fuelcell += fcell
+
+        drawn = np.minimum(deficit, gridpower)
+        grid += drawn
+        unserved += deficit - drawn
+
+    nt = len(demand)
+    nuclear_gen = base * nt
+    wind_gen = n_wind * windP.sum()
+    solar_gen = n_solar * solarP.sum()
+    m_electrolyzer = hydrogen.mdot(electrolysed) if args.hydrogen else np.zeros(size)
+    cost = prices['grid'] * grid + prices['battery'] * discharged + prices['fcell'] * fuelcell - prices['h2'] * m_electrolyzer
+
+    return dict(optimize.levelized(params, nuclear_gen, wind_gen, solar_gen, grid, discharged, m_electrolyzer),
+                n_smr=n_smr, n_wind=n_wind, n_solar=n_solar, hydrogen=m_electrolyzer, unserved=unserved, cost=cost)
+
+
+def check(args, params, data, counts, n_h2sys=100, solver='highs'):
+    """ Simulated against exact dispatch of fixed unit counts. A simulated
+    dispatch serving all demand is one the dispatch LP could take, so it
+    may cost no less, and its LCOE is held to the same. Returns the (name,
+    simulated, exact) values that beat the LP, empty when the screen is
+    sound; counts the LP cannot serve are checked only for the simulation
+    claiming to """
+
+    smr, wind, solar, prices, battery, hydrogen = optimize.setup(args, params)
+    demand_hourly, wind_p, solar_p = data
+    simulated = simulate(args, params, data, {name: [c] for name, c in zip(COUNTS, counts)}, n_h2sys)
+    simulated = {name: float(value[0]) for name, value in simulated.items()}
+    served = simulated['unserved'] < 1.0
+
+    lp = matrix.build(args, demand_hourly, np.asarray(wind_p) * wind.capacity, np.asarray(solar_p) * solar.capacity,
+                      smr, wind, solar, prices, battery, hydrogen, params['gridpower'], n_h2sys, counts=counts)
+    solution = lp.solve(solver=solver)
+    if solution.status != 'optimal':
+        return [('unserved', simulated['unserved'], None)] if served else []
+    if not served:
+        return []
+    solution.n_smr, solution.n_wind, solution.n_solar = counts
+    exact = dict(optimize.kpis(args, solution, params, data), cost=solution.objective)
+
+    # relative slack for the solver tolerance
+    tol = 1e-6
+    return [(name, simulated[name], float(exact[name])) for name in ('cost', 'lcoe', 'lcoe_woH2')
+            if simulated[name] < exact[name] - tol * max(abs(exact[name]), 1.0)]
+
+
+def sample(n, seed=0):
+    """Random integer unit counts within the bounds of the sizing model"""
+
+    rng = np.random.default_rng(seed)
+    return {name: rng.integers(BOUNDS[name][0], BOUNDS[name][1] + 1, n) for name in COUNTS}
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Screens random sizing candidates by simulated dispatch')
+    parser.add_argument("--hydrogen", action="store_true", help="Adds hydrogen system")
+    parser.add_argument("--battery", action="store_true", help="Adds batteries")
+    parser.add_argument("--samples", type=int, default=10000, help="Number of random candidates")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--top", type=int, default=10, help="Candidates to list, lowest LCOE first")
+    parser.add_argument("--check", action="store_true",
+                        help="Checks the listed candidates against their exact dispatch LP")
+    args = parser.parse_args()
+
+    params = optimize.DEFAULTS.copy()
+    data = optimize.load_data()
+
+    start = time.perf_counter()
+    result = simulate(args, params, data, sample(args.samples, args.seed))
+    elapsed = time.perf_counter() - start
+    print("%d candidates in %5.3f s (%d per second)" % (args.samples, elapsed, args.samples / elapsed))
+
+    served = np.flatnonzero(result['unserved'] < 1.0)
+    print("%d candidates serve all demand" % len(served))
+    print("%6s %6s %8s %10s %10s %14s" % ('n_smr', 'n_wind', 'n_solar', 'LCOE', 'w/o H2', 'hydrogen kg'))
+    for i in served[np.argsort(result['lcoe'][served])][:args.top]:
+        print("%6d %6d %8d %10.2f %10.2f %14.2f" % (result['n_smr'][i], result['n_wind'][i], result['n_solar'][i],
+            1e3 * result['lcoe'][i], 1e3 * result['lcoe_woH2'][i], result['hydrogen'][i]))
+
+    if args.check:
+        failed = 0
+        for i in served[np.argsort(result['lcoe'][served])][:args.top]:
+            counts = [int(result[name][i]) for name in COUNTS]
+            for name, simulated, exact in check(args, params, data, counts):
+                failed += 1
+                print("%s: simulated %s %s beats the exact dispatch %s" % (counts, name, simulated, exact))
+        print("Check: %s" % ("%d violations" % failed if failed else "no candidate beats its exact dispatch"))
@@ -0,0 +1,60 @@
+import pyomo.environ as pe
+
+from instrument import highs_stats
+
+# Backends tried in order when none is named
+PREFERRED = ['appsi_highs', 'glpk']
+# Short names accepted on the command line
+ALIASES = {'highs': 'appsi_highs'}
+
+
+def available(name):
+    try:
+        return bool(pe.SolverFactory(ALIASES.get(name, name)).available(exception_flag=False))
+    except Exception:
+        return False
+
+
+def preferred():
+    for name in PREFERRED:
+        if available(name):
+            return name
+    return PREFERRED[-1]
+
+
+class Solver():
+    """ Solves pyomo models, through a persistent in-memory backend (HiGHS
+    via appsi) when it is installed. That backend keeps its own copy of the
+    last model, so solving the same model again after changing mutable
+    Params only pushes the changed coefficients. GLPK and the other shell
+    solvers write and parse files on every solve """
+
+    def __init__(self, name=None):
+        self.name = ALIASES.get(name, name) or preferred()
+        self.solver = pe.SolverFactory(self.name)
+        self.persistent = self.name.startswith('appsi_')
+
+    def solve(self, model, tee=False, warmstart=False):
+        """With warmstart the current variable values are handed to solvers
+        that take a MIP start; GLPK does not and ignores them"""
+
+        if warmstart and (self.persistent or getattr(self.solver, 'warm_start_capable', lambda: False)()):
+            return self.solver.solve(model, tee=tee, warmstart=True)
+        return self.solver.solve(model, tee=tee)
+
+    def stats(self, results):
+        """Nodes, iterations and time of the last solve, as far as the
+        backend reports them"""
+
+        highs = getattr(self.solver, '_solver_model', None)
+        if self.persistent and highs is not None:
+            return highs_stats(highs)
+
+        stats = {'solver': self.name, 'status': str(results.solver.termination_condition)}
+        for key, value in [('time', lambda: results.solver.time),
+                           ('nodes', lambda: results.solver.statistics.branch_and_bound.number_of_created_subproblems)]:
+            try:
+                stats[key] = float(value())
+            except (AttributeError, TypeError, ValueError):
+                pass
+        return stats
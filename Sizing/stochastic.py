@@ -0,0 +1,178 @@
+import glob, time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+import matrix
+from benders import BOUNDS, COUNTS, PENALTY
+from common import Data
+
+
+def scenarios(source, data):
+    """ Weather and demand years to size against, as (demand_hourly,
+    wind_p, solar_p) like optimize.load_data. source is either an
+    (n, hours, [wind, solar, demand]) .npy from DataGen/DATA/scenarios.py
+    or a glob of RPGss workbooks, whose years all take the demand of data.
+    Every scenario is cut to the hours of data, leap days are dropped """
+
+    demand_hourly = np.asarray(data[0], dtype=float)
+    nt = len(demand_hourly)
+    if source.endswith('.npy'):
+        years = np.load(source, mmap_mode='r')
+        return [(np.array(year[:nt, 2]), np.array(year[:nt, 0]), np.array(year[:nt, 1])) for year in years]
+
+    result = []
+    for filename in sorted(glob.glob(source)):
+        series = {}
+        for sheet in ['wind', 'solar']:
+            columns = Data(filename, sheet).columns()
+            stamps, values = columns[list(columns)[0]], columns['electricity']
+            series[sheet] = np.asarray(values[np.char.find(stamps.astype(str), '-02-29') < 0], dtype=float)
+        result.append((demand_hourly, series['wind'][:nt], series['solar'][:nt]))
+    if not result:
+        raise ValueError("No scenarios in %s" % source)
+    return result
+
+
+# factor of the hedging step on slow progress
+GROWTH = 2.0
+
+# per worker: the plant and the scenarios
+_setup = None
+
+
+def _init(setup):
+    global _setup
+    _setup = setup
+
+
+def _solve(s, weights=None, consensus=None, rho=None, counts=None):
+    """ Scenario s: the sizing MILP with the hedging terms weights.x and
+    rho.|x - consensus| added, or with counts the dispatch LP of fixed
+    counts. Returns the counts and their cost in the scenario, without
+    the hedging terms """
+
+    args, cases, smr, wind, solar, prices, battery, hydrogen, gridpower = _setup
+    demand, wind_p, solar_p = cases[s]
+    lp = matrix.build(args, demand, wind_p * wind.capacity, solar_p * solar.capacity, smr, wind, solar, prices,
+        battery, hydrogen, gridpower, counts=counts, shortfall=PENALTY)
+
+    if counts is None and weights is not None:
+        for name, w, x, r in zip(COUNTS, weights, consensus, rho):
+            lp.cost(name, w)
+            # linear proximal term, keeps the subproblem a MILP
+            lp.var(name + '_up', scalar=True, lb=0)
+            lp.var(name + '_down', scalar=True, lb=0)
+            lp.cost(name + '_up', r)
+            lp.cost(name + '_down', r)
+            lp.add(name + '_prox', [(name, 1), (name + '_up', -1), (name + '_down', 1)], lb=x, ub=x, nrows=1)
+
+    solution = lp.solve(solver=args.solver)
+    if solution.status != 'optimal':
+        raise RuntimeError("Scenario %d%s: %s" % (s, '' if counts is None else ' counts %s' % list(counts),
+                                                  solution.status))
+
+    if counts is None:
+        counts = np.array([round(getattr(solution, name)) for name in COUNTS], dtype=float)
+        cost = solution.objective
+        if weights is not None:
+            cost -= weights @ counts + sum(r * (getattr(solution, name + '_up') + getattr(solution, name + '_down'))
+                                           for name, r in zip(COUNTS, rho))
+    else:
+        # dispatch only: the generation cost of the fixed counts is not in the LP
+        counts = np.asarray(counts, dtype=float)
+        cost = solution.objective + counts @ np.array([smr.lcoe * smr.capacity * len(demand),
+            wind.lcoe * wind.capacity * wind_p.sum(), solar.lcoe * solar.capacity * solar_p.sum()])
+
+    return counts, cost
+
+
+def hedge(args, cases, smr, wind, solar, prices, battery=None, hydrogen=None, gridpower=40000, probabilities=None,
+          rho=0.1, workers=None, iterations=50, tol=1e-3, candidates=5):
+    """ Two-stage stochastic sizing by progressive hedging. The unit counts
+    are the first stage, the dispatch of every scenario the recourse. Each
+    iteration solves all scenario MILPs in parallel, each pulled towards
+    the probability weighted consensus by its hedging weights and an L1
+    proximal term. Their step starts at rho times the unit's generation
+    cost over the spread of the first scenario choices, which is also its
+    floor, and only grows: by GROWTH whenever the disagreement falls by
+    less than a tenth, so swinging choices are pulled in ever harder rather
+    than freezing. Stops when the mean distance of the scenario counts from
+    the consensus, priced at the unit costs, is within tol of the expected
+    cost. The final counts are the best of up to candidates choices by
+    expected cost over all scenarios, with the dispatch LPs of every
+    scenario; returns them, that cost, the per scenario costs and whether
+    the scenarios agreed """
+
+    S = len(cases)
+    p = np.full(S, 1.0 / S) if probabilities is None else np.asarray(probabilities, dtype=float)
+
+    # generation cost per unit, the scale of each count
+    unit = np.array([smr.lcoe * smr.capacity * len(cases[0][0]),
+                     wind.lcoe * wind.capacity * np.mean([case[1].sum() for case in cases]),
+                     solar.lcoe * solar.capacity * np.mean([case[2].sum() for case in cases])])
+    low = np.array([BOUNDS[name][0] for name in COUNTS], dtype=float)
+    high = np.array([BOUNDS[name][1] for name in COUNTS], dtype=float)
+
+    setup = (args, cases, smr, wind, solar, prices, battery, hydrogen, gridpower)
+    print("Progressive hedging: %d scenarios, %d workers" % (S, workers or 0))
+    print("%5s %14s %28s %12s %9s" % ('iter', 'expected cost', 'consensus (smr wind solar)', 'disagreement',
+                                      'time'))
+    begin = time.perf_counter()
+    with ProcessPoolExecutor(workers, initializer=_init, initargs=(setup,)) as pool:
+        weights = np.zeros((S, len(COUNTS)))
+        previous = np.inf
+        results = [pool.submit(_solve, s) for s in range(S)]
+        for it in range(iterations + 1):
+            results = [future.result() for future in results]
+            x = np.array([counts for counts, cost in results])
+            cost = np.array([cost for counts, cost in results])
+            if it == 0:
+                # each scenario sized on its own: the wait-and-see bound
+                lower = p @ cost
+                first = x
+                # unit cost over the spread of the scenario choices, so no
+                # count overshoots the consensus by more than its spread
+                step = rho * unit / np.maximum(x.max(axis=0) - x.min(axis=0), 1)
+            consensus = p @ x
+            # disagreement priced at the unit costs, relative to the total
+            spread = p @ np.abs(x - consensus) * unit / abs(p @ cost)
+
+            print("%5d %14.2f %9.2f %6.2f %11.1f %12.6f %8.2f s" % (it, p @ cost, *consensus, spread.sum(),
+                                                                   time.perf_counter() - begin))
+            converged = spread.sum() <= tol
+            if converged or it == iterations:
+                break
+            if spread.sum() > 0.9 * previous:
+                # slow progress or a swing past the consensus: the proximal
+                # term is too weak to hold the choices together
+                step = GROWTH * step
+            previous = spread.sum()
+
+            weights += step * (x - consensus)
+            results = [pool.submit(_solve, s, weights[s], consensus, step) for s in range(S)]
+
+        # candidate counts: the rounded consensus, then the scenario choices
+        # of the last and the first iteration, the most common first; an
+        # average of integer choices may suit none of the scenarios
+        unique = [np.clip(np.round(consensus), low, high)]
+        for choices in (x, first):
+            choices, counts = np.unique(choices, axis=0, return_counts=True)
+            for c in choices[np.argsort(-counts, kind='stable')]:
+                if len(unique) < candidates and not any(np.array_equal(c, u) for u in unique):
+                    unique.append(c)
+
+        futures = {(i, s): pool.submit(_solve, s, counts=c) for i, c in enumerate(unique) for s in range(S)}
+        costs = np.array([[futures[i, s].result()[1] for s in range(S)] for i in range(len(unique))])
+        expected = costs @ p
+
+    if not converged:
+        print("Progressive hedging did not converge in %d iterations: disagreement %g above %g, "
+              "counts are the best candidate by expected cost" % (iterations, spread.sum(), tol))
+    best = int(np.argmin(expected))
+    for c, e in zip(unique, expected):
+        print("counts %s expected cost %14.2f%s" % (c.astype(int).tolist(), e, ' *' if e == expected[best] else ''))
+    upper = expected[best]
+    print("Wait-and-see bound %14.2f, value of perfect information %6.3f%%" % (lower,
+                                                                           100 * (upper - lower) / abs(upper)))
+
+    return unique[best].astype(int), upper, costs[best], converged
@@ -0,0 +1,145 @@
+import argparse
+import csv
+import hashlib
+import itertools
+import json
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+import optimize
+import runcache
+from solvers import Solver
+
+
+KPIS = ['n_smr', 'n_wind', 'n_solar', 'lcoe', 'lcoe_woH2', 'hydrogen', 'status', 'time']
+
+
+def scenarios(spec):
+    """ Expands a sweep spec into full parameter dicts over optimize.DEFAULTS.
+    'grid' takes the product of the listed values of every parameter,
+    'lhs' draws 'samples' Latin-hypercube points between [low, high] """
+
+    space = spec['parameters']
+    unknown = set(space) - set(optimize.DEFAULTS)
+    if unknown:
+        raise KeyError("Unknown sweep parameters: %s" % ', '.join(sorted(unknown)))
+
+    names = list(space)
+    mode = spec.get('mode', 'grid')
+    if mode == 'grid':
+        points = [dict(zip(names, values)) for values in itertools.product(*space.values())]
+    elif mode == 'lhs':
+        n = spec['samples']
+        rng = np.random.default_rng(spec.get('seed', 0))
+        # one sample in each of the n strata of every parameter, strata paired at random
+        strata = rng.permuted(np.tile(np.arange(n), (len(names), 1)), axis=1).T
+        unit = (strata + rng.random((n, len(names)))) / n
+        low = np.array([space[name][0] for name in names], dtype=float)
+        high = np.array([space[name][1] for name in names], dtype=float)
+        points = [dict(zip(names, row)) for row in (low + unit * (high - low)).tolist()]
+    else:
+        raise ValueError("Unknown sweep mode: %s" % mode)
+
+    return [dict(optimize.DEFAULTS, **point) for point in points]
+
+
+def key(params, args):
+    """Stable scenario id of the parameters and the model flags, used to
+    skip finished scenarios on resume"""
+    flags = {name: value for name, value in vars(args).items() if name not in runcache.IGNORED}
+    return hashlib.sha1(json.dumps([params, flags], sort_keys=True, default=str).encode()).hexdigest()[:12]
+
+
+def flags(spec):
+    """Command line flags of optimize.py given in the spec"""
+    args = optimize.parser().parse_args([])
+    for name, value in spec.get('flags', {}).items():
+        setattr(args, name, value)
+    return args
+
+
+# per worker: the input data, loaded once by the sweep, and the last
+# rule-based model with its solver, updated in place between scenarios
+# when possible
+_data = None
+_session = {}
+
+
+def _init(data):
+    global _data
+    _data = data
+
+
+def _run(args, params, reuse):
+    start = time.perf_counter()
+    try:
+        if reuse:
+            solver = _session.setdefault('solver', Solver(args.solver))
+            model, results = optimize.solve(args, params, _data, model=_session.get('model'), solver=solver)
+            _session['model'] = model
+        else:
+            model, results = optimize.solve(args, params, _data)
+        row = optimize.kpis(args, model, params, _data)
+        row['status'] = optimize.status(results)
+    except Exception:
+        row = {'status': 'error: ' + traceback.format_exc().strip().splitlines()[-1]}
+    row['time'] = time.perf_counter() - start
+
+    return row
+
+
+def sweep(spec, output, workers=None):
+    """Runs every scenario of the spec not yet in output, appending one row
+    per finished scenario so an interrupted sweep resumes where it stopped.
+    Scenarios that ended in an error are run again"""
+
+    args = flags(spec)
+    points = scenarios(spec)
+    names = list(spec['parameters'])
+
+    done = set()
+    if os.path.exists(output):
+        with open(output, newline='') as f:
+            done = {row['scenario'] for row in csv.DictReader(f) if not row['status'].startswith('error')}
+    pending = [params for params in points if key(params, args) not in done]
+    print("Sweep: %d scenarios, %d done, %d to run" % (len(points), len(points) - len(pending), len(pending)))
+
+    # rule-based models are kept and updated when only mutable params vary
+    reuse = not (args.matrix or args.representative_days or args.max_error) and set(names) <= optimize.MUTABLE
+
+    # loaded here once, not by every worker at the same time
+    data = [np.asarray(x, dtype=float) for x in optimize.load_data()]
+
+    fieldnames = ['scenario'] + names + KPIS
+    new = not os.path.exists(output) or os.path.getsize(output) == 0
+    with open(output, 'a', newline='') as f, ProcessPoolExecutor(workers, initializer=_init,
+                                                      initargs=(data,)) as pool:
+        writer = csv.DictWriter(f, fieldnames=fieldnames, extrasaction='ignore')
+        if new:
+            writer.writeheader()
+        futures = {pool.submit(_run, args, params, reuse): params for params in pending}
+        for future in as_completed(futures):
+            params = futures[future]
+            row = future.result()
+            row.update({name: params[name] for name in names}, scenario=key(params, args))
+            writer.writerow(row)
+            f.flush()
+            print("%s %s" % (row['scenario'], row['status']))
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Scenario sweep over the sizing parameters')
+    parser.add_argument("config", help="JSON sweep spec")
+    parser.add_argument("--output", default='sweep.csv', help="Results table, appended to on resume")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: all cores)")
+    args = parser.parse_args()
+
+    with open(args.config) as f:
+        spec = json.load(f)
+
+    sweep(spec, args.output, args.workers)